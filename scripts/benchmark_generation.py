@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Throughput of chapter generation against the local stub LLM server.
+
+Generates chapters for several independent novels (one StoryGraph and
+ChapterGenerator each) first with the blocking generate_chapter() one request
+at a time, then with agenerate_chapter() running every novel concurrently under
+the shared semaphore. The stub answers after a fixed latency and fails a share
+of requests with 429/5xx, so both runs also exercise the retries. --rpm and
+--tpm configure the shared LLMClient's token buckets; the time spent waiting
+on them is reported as "throttled". With
+--stream the chapters are streamed into their files and the mean time to first
+token and tokens/s are reported as well. With --cache the sync run records
+its completions in a fresh CompletionCache and is then repeated in replay mode.
+--telemetry records every call in memory and prints the run's p50/p95
+latency, tokens and estimated cost at the end.
+--best-of N requests N candidates per chapter in one call and keeps the best.
+With --planned one novel is generated from the scenes.yaml plans instead, one
+chapter after another and then with draft_novel() in parallel waves (per part,
+or per --window chapters) followed by its continuity pass; --scenes adds a run
+that writes the scenes of every chapter concurrently as well.
+
+Usage:
+    python -m scripts.benchmark_generation [--novels 16] [--chapters 2] [--latency 0.5]
+        [--error-rate 0.1] [--concurrency 8] [--stream --token-interval 0.002] [--cache]
+        [--rpm 600] [--tpm 2000000] [--best-of 3] [--telemetry]
+    python -m scripts.benchmark_generation --planned [--window 4] [--concurrency 8] [--scenes]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the project root to sys.path so 'src' is importable
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from scripts.stub_llm_server import start_stub_server
+from src.ai.generator import ChapterGenerator, CompletionCache
+from src.ai.llm_client import configure_llm_client
+from src.ai.novel_planner import chapter_plans, draft_novel, drafting_waves
+from src.ai.seed_prompt_loader import load_scenes_config
+from src.ai.telemetry import Telemetry, configure_telemetry
+from src.graph.graph_manager import StoryGraph
+
+
+def make_generators(count, directory, **options):
+    generators = []
+    for novel in range(count):
+        output_dir = os.path.join(directory, f"novel_{novel}")
+        os.makedirs(output_dir, exist_ok=True)
+        generators.append(ChapterGenerator(StoryGraph(), output_dir=output_dir, **options))
+    return generators
+
+
+def run_sync(generators, chapters):
+    for novel, generator in enumerate(generators):
+        for chapter in range(1, chapters + 1):
+            # The novel number keeps prompts, and so cache keys, distinct across novels
+            generator.generate_chapter(f"Continue the story - Chapter {chapter} ({novel})")
+
+
+async def run_async(generators, chapters):
+    async def novel(number, generator):
+        # Chapters of one novel depend on each other; novels are independent
+        for chapter in range(1, chapters + 1):
+            await generator.agenerate_chapter(f"Continue the story - Chapter {chapter} ({number})")
+
+    await asyncio.gather(*(novel(number, generator) for number, generator in enumerate(generators)))
+
+
+def benchmark_planned(args, server, directory):
+    plans = chapter_plans(load_scenes_config())
+    window = None if args.window == "part" else int(args.window)
+    print(f"{len(plans)} planned chapters in {len(drafting_waves(plans, window))} waves, "
+          f"stub latency {args.latency}s, error rate {args.error_rate:.0%}")
+    print(f"{'mode':>32} {'time (s)':>9} {'requests':>9} {'failures':>9} {'peak':>5} {'words':>7} {'words/s':>8}")
+
+    def report(name, elapsed, before, generator):
+        counts = server.counts
+        words = 0
+        for entry in os.scandir(generator.output_dir):
+            with open(entry.path, encoding="utf-8") as handle:
+                words += len(handle.read().split())
+        print(f"{name:>32} {elapsed:>9.2f} {counts['requests'] - before['requests']:>9} "
+              f"{counts['errors'] - before['errors']:>9} {counts['max_in_flight']:>5} {words:>7} "
+              f"{words / elapsed:>8.0f}")
+
+    if not args.skip_sync:
+        generator, = make_generators(1, os.path.join(directory, "sequential"))
+        before = dict(server.counts)
+        start = time.perf_counter()
+        for plan in plans:
+            generator.generate_chapter(plan["outline"], instructions=plan["brief"])
+        report("sequential", time.perf_counter() - start, before, generator)
+
+    runs = [(False, False), (False, True)] + ([(True, False)] if args.scenes else [])
+    for scenes, continuity in runs:
+        server.counts["max_in_flight"] = 0
+        generator, = make_generators(1, os.path.join(directory, f"planned_{scenes}_{continuity}"))
+        before = dict(server.counts)
+        start = time.perf_counter()
+        asyncio.run(draft_novel(generator, plans, window=window, workers=args.concurrency,
+                                continuity=continuity, scenes=scenes))
+        name = (f"draft_novel x{args.concurrency}" + (" scenes" if scenes else "")
+                + (" + continuity" if continuity else ""))
+        report(name, time.perf_counter() - start, before, generator)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async chapter generation on a stub server")
+    parser.add_argument("--novels", type=int, default=16)
+    parser.add_argument("--chapters", type=int, default=2, help="Chapters per novel")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub response latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="Share of requests failing with 429/5xx")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight for the async run")
+    parser.add_argument("--skip-sync", action="store_true", help="Only time the async run")
+    parser.add_argument("--stream", action="store_true", help="Stream completions into the chapter files")
+    parser.add_argument("--token-interval", type=float, default=0.002,
+                        help="Stub seconds per generated word (with --stream or --planned)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Record the sync run in a completion cache and time a replay of it")
+    parser.add_argument("--rpm", type=float, default=None, help="Client-side requests per minute limit")
+    parser.add_argument("--tpm", type=float, default=None, help="Client-side tokens per minute limit")
+    parser.add_argument("--best-of", type=int, default=None,
+                        help="Candidates per chapter, requested with n in one call")
+    parser.add_argument("--telemetry", action="store_true", help="Print the telemetry summary of all runs")
+    parser.add_argument("--planned", action="store_true",
+                        help="Generate one novel from the scenes.yaml plans, sequentially and in parallel waves")
+    parser.add_argument("--window", default="part", help="--planned: 'part' or chapters per wave")
+    parser.add_argument("--scenes", action="store_true", help="--planned: also time scene fan-out")
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency, error_rate=args.error_rate,
+                               token_interval=args.token_interval if args.stream or args.planned else 0.0)
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["USE_PLACEHOLDER_LLM"] = "false"
+    llm = configure_llm_client(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.concurrency)
+    telemetry = configure_telemetry(path=False) if args.telemetry else None
+    if args.planned:
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                benchmark_planned(args, server, directory)
+        finally:
+            server.shutdown()
+            if telemetry is not None:
+                print(Telemetry.format_summary(telemetry.summary()))
+        return
+    total = args.novels * args.chapters
+    print(f"{total} chapters ({args.novels} novels x {args.chapters}), stub latency {args.latency}s, "
+          f"error rate {args.error_rate:.0%}")
+    print(f"{'mode':>24} {'time (s)':>9} {'chapters/s':>11} {'requests':>9} {'failures':>9} {'peak':>5} "
+          f"{'throttled (s)':>13}" + (f" {'ttft (s)':>9} {'tokens/s':>9}" if args.stream else ""))
+
+    def report(name, elapsed, before, generators):
+        counts = server.counts
+        line = (f"{name:>24} {elapsed:>9.2f} {total / elapsed:>11.2f} "
+                f"{counts['requests'] - before['requests']:>9} {counts['errors'] - before['errors']:>9} "
+                f"{counts['max_in_flight']:>5} {llm.stats['throttled_seconds'] - before['throttled']:>13.1f}")
+        stats = [chapter for generator in generators for chapter in generator.stream_stats]
+        if stats:
+            ttft = sum(chapter["ttft"] for chapter in stats) / len(stats)
+            rate = sum(chapter["tokens_per_second"] for chapter in stats) / len(stats)
+            line += f" {ttft:>9.3f} {rate:>9.0f}"
+        print(line)
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            if not args.skip_sync or args.cache:
+                cache = CompletionCache(os.path.join(directory, "completions.sqlite")) if args.cache else None
+                runs = [("sync generate_chapter", "record" if args.cache else "bypass")]
+                if args.cache:
+                    runs.append(("sync replay", "replay"))
+                for name, mode in runs:
+                    generators = make_generators(args.novels, os.path.join(directory, mode), stream=args.stream,
+                                                 cache_mode=mode, completion_cache=cache, best_of=args.best_of)
+                    before = dict(server.counts, throttled=llm.stats["throttled_seconds"])
+                    start = time.perf_counter()
+                    run_sync(generators, args.chapters)
+                    report(name, time.perf_counter() - start, before, generators)
+
+            server.counts["max_in_flight"] = 0
+            generators = make_generators(args.novels, os.path.join(directory, "async"), stream=args.stream,
+                                         best_of=args.best_of)
+            before = dict(server.counts, throttled=llm.stats["throttled_seconds"])
+            start = time.perf_counter()
+            asyncio.run(run_async(generators, args.chapters))
+            report(f"agenerate_chapter x{args.concurrency}", time.perf_counter() - start, before, generators)
+    finally:
+        server.shutdown()
+        if telemetry is not None:
+            print(Telemetry.format_summary(telemetry.summary()))
+
+
+if __name__ == "__main__":
+    main()
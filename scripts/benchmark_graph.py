@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for StoryGraph.
+
+Compares indexed node lookups against the original linear scan over
+graph.nodes on synthetic graphs shaped like a long-running serial, and
+reports the memory footprint of the slot-based Node layout against the
+original dict-based one. The context benchmark replays the chapters in
+data/novel as a growing serial and reports prompt context size and build
+time per chapter for each retrieval mode. The traversal benchmark times CSR
+k-hop, shortest-path and personalized PageRank queries on random graphs.
+
+Usage:
+    python -m scripts.benchmark_graph [--sizes 1000 10000 50000] [--lookups 2000]
+    python -m scripts.benchmark_graph --memory [--memory-sizes 10000 100000 1000000]
+    python -m scripts.benchmark_graph --context [--chapters 5 20 50]
+    python -m scripts.benchmark_graph --traversal [--edges 100000 1000000 5000000]
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to sys.path so 'src' is importable
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.graph.graph_manager import StoryGraph
+from src.graph.node import Node
+from src.graph.traversal import GraphTraversal
+
+NODE_TYPES = ["scene", "character", "location", "object"]
+NOVEL_DIR = project_root / "data" / "novel"
+
+
+def build_synthetic_graph(size, seed=7):
+    """Build a graph with a realistic mix of scenes, characters and locations."""
+    rng = random.Random(seed)
+    graph = StoryGraph()
+    # Scenes dominate; a small cast and set of locations recur across them
+    cast = [f"character_{i}" for i in range(max(10, size // 200))]
+    places = [f"location_{i}" for i in range(max(5, size // 500))]
+    for i in range(size):
+        node_type = rng.choices(NODE_TYPES, weights=[80, 10, 7, 3])[0]
+        if node_type == "character":
+            name = rng.choice(cast)
+        elif node_type == "location":
+            name = rng.choice(places)
+        else:
+            name = f"{node_type}_{i}"
+        graph.add_node(node_type, name, f"Content for {name}")
+    return graph
+
+
+def linear_find_nodes(graph, node_type=None, name=None):
+    """The original find_nodes implementation, kept as the baseline."""
+    return [
+        n
+        for n in graph.nodes
+        if (node_type is None or n.node_type == node_type)
+        and (name is None or n.name == name)
+    ]
+
+
+def make_queries(graph, count, seed=11):
+    rng = random.Random(seed)
+    names = [n.name for n in graph.nodes]
+    queries = []
+    for _ in range(count):
+        kind = rng.randrange(3)
+        if kind == 0:
+            queries.append({"node_type": rng.choice(NODE_TYPES[1:])})
+        elif kind == 1:
+            queries.append({"name": rng.choice(names)})
+        else:
+            node = rng.choice(graph.nodes)
+            queries.append({"node_type": node.node_type, "name": node.name})
+    return queries
+
+
+def time_lookups(lookup, graph, queries):
+    start = time.perf_counter()
+    for query in queries:
+        lookup(graph, **query)
+    return time.perf_counter() - start
+
+
+def benchmark_find_nodes(sizes, lookups):
+    print(f"{'nodes':>10} {'linear (us)':>14} {'indexed (us)':>14} {'speedup':>10}")
+    for size in sizes:
+        graph = build_synthetic_graph(size)
+        queries = make_queries(graph, lookups)
+
+        # Sanity check: both paths must agree before we compare their speed
+        for query in queries[:50]:
+            assert linear_find_nodes(graph, **query) == graph.find_nodes(**query)
+
+        linear = time_lookups(linear_find_nodes, graph, queries)
+        indexed = time_lookups(StoryGraph.find_nodes, graph, queries)
+        per_linear = linear / len(queries) * 1e6
+        per_indexed = indexed / len(queries) * 1e6
+        print(f"{size:>10} {per_linear:>14.2f} {per_indexed:>14.2f} {linear / indexed:>9.1f}x")
+
+
+class DictNode:
+    """The original Node layout: a per-instance __dict__ and plain labels."""
+
+    def __init__(self, node_type, name, content):
+        self.node_type = node_type
+        self.name = name
+        self.content = content
+        self.edges = []
+
+    def add_edge(self, node, relation):
+        self.edges.append((node, relation))
+
+
+def build_dict_layout(size):
+    nodes = []
+    for i in range(size):
+        # Labels are built at runtime, as they would be when parsed from YAML or
+        # an LLM response, so they are distinct string objects per node
+        node = DictNode("".join(["sce", "ne"]), f"scene_{i}", None)
+        if nodes:
+            node.add_edge(nodes[i - 1], "".join(["foll", "ows"]))
+        nodes.append(node)
+    return nodes
+
+
+def build_slot_layout(size):
+    nodes = []
+    for i in range(size):
+        node = Node("".join(["sce", "ne"]), f"scene_{i}", None, node_id=i)
+        if nodes:
+            node.add_edge(nodes[i - 1], "".join(["foll", "ows"]))
+        nodes.append(node)
+    return nodes
+
+
+def measure_layout(builder, size):
+    tracemalloc.start()
+    nodes = builder(size)
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del nodes
+    return current
+
+
+def benchmark_memory(sizes):
+    print(f"{'nodes':>10} {'dict (MB)':>12} {'slots (MB)':>12} {'B/node dict':>12} "
+          f"{'B/node slots':>13} {'saved':>7}")
+    for size in sizes:
+        dict_bytes = measure_layout(build_dict_layout, size)
+        slot_bytes = measure_layout(build_slot_layout, size)
+        saved = 1 - slot_bytes / dict_bytes
+        print(f"{size:>10} {dict_bytes / 2**20:>12.1f} {slot_bytes / 2**20:>12.1f} "
+              f"{dict_bytes / size:>12.0f} {slot_bytes / size:>13.0f} {saved:>6.0%}")
+
+
+def build_serial_graph(chapters):
+    """Add `chapters` scene nodes by cycling through the generated chapters on disk."""
+    texts = [path.read_text(encoding="utf-8") for path in sorted(NOVEL_DIR.glob("chapter_*.md"))]
+    graph = StoryGraph()
+    for i in range(chapters):
+        graph.add_node("scene", f"Chapter {i + 1}", texts[i % len(texts)])
+    return graph
+
+
+def benchmark_context(chapter_counts, repeats=5):
+    print(f"{'chapters':>9} {'mode':>8} {'chars':>9} {'~tokens':>8} {'build (ms)':>11}")
+    outline = "Maria investigates the old lighthouse and the church bells beneath the sea"
+    for chapters in chapter_counts:
+        for mode in ("summary", "ranked"):
+            graph = build_serial_graph(chapters)
+            graph.configure_context(mode=mode)
+            # First call pays the one-off passage indexing; time the steady state
+            context = graph.get_relevant_context(outline)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                context = graph.get_relevant_context(outline)
+            elapsed = (time.perf_counter() - start) / repeats
+            print(f"{chapters:>9} {mode:>8} {len(context):>9} {len(context) // 4:>8} {elapsed * 1e3:>11.2f}")
+
+
+def build_random_traversal(edge_count, seed=3):
+    """Random graph with ~3 edges per node and a handful of relation types."""
+    rng = np.random.default_rng(seed)
+    node_count = max(10, edge_count // 3)
+    sources = rng.integers(0, node_count, edge_count)
+    targets = rng.integers(0, node_count, edge_count)
+    codes = rng.integers(0, 4, edge_count)
+    labels = ["appears_in", "located_at", "knows", "follows"]
+    return GraphTraversal(node_count, sources, targets, codes, labels)
+
+
+def time_query(query, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        query()
+    return (time.perf_counter() - start) / repeats * 1e3
+
+
+def benchmark_traversal(edge_counts, repeats=5):
+    print(f"{'edges':>10} {'freeze (ms)':>12} {'2-hop (ms)':>11} {'2-hop rel (ms)':>15} "
+          f"{'path (ms)':>10} {'ppr (ms)':>9} {'ppr 3-hop (ms)':>15}")
+    rng = np.random.default_rng(5)
+    for edge_count in edge_counts:
+        start = time.perf_counter()
+        traversal = build_random_traversal(edge_count)
+        freeze = (time.perf_counter() - start) * 1e3
+        seeds = rng.integers(0, traversal.node_count, 3)
+        target = int(rng.integers(0, traversal.node_count))
+        k_hop = time_query(lambda: traversal.k_hop(seeds, 2), repeats)
+        k_hop_rel = time_query(lambda: traversal.k_hop(seeds, 2, relations=["appears_in", "knows"]), repeats)
+        path = time_query(lambda: traversal.shortest_path(int(seeds[0]), target), repeats)
+        ppr = time_query(lambda: traversal.personalized_pagerank(seeds, max_iter=20, tol=1e-4), repeats)
+        ppr_local = time_query(lambda: traversal.personalized_pagerank(seeds, max_iter=20, tol=1e-4,
+                                                                       max_hops=3), repeats)
+        print(f"{edge_count:>10} {freeze:>12.1f} {k_hop:>11.2f} {k_hop_rel:>15.2f} {path:>10.2f} "
+              f"{ppr:>9.1f} {ppr_local:>15.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark StoryGraph operations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="Graph sizes (node counts) to benchmark")
+    parser.add_argument("--lookups", type=int, default=2000,
+                        help="Number of find_nodes calls per graph size")
+    parser.add_argument("--memory", action="store_true",
+                        help="Report tracemalloc memory use of dict vs slot node layouts")
+    parser.add_argument("--memory-sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Node counts for the memory report")
+    parser.add_argument("--context", action="store_true",
+                        help="Report context size and build time per chapter for each retrieval mode")
+    parser.add_argument("--chapters", type=int, nargs="+", default=[5, 20, 50],
+                        help="Chapter counts for the context benchmark")
+    parser.add_argument("--traversal", action="store_true",
+                        help="Time CSR k-hop, shortest-path and PageRank queries")
+    parser.add_argument("--edges", type=int, nargs="+", default=[100000, 1000000, 5000000],
+                        help="Edge counts for the traversal benchmark")
+    args = parser.parse_args()
+
+    if args.traversal:
+        print("CSR traversal on random graphs (undirected, ~3 edges per node)")
+        benchmark_traversal(args.edges)
+        return
+
+    if args.context:
+        print("get_relevant_context: summary of every node vs ranked and token-budgeted")
+        benchmark_context(args.chapters)
+        return
+
+    if args.memory:
+        print("Node memory: dict-based vs slot-based layout (one edge per node)")
+        benchmark_memory(args.memory_sizes)
+        return
+
+    print("find_nodes: linear scan vs secondary indexes")
+    benchmark_find_nodes(args.sizes, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
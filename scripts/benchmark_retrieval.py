@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for retrieval over the RAG index.
+
+The vector store benchmark writes random embeddings with both the llama-index
+JSON store (SimpleVectorStore, default__vector_store.json) and the
+memory-mapped NumpyVectorStore, then reports load time, file size and top-k
+query latency for each. The end-to-end benchmark indexes data/novel with the
+local hashing embedder (no network) and times a cold build, a rebuild served
+from the embedding cache, an incremental no-op update and warm ContextBuilder
+queries. The lexical benchmark times BM25 indexing and queries on chunks
+cut from data/novel and reports the size of the packed postings. The ANN
+benchmark compares IVF-flat search at several nprobe settings with exact
+search on clustered synthetic embeddings, reporting recall@k and latency.
+The batch benchmark compares a loop of single queries with one batched call,
+both on the vector store (matrix-vector vs matrix-matrix scoring) and through
+ContextBuilder.get_contexts on data/novel.
+
+Usage:
+    python -m scripts.benchmark_retrieval [--chunks 100 10000 1000000] [--dim 128]
+    python -m scripts.benchmark_retrieval --end-to-end [--repeats 50]
+    python -m scripts.benchmark_retrieval --lexical [--lexical-chunks 1000 5000 20000]
+    python -m scripts.benchmark_retrieval --ann [--ann-chunks 100000 1000000] [--nprobe 1 4 16 64]
+    python -m scripts.benchmark_retrieval --batch [--batch-chunks 10000 100000 1000000] [--batch-size 32]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to sys.path so 'src' is importable
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.simple import SimpleVectorStoreData
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from scripts.index_novel_documents import DATA_DIR, build_index, update_index
+from src.ai.context_builder import ContextBuilder
+from src.ai.embeddings import CachedEmbedding, EmbeddingCache, HashingEmbedding
+from src.ai.index_storage import load_index
+from src.ai.lexical_index import BM25Index
+from src.ai.vector_store import NumpyVectorStore
+from src.graph.context_ranker import split_passages, tokenize
+
+PERSIST_NAME = "default__vector_store.json"
+
+
+def random_embeddings(count, dim, seed=13):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, dim), dtype=np.float32)
+
+
+def time_query(query, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        query()
+    return (time.perf_counter() - start) / repeats * 1e3
+
+
+def file_size(*paths):
+    return sum(os.path.getsize(path) for path in paths) / 2**20
+
+
+def bench_json_store(directory, embeddings, ids, queries, top_k):
+    path = os.path.join(directory, PERSIST_NAME)
+    data = SimpleVectorStoreData(embedding_dict={node_id: row.tolist() for node_id, row in zip(ids, embeddings)})
+    SimpleVectorStore(data=data).persist(path)
+    start = time.perf_counter()
+    store = SimpleVectorStore.from_persist_path(path)
+    load = (time.perf_counter() - start) * 1e3
+    requests = [VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k) for q in queries]
+    latency = time_query(lambda: [store.query(r) for r in requests], 1) / len(requests)
+    return load, file_size(path), latency
+
+
+def bench_numpy_store(directory, embeddings, ids, queries, top_k, dtype):
+    path = os.path.join(directory, PERSIST_NAME)
+    NumpyVectorStore.from_arrays(embeddings, ids, dtype=dtype).persist(path)
+    start = time.perf_counter()
+    store = NumpyVectorStore.from_persist_path(path)
+    load = (time.perf_counter() - start) * 1e3
+    requests = [VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k) for q in queries]
+    store.query(requests[0])  # first query pages the matrix in
+    latency = time_query(lambda: [store.query(r) for r in requests], 1) / len(requests)
+    return load, file_size(*NumpyVectorStore.files(path)), latency
+
+
+def benchmark_vector_store(chunk_counts, dim, queries, top_k, json_limit):
+    print(f"{'chunks':>9} {'store':>13} {'file (MB)':>10} {'load (ms)':>11} {'query (ms)':>11}")
+    query_vectors = random_embeddings(queries, dim, seed=29)
+    for count in chunk_counts:
+        embeddings = random_embeddings(count, dim)
+        ids = [f"chunk-{i}" for i in range(count)]
+        rows = []
+        if count <= json_limit:
+            with tempfile.TemporaryDirectory() as directory:
+                rows.append(("json", *bench_json_store(directory, embeddings, ids, query_vectors, top_k)))
+        else:
+            rows.append(("json", None, None, None))
+        for dtype in ("float32", "float16"):
+            with tempfile.TemporaryDirectory() as directory:
+                rows.append((f"npy {dtype}", *bench_numpy_store(directory, embeddings, ids, query_vectors,
+                                                                top_k, dtype)))
+        for name, load, size, latency in rows:
+            if load is None:
+                print(f"{count:>9} {name:>13} {'skipped (see --json-limit)':>34}")
+                continue
+            print(f"{count:>9} {name:>13} {size:>10.1f} {load:>11.1f} {latency:>11.2f}")
+        del embeddings
+
+
+def benchmark_end_to_end(repeats):
+    outlines = [
+        "Sarah finds the Yeats poetry books in the attic",
+        "David reads the realtor's estimate for the cliff house",
+        "A storm breaks over the harbour at night",
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        index_dir = os.path.join(directory, "data_index")
+        cache = EmbeddingCache(os.path.join(directory, "embeddings.sqlite"))
+        model = CachedEmbedding(HashingEmbedding(), cache)
+
+        print(f"{'step':>24} {'time (ms)':>10} {'cache hit rate':>15}")
+        steps = [
+            ("cold build", lambda: build_index(persist_dir=index_dir, embed_model=model)),
+            ("rebuild (cached)", lambda: build_index(persist_dir=index_dir, embed_model=model)),
+            ("incremental no-op", lambda: update_index(persist_dir=index_dir, embed_model=model)),
+            # The CLI passes a name; it must match the manifest written from the instance
+            ("no-op by model name", lambda: update_index(persist_dir=index_dir, embed_model="hashing", cache=False)),
+        ]
+        for name, step in steps:
+            model.reset_stats()
+            start = time.perf_counter()
+            summary = step()
+            elapsed = (time.perf_counter() - start) * 1e3
+            print(f"{name:>24} {elapsed:>10.1f} {model.stats['hit_rate']:>15.0%}")
+            if "no-op" in name and (summary["added"] or summary["changed"] or summary["removed"]):
+                raise RuntimeError(f"{name} re-indexed files that did not change: {summary}")
+
+        start = time.perf_counter()
+        builder = ContextBuilder(index=load_index(index_dir, embed_model=model))
+        builder.get_context(outlines[0])
+        print(f"{'first query (load)':>24} {(time.perf_counter() - start) * 1e3:>10.1f}")
+        warm = time_query(lambda: [builder.get_context(o) for o in outlines], repeats) / len(outlines)
+        print(f"{'warm query':>24} {warm:>10.2f}")
+    print(f"(corpus: {DATA_DIR})")
+
+
+def clustered_embeddings(count, dim, topics=1000, spread=1.5, seed=17):
+    """Embeddings drawn around `topics` random directions, like chunks of many novels."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim), dtype=np.float32)
+    embeddings = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100000):
+        size = min(100000, count - start)
+        noise = rng.standard_normal((size, dim), dtype=np.float32) * spread
+        embeddings[start:start + size] = centers[rng.integers(0, topics, size)] + noise
+    queries = centers[rng.integers(0, topics, 100)] + rng.standard_normal((100, dim), dtype=np.float32) * spread
+    return embeddings, queries
+
+
+def benchmark_ann(chunk_counts, dim, nprobes, queries, top_k):
+    print(f"{'chunks':>9} {'lists':>6} {'train (s)':>10} {'nprobe':>7} {'recall@' + str(top_k):>10} "
+          f"{'query (ms)':>11} {'speedup':>8}")
+    for count in chunk_counts:
+        embeddings, query_vectors = clustered_embeddings(count, dim)
+        query_vectors = query_vectors[:queries]
+        store = NumpyVectorStore.from_arrays(embeddings, [f"chunk-{i}" for i in range(count)])
+        del embeddings
+        start = time.perf_counter()
+        ann = store.train_ann()
+        train = time.perf_counter() - start
+        requests = [VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k) for q in query_vectors]
+        exact_ids = [set(store.query(r, nprobe=0).ids) for r in requests]
+        exact = time_query(lambda: [store.query(r, nprobe=0) for r in requests], 1) / len(requests)
+        print(f"{count:>9} {ann.nlist:>6} {train:>10.1f} {'exact':>7} {1.0:>10.3f} {exact:>11.2f} {1.0:>7.1f}x")
+        for nprobe in nprobes:
+            found = [set(store.query(r, nprobe=nprobe).ids) for r in requests]
+            recall = np.mean([len(f & e) / len(e) for f, e in zip(found, exact_ids)])
+            latency = time_query(lambda: [store.query(r, nprobe=nprobe) for r in requests], 1) / len(requests)
+            print(f"{count:>9} {ann.nlist:>6} {'':>10} {nprobe:>7} {recall:>10.3f} {latency:>11.2f} "
+                  f"{exact / latency:>7.1f}x")
+        del store
+
+
+def novel_chunks(count, chars=600):
+    """`count` chunks cut from the chapters in data/novel, cycling with a unique tag each."""
+    passages = []
+    for path in sorted(Path(DATA_DIR).glob("*.md")):
+        passages.extend(split_passages(path.read_text(encoding="utf-8"), chars))
+    return [f"{passages[i % len(passages)]} chunk{i}" for i in range(count)]
+
+
+def benchmark_lexical(chunk_counts, repeats):
+    queries = ["Yeats poetry books", "the realtor's estimate", "storm over the lighthouse at night"]
+    print(f"{'chunks':>9} {'add (ms)':>10} {'query (ms)':>11} {'postings (KB)':>14} {'int64 (KB)':>11}")
+    for count in chunk_counts:
+        chunks = novel_chunks(count)
+        index = BM25Index()
+        start = time.perf_counter()
+        for i, text in enumerate(chunks):
+            index.add(f"chunk-{i}", text)
+        add = (time.perf_counter() - start) * 1e3
+        index.search(queries[0])  # packs the pending postings of the query terms
+        for query in queries:
+            index.search(query)
+        latency = time_query(lambda: [index.search(q) for q in queries], repeats) / len(queries)
+        index.pack()
+        # Uncompressed layout: one int64 row and one int64 tf per posting
+        plain = sum(len(set(tokenize(text))) for text in chunks) * 16
+        print(f"{count:>9} {add:>10.1f} {latency:>11.3f} {index.nbytes() / 1024:>14.0f} {plain / 1024:>11.0f}")
+
+
+def benchmark_batch(chunk_counts, dim, batch_size, top_k, repeats):
+    print(f"{'chunks':>9} {'queries':>8} {'loop (ms)':>10} {'batch (ms)':>11} {'speedup':>8}")
+    for count in chunk_counts:
+        store = NumpyVectorStore.from_arrays(random_embeddings(count, dim), [f"chunk-{i}" for i in range(count)])
+        query_vectors = random_embeddings(batch_size, dim, seed=7)
+        requests = [VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=top_k) for q in query_vectors]
+        runs = max(1, repeats // 10)
+        loop = time_query(lambda: [store.query(r) for r in requests], runs)
+        batch = time_query(lambda: store.query_batch(query_vectors, top_k), runs)
+        print(f"{count:>9} {batch_size:>8} {loop:>10.2f} {batch:>11.2f} {loop / batch:>7.1f}x")
+        del store
+
+    outlines = [f"{text} ({i})" for i, text in enumerate(novel_chunks(batch_size, chars=200))]
+    with tempfile.TemporaryDirectory() as directory:
+        index_dir = os.path.join(directory, "data_index")
+        model = CachedEmbedding(HashingEmbedding(), EmbeddingCache(os.path.join(directory, "embeddings.sqlite")))
+        build_index(persist_dir=index_dir, embed_model=model)
+        builder = ContextBuilder(index=load_index(index_dir, embed_model=model), top_k=top_k)
+        # Warm the query embedding cache so both sides measure retrieval only
+        builder.get_contexts(outlines)
+        for mode in ("vector", "hybrid"):
+            loop = time_query(lambda: [builder.get_context(o, mode=mode) for o in outlines], repeats)
+            batch = time_query(lambda: builder.get_contexts(outlines, mode=mode), repeats)
+            print(f"{'novel ' + mode:>9} {batch_size:>8} {loop:>10.2f} {batch:>11.2f} {loop / batch:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[100, 10000, 1000000],
+                        help="Number of stored chunks")
+    parser.add_argument("--dim", type=int, default=128,
+                        help="Embedding dimension (OpenAI embeddings use 1536)")
+    parser.add_argument("--queries", type=int, default=20,
+                        help="Queries timed per store")
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--json-limit", type=int, default=10000,
+                        help="Largest chunk count benchmarked with the JSON store")
+    parser.add_argument("--end-to-end", action="store_true",
+                        help="Index data/novel with the local hashing embedder and time retrieval")
+    parser.add_argument("--repeats", type=int, default=50,
+                        help="Repeats for the end-to-end query timing")
+    parser.add_argument("--lexical", action="store_true",
+                        help="Time BM25 indexing and queries over novel chunks")
+    parser.add_argument("--lexical-chunks", type=int, nargs="+", default=[1000, 5000, 20000],
+                        help="Chunk counts for the lexical benchmark")
+    parser.add_argument("--ann", action="store_true",
+                        help="Compare IVF-flat recall and latency with exact search")
+    parser.add_argument("--ann-chunks", type=int, nargs="+", default=[100000, 1000000],
+                        help="Chunk counts for the ANN benchmark")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="IVF lists scanned per query")
+    parser.add_argument("--batch", action="store_true",
+                        help="Compare a loop of single queries with one batched query")
+    parser.add_argument("--batch-chunks", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Chunk counts for the batch benchmark")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="Queries per batch (e.g. the scene outlines of one part)")
+    args = parser.parse_args()
+
+    if args.batch:
+        print(f"Batched vs looped retrieval, dim={args.dim}, top_k={args.top_k}")
+        benchmark_batch(args.batch_chunks, args.dim, args.batch_size, args.top_k, args.repeats)
+        return
+
+    if args.ann:
+        print(f"IVF-flat vs exact search on clustered embeddings, dim={args.dim}")
+        benchmark_ann(args.ann_chunks, args.dim, args.nprobe, args.queries, 10)
+        return
+
+    if args.lexical:
+        print("BM25 with delta-encoded, width-packed postings")
+        benchmark_lexical(args.lexical_chunks, args.repeats)
+        return
+
+    if args.end_to_end:
+        print("End-to-end indexing and retrieval with the local hashing embedder")
+        benchmark_end_to_end(args.repeats)
+        return
+
+    print(f"Vector stores: JSON (SimpleVectorStore) vs memory-mapped NumPy, dim={args.dim}, top_k={args.top_k}")
+    benchmark_vector_store(args.chunks, args.dim, args.queries, args.top_k, args.json_limit)
+
+
+if __name__ == "__main__":
+    main()
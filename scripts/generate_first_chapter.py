@@ -1,12 +1,22 @@
 from dotenv import load_dotenv
 
 from src.ai.generator import ChapterGenerator
-from src.graph.graph_manager import initialise_graph
+from src.ai.telemetry import telemetry_tags
+from src.graph.graph_manager import load_graph
 
 load_dotenv()
 
+FIRST_CHAPTER_OUTLINE = "David explores the crumbling cliffs"
+
+
+def generate_first_chapter(generator):
+    """Generate chapter 1 from the seed data; its outline has no number, so its LLM calls are tagged chapter=1."""
+    with telemetry_tags(chapter=1):
+        return generator.generate_chapter(FIRST_CHAPTER_OUTLINE)
+
+
 if __name__ == "__main__":
-    graph = initialise_graph()
+    graph = load_graph()
     generator = ChapterGenerator(graph)
-    generator.generate_chapter("David explores the crumbling cliffs")
-    print("First chapter generated. Now run 'python scripts/index_novel_documents.py' to index it for RAG.")
\ No newline at end of file
+    generate_first_chapter(generator)
+    print("First chapter generated. Now run 'python scripts/index_novel_documents.py' to index it for RAG.")
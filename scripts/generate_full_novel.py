@@ -16,8 +16,16 @@ Generate    with open(structure_path, 'r', encoding='utf-8') as f:
 4. Analyzing each chapter for quality
 5. Continuing until novel is complete
 
+With --planned, outlines are built from scenes.yaml instead and the chapters
+of each part (or of each --window of consecutive chapters) are drafted
+concurrently by --workers requests, followed by a continuity pass that
+revises every draft against its neighbours. --scenes also writes the scenes of
+each chapter concurrently and joins them with smoothed transitions.
+
 Usage:
     python scripts/generate_full_novel.py [--max-chapters N] [--analyze-each] [--pause-between]
+    python scripts/generate_full_novel.py --planned [--window part|N] [--workers N] [--no-continuity]
+        [--scenes]
 """
 import sys
 from pathlib import Path
@@ -32,7 +40,9 @@ if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
 import argparse
+import asyncio
 import os
+import time
 
 import yaml
 
@@ -40,8 +50,11 @@ print("\n".join(sys.path))
 
 
 
+from scripts.generate_first_chapter import generate_first_chapter
 from src.ai.generator import ChapterGenerator
-from src.graph.graph_manager import StoryGraph
+from src.ai.novel_planner import chapter_plans, draft_novel, drafting_waves
+from src.ai.telemetry import Telemetry, configure_telemetry, get_telemetry
+from src.graph.graph_manager import load_graph
 
 
 def run_script(script_name: str, description: str) -> bool:
@@ -145,7 +158,8 @@ def get_existing_chapters():
     return sorted(chapter_files)
 
 
-def generate_novel(max_chapters: int = 12, analyze_each: bool = True, pause_between: bool = False):
+def generate_novel(max_chapters: int = 12, analyze_each: bool = True, pause_between: bool = False,
+                   stream: bool = False):
     """Generate the complete novel iteratively."""
     
     # Read configuration from seed data
@@ -182,8 +196,8 @@ def generate_novel(max_chapters: int = 12, analyze_each: bool = True, pause_betw
     
     # Initialize
     check_novel_directory()
-    graph = StoryGraph()
-    generator = ChapterGenerator(graph)
+    graph = load_graph()
+    generator = ChapterGenerator(graph, stream=stream or None)
     
     # Check for existing chapters
     existing_chapters = get_existing_chapters()
@@ -212,9 +226,16 @@ def generate_novel(max_chapters: int = 12, analyze_each: bool = True, pause_betw
         
         try:
             if chapter_num == 0 and start_chapter == 0:
-                # Generate first chapter from seed data
-                success = run_script("scripts.generate_first_chapter", 
-                                   "Generating Chapter 1 from seed data")
+                # Generate first chapter from seed data, in this process so
+                # --telemetry records its call
+                print("🤖 Generating Chapter 1 from seed data...")
+                try:
+                    generate_first_chapter(generator)
+                    print("✅ Chapter 1 generated successfully")
+                    success = True
+                except (FileNotFoundError, RuntimeError) as e:
+                    print(f"❌ Chapter 1 generation failed: {e}")
+                    success = False
             else:
                 # Generate subsequent chapter using RAG
                 print(f"🤖 Generating Chapter {chapter_num + 1} using RAG context...")
@@ -282,6 +303,60 @@ def generate_novel(max_chapters: int = 12, analyze_each: bool = True, pause_betw
         print("🔧 Check your configuration and try again.")
 
 
+def generate_planned_novel(max_chapters: int = 12, window=None, workers: int = 4, continuity: bool = True,
+                           analyze_each: bool = False, scenes: bool = False):
+    """Draft every planned chapter in parallel waves, then reconcile the drafts."""
+    
+    try:
+        config = get_novel_config()
+    except (FileNotFoundError, yaml.YAMLError, KeyError, ImportError) as e:
+        print(f"❌ Error reading novel configuration: {e}")
+        print("💡 Make sure your data/seed/ directory contains structure.yaml and overview.md")
+        return
+    
+    if max_chapters == 12:  # Default value
+        max_chapters = config['chapter_count']
+    plans = chapter_plans(config['scenes'], max_chapters)
+    waves = drafting_waves(plans, window)
+    
+    print("🎭 NovelGraphRAG: Planned Novel Generation")
+    print("=" * 60)
+    print(f"📚 Generating '{config['title']}'")
+    print(f"🎯 Target: {len(plans)} chapters in {len(waves)} waves, {workers} workers")
+    for number, wave in enumerate(waves, 1):
+        titles = ", ".join(f"{plan['chapter']} {plan['title'] or ''}".strip() for plan in wave)
+        print(f"   {number}. {titles}")
+    print()
+    
+    check_novel_directory()
+    existing_chapters = get_existing_chapters()
+    if existing_chapters:
+        print(f"📄 Found {len(existing_chapters)} existing chapters")
+        response = input("\n🤔 Draft the planned chapters alongside them? (y/n): ").lower().strip()
+        if response != 'y':
+            print("🛑 Aborting to avoid mixing with existing work")
+            return
+    
+    graph = load_graph()
+    generator = ChapterGenerator(graph)
+    start = time.perf_counter()
+    filenames = asyncio.run(draft_novel(generator, plans, window=window, workers=workers, continuity=continuity,
+                                        scenes=scenes))
+    elapsed = time.perf_counter() - start
+    
+    print("\n🎉 PLANNED GENERATION COMPLETE!")
+    print("=" * 60)
+    print(f"📚 Generated {len(filenames)} of {len(plans)} chapters in {elapsed:.1f}s")
+    for chapter, filename in sorted(filenames.items()):
+        print(f"   {chapter:2d}. {os.path.basename(filename)}")
+    
+    if filenames:
+        if not run_script("scripts.index_novel_documents", "Indexing the novel for RAG"):
+            print("⚠️  Indexing failed; run scripts/index_novel_documents.py again")
+        if analyze_each:
+            run_analysis_script()
+
+
 def main():
     """Main entry point with command line arguments."""
     parser = argparse.ArgumentParser(
@@ -293,6 +368,8 @@ Examples:
   python scripts/generate_full_novel.py --max-chapters 5  # Generate only 5 chapters  
   python scripts/generate_full_novel.py --no-analyze      # Skip quality analysis
   python scripts/generate_full_novel.py --pause-between   # Pause between chapters
+  python scripts/generate_full_novel.py --planned         # Draft each part in parallel from scenes.yaml
+  python scripts/generate_full_novel.py --planned --window 3 --workers 3
         """
     )
     
@@ -323,23 +400,92 @@ Examples:
         default=False,
         help="Pause between chapters for manual review"
     )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help="Stream each chapter into its file as it is generated (default: LLM_STREAM)"
+    )
+    
+    parser.add_argument(
+        "--planned",
+        action="store_true",
+        default=False,
+        help="Build outlines from scenes.yaml and draft chapters in parallel waves"
+    )
+
+    parser.add_argument(
+        "--window",
+        default="part",
+        help="--planned: chapters drafted together, 'part' or a number of consecutive chapters (default: part)"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="--planned: requests in flight at once (default: 4)"
+    )
+
+    parser.add_argument(
+        "--scenes",
+        action="store_true",
+        default=False,
+        help="--planned: write the scenes of each chapter concurrently"
+    )
+
+    parser.add_argument(
+        "--no-continuity",
+        action="store_false",
+        dest="continuity",
+        help="--planned: skip the continuity pass over the drafts"
+    )
+
+    parser.add_argument(
+        "--telemetry",
+        action="store_true",
+        default=False,
+        help="Record every LLM call in telemetry/ and print a latency, token and cost summary (default: LLM_TELEMETRY)"
+    )
     
     args = parser.parse_args()
+    if args.window != "part" and not args.window.isdigit():
+        parser.error("--window must be 'part' or a number of chapters")
+    if args.telemetry:
+        configure_telemetry()
     
     try:
         # If no max_chapters specified, let the function determine from config
         max_chapters = args.max_chapters if args.max_chapters is not None else 12
         
+        if args.planned:
+            generate_planned_novel(
+                max_chapters=max_chapters,
+                window=None if args.window == "part" else int(args.window),
+                workers=args.workers,
+                continuity=args.continuity,
+                analyze_each=args.analyze_each,
+                scenes=args.scenes
+            )
+            return
+        
         generate_novel(
             max_chapters=max_chapters,
             analyze_each=args.analyze_each, 
-            pause_between=args.pause_between
+            pause_between=args.pause_between,
+            stream=args.stream
         )
     except KeyboardInterrupt:
         print("\n👋 Novel generation interrupted. Partial progress saved.")
     except (FileNotFoundError, yaml.YAMLError, ImportError) as e:
         print(f"\n💥 Fatal error: {e}")
         sys.exit(1)
+    finally:
+        telemetry = get_telemetry()
+        if telemetry is not None and telemetry.events:
+            print("\n" + Telemetry.format_summary(telemetry.write_summary()))
+            print(f"📈 Telemetry events: {telemetry.path}")
 
 
 if __name__ == "__main__":
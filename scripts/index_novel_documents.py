@@ -1,29 +1,282 @@
+"""
+Build or update the RAG index over data/novel.
+
+By default only files whose content hash changed since the last run are
+re-embedded: a manifest in data_index/ records each file's hash and the ids of
+the documents it produced. Removed files have their nodes deleted, and only the
+stores that changed are written back: the numpy store appends the new
+embeddings to its matrix and records deleted rows in its sidecar, while the
+docstore and index store, which llama-index keeps as single JSON documents,
+are rewritten. Pass --full to rebuild from scratch.
+Chapters are streamed through SceneChunker, so chunks follow the `## ` scene
+headings and carry chapter, part and scene metadata from scenes.yaml.
+With --ann the numpy store also gets an IVF index (default__vector_store.<version>.ivf.npz)
+so queries scan only a few inverted lists instead of every embedding.
+"""
+
+import argparse
+import hashlib
 import os
+import sys
+from pathlib import Path
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from llama_index.core import (SimpleDirectoryReader, StorageContext,
-                              VectorStoreIndex, load_index_from_storage)
+# Add the project root to sys.path so 'src' is importable when run as a script
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from llama_index.core import StorageContext, VectorStoreIndex
+
+from src.ai.chunker import SceneChunker
+from src.ai.embeddings import CachedEmbedding, get_embed_model
+from src.ai.index_storage import (INDEX_DIR, JSON_VECTOR_STORE, load_index,
+                                  load_manifest, write_manifest)
+from src.ai.vector_store import NumpyVectorStore
 
-INDEX_DIR = os.path.join(os.path.dirname(__file__), "..", "data_index")
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "novel")
+# Chunks embedded and added to the index at a time while streaming
+INSERT_BATCH = 256
+
+
+def _remove_stale_vectors(persist_dir, vector_store):
+    """Delete the default vector store files written by the other backend."""
+    if vector_store == "numpy":
+        stale = [JSON_VECTOR_STORE]
+    else:
+        # The sidecar and every versioned matrix and IVF file of the numpy store
+        prefix = JSON_VECTOR_STORE[:-len("json")]
+        stale = [name for name in os.listdir(persist_dir) if name.startswith(prefix) and name != JSON_VECTOR_STORE]
+    for name in stale:
+        path = os.path.join(persist_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_files(data_dir):
+    """
+    {path relative to data_dir: content hash} for every non-hidden file,
+    skipping chapters still being streamed (*.part).
+    """
+    files = {}
+    for root, dirs, names in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.startswith(".") or name.endswith(".part"):
+                continue
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, data_dir)] = _file_hash(path)
+    return files
+
+
+def _insert_chunks(index, chunker, data_dir, relative_paths):
+    """
+    Stream the chunks of the given files into the index in batches of
+    INSERT_BATCH. Returns {file: [doc id]}; each file is one source document.
+    """
+    doc_ids = {rel: [rel] for rel in relative_paths}
+    batch = []
+    for _rel, node in chunker.iter_corpus(data_dir, relative_paths):
+        batch.append(node)
+        if len(batch) == INSERT_BATCH:
+            index.insert_nodes(batch)
+            batch = []
+    if batch:
+        index.insert_nodes(batch)
+    return doc_ids
 
-def build_index():
-    # Load all .md and .yaml files as documents
-    docs = SimpleDirectoryReader(DATA_DIR, recursive=True).load_data()
+
+def _resolve_embed_model(embed_model, cache):
+    """
+    (model, name recorded in the manifest) for a model name or instance. The
+    name is always the resolved model's own (e.g. "hashing" -> "hashing-384"),
+    so a CLI alias and the instance it stands for compare equal.
+    """
+    if isinstance(embed_model, str):
+        embed_model = get_embed_model(embed_model, cache=cache)
+    elif isinstance(embed_model, CachedEmbedding):
+        # Report the hit rate of this run only
+        embed_model.reset_stats()
+    return embed_model, embed_model.model_name
+
+
+def _report_cache(embed_model):
+    if isinstance(embed_model, CachedEmbedding):
+        stats = embed_model.stats
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate)")
+        return stats
+    return None
+
+
+def _train_ann(store, ann_lists, nprobe):
+    if not isinstance(store, NumpyVectorStore):
+        raise ValueError("An ANN index needs the numpy vector store")
+    ann = store.train_ann(nlist=ann_lists, nprobe=nprobe)
+    print(f"IVF index trained: {ann.nlist} lists, nprobe {ann.nprobe}")
+    return {"nlist": ann.nlist, "requested_lists": ann_lists, "nprobe": ann.nprobe}
+
+
+def build_index(vector_store="numpy", dtype="float32", persist_dir=INDEX_DIR, data_dir=DATA_DIR,
+                embed_model="openai", cache=True, ann=False, ann_lists=None, nprobe=8,
+                chunk_tokens=512, chunk_overlap=64):
+    """
+    Rebuild the whole index.
+
+    Args:
+        vector_store: "numpy" (memory-mapped .npy matrix, see NumpyVectorStore)
+            or "json" (llama-index SimpleVectorStore)
+        dtype: Embedding precision for the numpy store ("float32" or "float16")
+        embed_model: Embedding model name (see get_embed_model) or instance;
+            "hashing" embeds locally without network access
+        cache: Look chunks up in the on-disk embedding cache before embedding them
+        ann: Train an IVF index over the numpy store (see IVFIndex)
+        ann_lists: Number of IVF lists (default sqrt(chunks))
+        nprobe: Lists scanned per query by default
+        chunk_tokens: Estimated tokens per chunk (see SceneChunker)
+        chunk_overlap: Estimated tokens shared by consecutive chunks of a scene
+    """
+    model, model_name = _resolve_embed_model(embed_model, cache)
+    chunker = SceneChunker(chunk_tokens, chunk_overlap)
+    files = _source_files(data_dir)
+    if vector_store == "numpy":
+        storage_context = StorageContext.from_defaults(vector_store=NumpyVectorStore(dtype=dtype))
+    else:
+        storage_context = StorageContext.from_defaults()
     # Build a vector index
-    index = VectorStoreIndex.from_documents(docs)
+    index = VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=model)
+    doc_ids = _insert_chunks(index, chunker, data_dir, list(files))
+    ann_config = _train_ann(storage_context.vector_store, ann_lists, nprobe) if ann and files else None
     # Persist index to disk
-    index.storage_context.persist(INDEX_DIR)
-    print("Index built and saved to", INDEX_DIR)
+    index.storage_context.persist(persist_dir)
+    _remove_stale_vectors(persist_dir, vector_store)
+    write_manifest(persist_dir, {
+        "vector_store": vector_store,
+        "dtype": dtype,
+        "embed_model": model_name,
+        "ann": ann_config,
+        "chunker": chunker.config,
+        "files": {rel: {"hash": files[rel], "doc_ids": doc_ids[rel]} for rel in files},
+    })
+    print(f"Index built and saved to {persist_dir} ({len(files)} files)")
+    _report_cache(model)
+    return index
+
+
+def update_index(vector_store="numpy", dtype="float32", persist_dir=INDEX_DIR, data_dir=DATA_DIR,
+                 embed_model="openai", cache=True, ann=None, ann_lists=None, nprobe=8,
+                 chunk_tokens=512, chunk_overlap=64):
+    """
+    Re-embed only new or changed files and drop the nodes of removed ones.
+    Falls back to build_index() when there is no compatible manifest.
+    ann=None keeps the existing IVF index (new chunks are assigned to their
+    nearest list); True (re)trains it if missing or configured differently,
+    False drops it.
+    Returns {"added": [...], "changed": [...], "removed": [...]}.
+    """
+    model, model_name = _resolve_embed_model(embed_model, cache)
+    chunker = SceneChunker(chunk_tokens, chunk_overlap)
+    manifest = load_manifest(persist_dir)
+    if (manifest is None or manifest.get("vector_store") != vector_store
+            or manifest.get("dtype", dtype) != dtype
+            or manifest.get("embed_model", "openai") != model_name
+            or manifest.get("chunker") != chunker.config):
+        files = _source_files(data_dir)
+        build_index(vector_store, dtype, persist_dir, data_dir, model, cache, bool(ann), ann_lists, nprobe,
+                    chunk_tokens, chunk_overlap)
+        return {"added": sorted(files), "changed": [], "removed": []}
+
+    files = _source_files(data_dir)
+    indexed = manifest["files"]
+    added = sorted(rel for rel in files if rel not in indexed)
+    changed = sorted(rel for rel in files if rel in indexed and indexed[rel]["hash"] != files[rel])
+    removed = sorted(rel for rel in indexed if rel not in files)
+    summary = {"added": added, "changed": changed, "removed": removed}
+    current_ann = manifest.get("ann")
+    if ann is None:
+        retrain = drop = False
+    else:
+        wanted = {"requested_lists": ann_lists, "nprobe": nprobe}
+        retrain = ann and (current_ann is None
+                           or any(current_ann.get(key) != value for key, value in wanted.items()))
+        drop = not ann and current_ann is not None
+    if not (added or changed or removed or retrain or drop):
+        print(f"Index up to date ({len(files)} files)")
+        return summary
 
+    index = load_index(persist_dir, embed_model=model)
+    for rel in changed + removed:
+        for doc_id in indexed.pop(rel)["doc_ids"]:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+    doc_ids = _insert_chunks(index, chunker, data_dir, added + changed)
+    for rel in added + changed:
+        indexed[rel] = {"hash": files[rel], "doc_ids": doc_ids[rel]}
+    store = index.storage_context.vector_stores["default"]
+    if retrain:
+        manifest["ann"] = _train_ann(store, ann_lists, nprobe)
+    elif drop:
+        store.drop_ann()
+        manifest["ann"] = None
 
-def load_index():
-    storage_context = StorageContext.from_defaults(persist_dir=INDEX_DIR)
-    return load_index_from_storage(storage_context)
+    # The graph and image stores are untouched by document inserts, so only
+    # the docstore, index struct and default vector store are written back;
+    # the numpy store appends new rows instead of rewriting its matrix
+    storage = index.storage_context
+    storage.docstore.persist(os.path.join(persist_dir, "docstore.json"))
+    storage.index_store.persist(os.path.join(persist_dir, "index_store.json"))
+    storage.vector_stores["default"].persist(os.path.join(persist_dir, JSON_VECTOR_STORE))
+    write_manifest(persist_dir, manifest)
+    print(f"Index updated in {persist_dir}: {len(added)} added, {len(changed)} changed, "
+          f"{len(removed)} removed, {len(files) - len(added) - len(changed)} unchanged")
+    _report_cache(model)
+    return summary
 
 
 if __name__ == "__main__":
-    build_index()
+    parser = argparse.ArgumentParser(description="Build the RAG index over data/novel")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild the whole index instead of re-embedding changed files only")
+    parser.add_argument("--vector-store", choices=["numpy", "json"], default="numpy",
+                        help="Embedding storage backend")
+    parser.add_argument("--float16", action="store_true",
+                        help="Store numpy embeddings as float16 (half the size)")
+    parser.add_argument("--embed-model", default="openai",
+                        help="Embedding model: openai, or hashing[-<dim>] for local deterministic embeddings")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Skip the on-disk embedding cache")
+    parser.add_argument("--ann", action=argparse.BooleanOptionalAction, default=None,
+                        help="Train (--ann) or drop (--no-ann) the IVF index; by default an existing one is kept")
+    parser.add_argument("--ann-lists", type=int, default=None,
+                        help="Number of IVF lists (default sqrt(chunks))")
+    parser.add_argument("--nprobe", type=int, default=8,
+                        help="IVF lists scanned per query; higher is slower but closer to exact")
+    parser.add_argument("--chunk-tokens", type=int, default=512,
+                        help="Estimated tokens per chunk; chunks never span two scenes")
+    parser.add_argument("--chunk-overlap", type=int, default=64,
+                        help="Estimated tokens repeated between consecutive chunks of a scene")
+    args = parser.parse_args()
+    options = {
+        "vector_store": args.vector_store,
+        "dtype": "float16" if args.float16 else "float32",
+        "embed_model": args.embed_model,
+        "cache": not args.no_cache,
+        "ann_lists": args.ann_lists,
+        "nprobe": args.nprobe,
+        "chunk_tokens": args.chunk_tokens,
+        "chunk_overlap": args.chunk_overlap,
+    }
+    if args.full:
+        build_index(ann=bool(args.ann), **options)
+    else:
+        update_index(ann=args.ann, **options)
@@ -15,8 +15,10 @@ for file in chapter_files:
     except Exception as e:
         print(f"Could not delete {file}: {e}")
 
-# Delete index/graph data directories (e.g., data_index, graph_data, etc.)
-for folder in ["data_index", "graph_data"]:
+# Delete index/graph data directories (e.g., data_index, graph_data, graph_store, etc.)
+# embedding_cache/ and llm_cache/ are kept on purpose: re-indexing identical chunks
+# and replaying recorded completions are then free; telemetry/ keeps run history
+for folder in ["data_index", "graph_data", "graph_store"]:
     folder_path = os.path.join(PROJECT_ROOT, folder)
     if os.path.exists(folder_path):
         try:
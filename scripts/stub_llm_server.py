@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions with generated prose after a configurable
+latency (streamed as server-sent events, one word per `--token-interval`,
+when the request sets stream=True, else after the same total time; replies
+are cut to the request's max_tokens), and fails a configurable share of
+requests with 429 or 5xx so retry and concurrency handling can be exercised
+without an API key or network.
+Point the generator at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub
+
+Usage:
+    python -m scripts.stub_llm_server [--port 8765] [--latency 0.5] [--error-rate 0.1]
+        [--token-interval 0.01]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the house leaned toward the sea and David listened to the wind in the empty rooms "
+         "while the tide took another yard of the cliff below his mother's garden").split()
+PARAGRAPH_WORDS = 80
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, error_rate=0.0, words=600, retry_after=None,
+                 token_interval=0.0, seed=0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.token_interval = token_interval
+        self.error_rate = error_rate
+        self.words = words
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "completions": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, key, delta=1):
+        with self.lock:
+            self.counts[key] += delta
+            self.counts["max_in_flight"] = max(self.counts["max_in_flight"], self.counts["in_flight"])
+
+    def draw(self, max_tokens=None):
+        """(failure status or None, completion text) for one request."""
+        # About three words per four tokens
+        words = min(self.words, max_tokens * 3 // 4) if max_tokens else self.words
+        with self.lock:
+            status = None
+            if self.random.random() < self.error_rate:
+                status = self.random.choice([429, 429, 500, 503])
+            text = " ".join(self.random.choice(WORDS) for _ in range(words))
+        # Blank-line separated paragraphs, as a model writes them
+        tokens = text.split(" ")
+        text = "\n\n".join(" ".join(tokens[i:i + PARAGRAPH_WORDS]) for i in range(0, len(tokens), PARAGRAPH_WORDS))
+        return status, text
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubLLMServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream(self, request, text, usage):
+        """Send the completion as chat.completion.chunk events, one word at a time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        base = {
+            "id": f"chatcmpl-stub-{self.server.counts['requests']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+        }
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if i and self.server.token_interval:
+                time.sleep(self.server.token_interval)
+            delta = {"content": word if i == 0 else f" {word}"}
+            if i == 0:
+                delta["role"] = "assistant"
+            self._send_event(json.dumps(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])))
+        self._send_event(json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event(json.dumps(dict(base, choices=[], usage=usage)))
+        self._send_event("[DONE]")
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        server.count("requests")
+        server.count("in_flight")
+        try:
+            time.sleep(server.latency)
+            status, text = server.draw(request.get("max_tokens"))
+            # Further choices of an n > 1 request
+            texts = [text] + [server.draw(request.get("max_tokens"))[1]
+                              for _ in range(int(request.get("n") or 1) - 1)]
+            if status is not None:
+                server.count("errors")
+                headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+                self._send_json(status, {"error": {"message": "stub failure", "type": "stub", "code": status}},
+                                headers)
+                return
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+            completion_tokens = sum(len(choice) for choice in texts) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            server.count("completions")
+            if request.get("stream"):
+                self._stream(request, text, usage)
+                return
+            # A buffered reply takes as long as streaming it would
+            time.sleep(server.token_interval * len(text.split()))
+            self._send_json(200, {
+                "id": f"chatcmpl-stub-{server.counts['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{
+                    "index": index,
+                    "message": {"role": "assistant", "content": choice},
+                    "finish_reason": "stop",
+                } for index, choice in enumerate(texts)],
+                "usage": usage,
+            })
+        finally:
+            server.count("in_flight", -1)
+
+
+def start_stub_server(host="127.0.0.1", port=0, **options):
+    """Serve in a daemon thread; returns the server (see .base_url, .counts, .shutdown())."""
+    server = StubLLMServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Seconds before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of requests answered with 429/500/503")
+    parser.add_argument("--words", type=int, default=600,
+                        help="Words per completion")
+    parser.add_argument("--retry-after", type=float, default=None,
+                        help="Retry-After seconds sent with failures")
+    parser.add_argument("--token-interval", type=float, default=0.0,
+                        help="Seconds between streamed words")
+    args = parser.parse_args()
+    server = StubLLMServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+                           words=args.words, retry_after=args.retry_after, token_interval=args.token_interval)
+    print(f"Stub LLM server on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {server.counts}")
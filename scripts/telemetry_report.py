@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Summarise recorded LLM telemetry runs (see src/ai/telemetry.py).
+
+Prints the summary of each run file given, or of the latest run in
+telemetry/ when none is; with two or more files, also prints how the
+last run's latency, tokens and cost moved against the first.
+
+Usage:
+    python -m scripts.telemetry_report [telemetry/<run>.jsonl ...]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the project root to sys.path so 'src' is importable
+project_root = Path(__file__).resolve().parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from src.ai.telemetry import TELEMETRY_DIR, Telemetry
+
+COMPARED = ("latency_p50", "latency_p95", "prompt_tokens", "completion_tokens", "cost")
+
+
+def _format(value):
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise and compare LLM telemetry runs")
+    parser.add_argument("runs", nargs="*", help="Run files (default: the latest in telemetry/)")
+    args = parser.parse_args()
+
+    paths = [Path(run) for run in args.runs]
+    if not paths:
+        runs = sorted(TELEMETRY_DIR.glob("*.jsonl"), key=lambda path: path.stat().st_mtime)
+        if not runs:
+            print(f"No telemetry runs in {TELEMETRY_DIR}; set LLM_TELEMETRY=true to record them")
+            sys.exit(1)
+        paths = runs[-1:]
+
+    summaries = []
+    for path in paths:
+        summary = Telemetry.load(path).summary()
+        summaries.append(summary)
+        print(f"\n{path}")
+        print(Telemetry.format_summary(summary))
+
+    if len(summaries) > 1:
+        first, last = summaries[0], summaries[-1]
+        print(f"\nChange from {first['run_id']} to {last['run_id']}:")
+        for key in COMPARED:
+            if first[key] is None or last[key] is None:
+                continue
+            change = f" ({(last[key] - first[key]) / first[key]:+.0%})" if first[key] else ""
+            print(f"  {key:>18}: {_format(first[key])} -> {_format(last[key])}{change}")
+
+
+if __name__ == "__main__":
+    main()
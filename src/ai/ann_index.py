@@ -0,0 +1,146 @@
+"""
+IVF-flat approximate nearest-neighbour index for NumpyVectorStore.
+
+Spherical k-means splits the (L2-normalised) embedding rows into `nlist`
+inverted lists. A query scores the centroids, then scans only the rows of its
+`nprobe` best lists, so the cost is roughly nprobe / nlist of a flat scan.
+nprobe trades recall for latency at query time; nprobe == nlist is exact.
+
+Rows added after training are left unassigned and always scanned, so
+incremental indexing never needs a retrain; they are folded into their nearest
+list the next time the store is persisted.
+"""
+
+import numpy as np
+
+# Rows converted to float32 and scored at a time during training and assignment
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def _as_float32(block):
+    return block if block.dtype == np.float32 else block.astype(np.float32)
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class IVFIndex:
+    def __init__(self, centroids, assignments, nprobe=8):
+        """
+        Args:
+            centroids: (nlist, dim) unit-length centroids
+            assignments: List id of every store row (-1 = not yet assigned)
+            nprobe: Lists scanned per query by default
+        """
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.nprobe = nprobe
+        self._lists = None
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, matrix, nlist=None, nprobe=8, iterations=10, sample_size=None, seed=0):
+        """
+        Cluster the rows of an (n, dim) normalised matrix with spherical k-means.
+        nlist defaults to sqrt(n); training uses a sample of at most
+        64 * nlist rows and then assigns every row.
+        """
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("Cannot train an IVF index on an empty matrix")
+        nlist = min(n, nlist or max(1, int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, sample_size or 64 * nlist)
+        sample = _as_float32(np.asarray(matrix[np.sort(rng.choice(n, sample_size, replace=False))]))
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            # Sum each list's rows with one reduceat over the rows sorted by list
+            order = np.argsort(labels, kind="stable")
+            sorted_labels = labels[order]
+            starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[sorted_labels[starts]] = np.add.reduceat(sample[order], starts)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            # Re-seed empty lists with random sample rows
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalise(sums).astype(np.float32)
+        index = cls(centroids, np.full(n, -1, dtype=np.int32), nprobe)
+        index.assign(matrix)
+        return index
+
+    def assign(self, matrix, start=0):
+        """Assign rows start.. of the matrix to their nearest list."""
+        n = len(matrix)
+        if len(self.assignments) < n:
+            self.assignments = np.concatenate([self.assignments, np.full(n - len(self.assignments), -1, np.int32)])
+        for block_start in range(start, n, ASSIGN_BLOCK_ROWS):
+            block = _as_float32(np.asarray(matrix[block_start:block_start + ASSIGN_BLOCK_ROWS]))
+            self.assignments[block_start:block_start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        self._lists = None
+
+    def compacted(self, keep_rows, matrix):
+        """
+        A copy for the store's compacted matrix (the rows keep_rows of the old one),
+        with every row, including those added since training, assigned to a list.
+        """
+        assignments = np.full(int(keep_rows.max()) + 1 if keep_rows.size else 0, -1, dtype=np.int32)
+        known = min(len(assignments), len(self.assignments))
+        assignments[:known] = self.assignments[:known]
+        index = IVFIndex(self.centroids, assignments[keep_rows], self.nprobe)
+        unassigned = np.flatnonzero(index.assignments < 0)
+        for block_start in range(0, unassigned.size, ASSIGN_BLOCK_ROWS):
+            rows = unassigned[block_start:block_start + ASSIGN_BLOCK_ROWS]
+            block = _as_float32(np.asarray(matrix[rows]))
+            index.assignments[rows] = np.argmax(block @ self.centroids.T, axis=1)
+        return index
+
+    def _inverted_lists(self):
+        """(row order, offsets, unassigned rows): CSR view of the assignments, built on demand."""
+        if self._lists is None:
+            assigned = self.assignments >= 0
+            labels = self.assignments[assigned]
+            order = np.flatnonzero(assigned)[np.argsort(labels, kind="stable")]
+            offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+            np.cumsum(np.bincount(labels, minlength=self.nlist), out=offsets[1:])
+            self._lists = (order, offsets, np.flatnonzero(~assigned))
+        return self._lists
+
+    def candidates(self, query, row_count, nprobe=None):
+        """Rows to scan for one normalised query: its nprobe lists plus unassigned rows."""
+        nprobe = min(self.nlist, nprobe or self.nprobe)
+        order, offsets, unassigned = self._inverted_lists()
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        rows = [order[offsets[probe]:offsets[probe + 1]] for probe in probes]
+        # Rows the store has grown by since training are always scanned
+        tail = np.arange(len(self.assignments), row_count)
+        return np.concatenate(rows + [unassigned, tail])
+
+    def search(self, matrix, live, query, k, nprobe=None):
+        """Return (rows, scores) of the approximate top-k live rows for one query."""
+        query = _normalise(np.asarray(query, dtype=np.float32))
+        rows = self.candidates(query, len(matrix), nprobe)
+        rows = rows[live[rows]]
+        if not rows.size:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows.sort()  # sequential reads from the memory map
+        scores = _as_float32(np.asarray(matrix[rows])) @ query
+        k = min(k, rows.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return rows[best], scores[best]
+
+    def save(self, file):
+        """Write to a path or binary file object as .npz."""
+        np.savez(file, centroids=self.centroids, assignments=self.assignments, nprobe=np.int64(self.nprobe))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["assignments"], int(data["nprobe"]))
@@ -0,0 +1,83 @@
+"""
+Scoring of candidate chapters for best-of-N generation.
+
+All candidates of a request are scored together: required-element and
+character checks are single broadcast np.char.find / np.char.count calls over
+a (candidates x terms) grid rather than a Python loop per candidate and term,
+and the length, element and character scores are combined as arrays.
+"""
+
+import numpy as np
+
+# Weights of element coverage, character presence and length in a candidate's score
+DEFAULT_WEIGHTS = {"elements": 0.5, "characters": 0.3, "length": 0.2}
+# Mentions at which a character counts as fully present
+CHARACTER_MENTIONS = 3
+
+
+def _lowered(texts):
+    return np.char.lower(np.asarray([str(text) for text in texts], dtype=str))
+
+
+class CandidateScorer:
+    def __init__(self, required_elements=(), characters=(), target_words=None, weights=None):
+        """
+        Args:
+            required_elements: Terms every chapter should contain (case-insensitive)
+            characters: Names of the characters a chapter should feature
+            target_words: (min, max) words; shorter or longer chapters score
+                proportionally less on length (None = no length target)
+            weights: {"elements", "characters", "length"} score weights
+        """
+        self.required_elements = [str(term) for term in required_elements if term]
+        self.characters = [str(name) for name in characters if name]
+        self.target_words = tuple(target_words) if target_words else None
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+
+    def score(self, candidates):
+        """
+        Score every candidate. Returns {"scores": (N,), "element_hits": (N, E)
+        bool, "character_mentions": (N, C), "words": (N,)} arrays.
+        """
+        texts = _lowered(candidates)
+        count = len(texts)
+        words = np.array([len(text.split()) for text in texts], dtype=np.int64)
+
+        if self.required_elements:
+            element_hits = np.char.find(texts[:, None], _lowered(self.required_elements)[None, :]) >= 0
+            element_score = element_hits.mean(axis=1)
+        else:
+            element_hits = np.zeros((count, 0), dtype=bool)
+            element_score = np.ones(count)
+
+        if self.characters:
+            mentions = np.char.count(texts[:, None], _lowered(self.characters)[None, :])
+            character_score = np.minimum(mentions / CHARACTER_MENTIONS, 1.0).mean(axis=1)
+        else:
+            mentions = np.zeros((count, 0), dtype=np.int64)
+            character_score = np.ones(count)
+
+        if self.target_words:
+            low, high = self.target_words
+            safe = np.maximum(words, 1)
+            length_score = np.where(words < low, words / low, np.where(words > high, high / safe, 1.0))
+        else:
+            length_score = np.ones(count)
+
+        scores = (self.weights["elements"] * element_score
+                  + self.weights["characters"] * character_score
+                  + self.weights["length"] * length_score)
+        return {"scores": scores, "element_hits": element_hits, "character_mentions": mentions, "words": words}
+
+    def missing(self, report, index):
+        """What candidate `index` of a score() report lacks, as readable messages."""
+        messages = [f"Required element '{term}' not referenced"
+                    for term, hit in zip(self.required_elements, report["element_hits"][index]) if not hit]
+        messages += [f"Main character {name} not prominently featured"
+                     for name, mentions in zip(self.characters, report["character_mentions"][index]) if not mentions]
+        return messages
+
+    def best(self, candidates):
+        """(index of the best candidate, score() report); earlier candidates win ties."""
+        report = self.score(candidates)
+        return int(np.argmax(report["scores"])), report
@@ -0,0 +1,236 @@
+"""
+Scene-aware streaming chunker for the RAG index.
+
+Chapter files are read line by line and split on their `## ` scene headings;
+each scene is cut into windows of at most `max_tokens` estimated tokens that
+end on paragraph (or, for very long paragraphs, sentence) boundaries, with the
+last `overlap_tokens` of a window repeated at the start of the next. Windows
+never cross a scene boundary, so a retrieved chunk always belongs to a single
+scene, and each one carries its chapter, part and scene from scenes.yaml.
+
+Every stage is a generator, so only the paragraphs of the window being built
+are held in memory however large the corpus is.
+"""
+
+import hashlib
+import os
+import re
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from src.graph.cluster import CHAPTER_NUMBER, parse_chapter_ranges
+from src.graph.context_ranker import estimate_tokens
+
+SCENE_HEADING = re.compile(r"^##\s+(.*?)\s*#*\s*$")
+# "# Chapter 3: ...", "### Chapter One: ...", "**Chapter 2: ...**"
+CHAPTER_TITLE = re.compile(r"^(?:#{1,6}\s*|\*\*)\s*(chapter\b.*?)\s*(?:\*\*)?\s*$", re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?…”\"])\s+")
+NUMBER_WORDS = {
+    word: number for number, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+        "fifteen sixteen seventeen eighteen nineteen twenty".split())
+}
+CHAPTER_WORD = re.compile(r"chapter[\s_-]*(" + "|".join(NUMBER_WORDS) + r")\b", re.IGNORECASE)
+
+# File metadata kept on each chunk but left out of the embedded and prompt text
+FILE_METADATA_KEYS = ["file_path", "file_name"]
+
+
+def chapter_number(*texts):
+    """First chapter number found in the given strings ("chapter_7", "Chapter Seven"), or None."""
+    for text in texts:
+        if not text:
+            continue
+        match = CHAPTER_NUMBER.search(text)
+        if match:
+            return int(match.group(1))
+        match = CHAPTER_WORD.search(text)
+        if match:
+            return NUMBER_WORDS[match.group(1).lower()]
+    return None
+
+
+def read_blocks(path):
+    """
+    Stream a chapter file as ("title" | "scene" | "paragraph", text) blocks:
+    the chapter title line, `## ` scene headings and blank-line separated paragraphs.
+    """
+    lines = []
+    seen_text = False
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            heading = SCENE_HEADING.match(line)
+            title = None if heading or seen_text else CHAPTER_TITLE.match(line)
+            if line and not (heading or title):
+                lines.append(line)
+                continue
+            if lines:
+                yield "paragraph", " ".join(lines)
+                lines = []
+                seen_text = True
+            if heading:
+                yield "scene", heading.group(1)
+                seen_text = True
+            elif title:
+                yield "title", title.group(1)
+    if lines:
+        yield "paragraph", " ".join(lines)
+
+
+def _pieces(paragraph, max_tokens):
+    """A paragraph, or its sentences (hard-cut if need be) when it exceeds max_tokens."""
+    if estimate_tokens(paragraph) <= max_tokens:
+        yield paragraph
+        return
+    max_chars = max_tokens * 4
+    for sentence in SENTENCE_END.split(paragraph):
+        for start in range(0, len(sentence), max_chars):
+            yield sentence[start:start + max_chars]
+
+
+def _overlap(window, budget):
+    """Trailing paragraphs of a window, then trailing sentences, within budget tokens."""
+    carried, used = [], 0
+    for paragraph in reversed(window):
+        tokens = estimate_tokens(paragraph)
+        if used + tokens <= budget:
+            carried.insert(0, paragraph)
+            used += tokens
+            continue
+        sentences = []
+        for sentence in reversed(SENTENCE_END.split(paragraph)):
+            tokens = estimate_tokens(sentence)
+            if used + tokens > budget:
+                break
+            sentences.insert(0, sentence)
+            used += tokens
+        if sentences:
+            carried.insert(0, " ".join(sentences))
+        break
+    return carried
+
+
+def token_windows(paragraphs, max_tokens=512, overlap_tokens=64):
+    """
+    Merge a stream of paragraphs into windows of at most max_tokens estimated
+    tokens; each window starts with the trailing paragraphs or sentences (up
+    to overlap_tokens) of the one before it.
+    """
+    window, used, fresh = [], 0, False
+    for paragraph in paragraphs:
+        for piece in _pieces(paragraph, max_tokens):
+            tokens = estimate_tokens(piece)
+            if fresh and used + tokens > max_tokens:
+                yield "\n\n".join(window)
+                window = _overlap(window, min(overlap_tokens, max_tokens - tokens))
+                used = sum(estimate_tokens(text) for text in window)
+            window.append(piece)
+            used += tokens
+            fresh = True
+    if fresh:
+        yield "\n\n".join(window)
+
+
+class SceneChunker:
+    def __init__(self, max_tokens=512, overlap_tokens=64, scenes_config=None):
+        """
+        Args:
+            max_tokens: Estimated tokens per chunk (see estimate_tokens)
+            overlap_tokens: Estimated tokens repeated from the end of the previous chunk
+            scenes_config: Parsed scenes.yaml; chapter, part and scene metadata
+                is looked up in it (default: load_scenes_config())
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        if scenes_config is None:
+            from src.ai.seed_prompt_loader import load_scenes_config
+            scenes_config = load_scenes_config()
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.parts = (scenes_config.get("novel_structure") or {}).get("parts") or {}
+        self.chapters = scenes_config.get("chapters") or {}
+        self._chapter_parts = parse_chapter_ranges(self.parts)
+
+    @property
+    def config(self):
+        """Settings that change the chunks produced (recorded in the index manifest)."""
+        return {"max_tokens": self.max_tokens, "overlap_tokens": self.overlap_tokens}
+
+    def chapter_metadata(self, chapter):
+        metadata = {"chapter": chapter}
+        if chapter is None:
+            return metadata
+        planned = self.chapters.get(f"chapter_{chapter}") or {}
+        part = planned.get("part") or self._chapter_parts.get(chapter)
+        if planned.get("title"):
+            metadata["planned_title"] = planned["title"]
+        if part:
+            metadata["part"] = part
+            metadata["part_title"] = (self.parts.get(part) or {}).get("title", part)
+        return metadata
+
+    def scene_metadata(self, chapter, scene, heading):
+        metadata = {"scene": scene}
+        if heading:
+            metadata["scene_title"] = heading
+        planned = ((self.chapters.get(f"chapter_{chapter}") or {}).get("scenes") or {}).get(f"scene_{scene}")
+        if planned and planned.get("setting"):
+            metadata["scene_setting"] = planned["setting"]
+        return metadata
+
+    def iter_nodes(self, path, doc_id=None):
+        """
+        Stream the chunks of one chapter file as TextNodes whose source
+        document is doc_id (default: the path).
+        """
+        doc_id = doc_id or path
+        blocks = read_blocks(path)
+        current = {"title": None, "scene": 0, "heading": None}
+        next_heading = []
+
+        def scene_paragraphs():
+            # Consumes blocks up to the next scene heading
+            for kind, text in blocks:
+                if kind == "paragraph":
+                    yield text
+                elif kind == "title":
+                    current["title"] = text
+                else:
+                    next_heading.append(text)
+                    return
+
+        file_metadata = {"file_path": os.path.abspath(path), "file_name": os.path.basename(path)}
+        chapter_metadata = None
+        position = 0
+        while True:
+            for text in token_windows(scene_paragraphs(), self.max_tokens, self.overlap_tokens):
+                if chapter_metadata is None:
+                    # The title line, when present, precedes the first paragraph
+                    chapter_metadata = self.chapter_metadata(
+                        chapter_number(os.path.basename(path), current["title"]))
+                    if current["title"]:
+                        chapter_metadata["chapter_title"] = current["title"]
+                metadata = dict(file_metadata, **chapter_metadata, **self.scene_metadata(
+                    chapter_metadata["chapter"], current["scene"], current["heading"]))
+                # Content-derived ids keep unchanged chunks stable across re-indexing
+                node_id = hashlib.sha256(f"{doc_id}\0{position}\0{text}".encode("utf-8")).hexdigest()[:32]
+                position += 1
+                yield TextNode(
+                    id_=node_id,
+                    text=text,
+                    metadata=metadata,
+                    excluded_embed_metadata_keys=list(FILE_METADATA_KEYS),
+                    excluded_llm_metadata_keys=list(FILE_METADATA_KEYS),
+                    relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)},
+                )
+            if not next_heading:
+                return
+            current["scene"] += 1
+            current["heading"] = next_heading.pop()
+
+    def iter_corpus(self, data_dir, relative_paths):
+        """Stream (relative path, node) for every chunk of the given files, file by file."""
+        for rel in relative_paths:
+            for node in self.iter_nodes(os.path.join(data_dir, rel), doc_id=rel):
+                yield rel, node
@@ -1,8 +1,306 @@
+"""
+Retrieval over the persisted llama-index index in data_index/.
+
+The index is loaded once per process and shared by every ContextBuilder that
+points at the same directory, together with one warm retriever per top_k.
+Before answering a query the builder stats the index files (at most every
+`check_interval` seconds); when `scripts/index_novel_documents.py` has written a
+new version, only the store files that changed are re-read and the index is
+rebuilt around the stores that did not.
+
+Dense results are fused with a BM25 index over the same chunks by reciprocal
+rank fusion, so exact names and objects that embeddings blur (e.g. "Yeats
+poetry books") still surface. The BM25 side is kept in step with the docstore
+by adding and removing only the chunks that changed.
+
+get_contexts() answers a list of queries at once: with the numpy store they
+are embedded in one call and scored with one matrix-matrix product.
+"""
+
+import os
+import threading
+import time
+
+from src.ai.embeddings import embed_queries
+from src.ai.index_storage import INDEX_DIR, load_index
+from src.ai.lexical_index import BM25Index
+from src.ai.vector_store import NumpyVectorStore
+
+# Persisted file -> StorageContext component it is loaded into
+STORE_FILES = {
+    "docstore.json": "docstore",
+    "index_store.json": "index_store",
+    "graph_store.json": "graph_store",
+}
+# Matches default__vector_store.json and NumpyVectorStore's .npy/.ids.json/.ivf.npz files
+VECTOR_STORE_MARK = "__vector_store."
+
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+
+# Absolute index directory -> _IndexHandle, shared across the process; the
+# lock only guards this dict, each handle has its own
+_INDEX_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _store_signatures(index_dir):
+    """Return {file name: (mtime_ns, size)} for the index files on disk."""
+    signatures = {}
+    try:
+        entries = list(os.scandir(index_dir))
+    except FileNotFoundError:
+        return signatures
+    for entry in entries:
+        if entry.name in STORE_FILES or (VECTOR_STORE_MARK in entry.name and not entry.name.endswith(".tmp")):
+            stat = entry.stat()
+            signatures[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return signatures
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it
+    appears in (rank starting at 1). Returns [(id, score)], best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+class _IndexHandle:
+    """
+    One loaded index version plus the stores, retrievers and BM25 index built
+    from it. A new version is read outside the handle's lock and swapped in
+    under it, so queries keep being answered from the current version while
+    the next one loads.
+    """
+
+    def __init__(self, index_dir, index=None):
+        self.index_dir = index_dir
+        self.index = None
+        self.signatures = {}
+        self.retrievers = {}
+        self.lexical = BM25Index()
+        self.checked_at = 0.0
+        self.version = 0
+        self.stats = {"loads": 0, "partial_reloads": 0, "stores_reused": 0,
+                      "chunks_added": 0, "chunks_removed": 0}
+        # Guards the current version and BM25 searches (which pack postings)
+        self.lock = threading.Lock()
+        # Held by the one thread loading the next version
+        self._refresh_lock = threading.Lock()
+        if index is not None:
+            self._install(index)
+
+    def refresh(self, check_interval):
+        """Load the index, or reload the parts of it whose files changed."""
+        if self.index_dir is None:
+            return
+        if self.index is not None:
+            if time.monotonic() - self.checked_at < check_interval:
+                return
+            # Another thread is already loading the next version; keep serving this one
+            if not self._refresh_lock.acquire(blocking=False):
+                return
+        else:
+            self._refresh_lock.acquire()
+        try:
+            self._refresh(check_interval)
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self, check_interval):
+        now = time.monotonic()
+        if self.index is not None and now - self.checked_at < check_interval:
+            return
+        self.checked_at = now
+        signatures = _store_signatures(self.index_dir)
+        if self.index is not None and signatures == self.signatures:
+            return
+        if not signatures:
+            raise FileNotFoundError(
+                f"No persisted index in {self.index_dir}; run scripts/index_novel_documents.py first"
+            )
+
+        reused = {}
+        current = self.index
+        if current is not None:
+            storage = current.storage_context
+            changed = {name for name in set(signatures) | set(self.signatures)
+                       if signatures.get(name) != self.signatures.get(name)}
+            for file_name, component in STORE_FILES.items():
+                if file_name not in changed:
+                    reused[component] = getattr(storage, component)
+            if not any(VECTOR_STORE_MARK in name for name in changed):
+                reused["vector_stores"] = dict(storage.vector_stores)
+
+        self._install(load_index(self.index_dir, **reused))
+        self.signatures = signatures
+        with self.lock:
+            if current is not None:
+                self.stats["partial_reloads"] += 1
+                self.stats["stores_reused"] += len(reused)
+            self.stats["loads"] += 1
+
+    def _install(self, index):
+        """Sync a copy of the BM25 index with a loaded index, then swap both in."""
+        docstore = index.docstore
+        chunks = {node_id: docstore.get_node(node_id).get_content()
+                  for node_id in index.index_struct.nodes_dict.values()}
+        with self.lock:
+            lexical = self.lexical.copy()
+        added, removed = lexical.sync(chunks)
+        with self.lock:
+            # Swap in one step so concurrent readers see either version, never a mix
+            self.index, self.retrievers, self.lexical = index, {}, lexical
+            self.version += 1
+            self.stats["chunks_added"] += added
+            self.stats["chunks_removed"] += removed
+
+    def retriever(self, top_k, nprobe=None):
+        key = (top_k, nprobe)
+        retriever = self.retrievers.get(key)
+        if retriever is None:
+            store_kwargs = {} if nprobe is None else {"nprobe": nprobe}
+            retriever = self.retrievers[key] = self.index.as_retriever(
+                similarity_top_k=top_k, vector_store_kwargs=store_kwargs)
+        return retriever
+
+
+def _handle_for(index_dir):
+    key = os.path.abspath(index_dir)
+    with _CACHE_LOCK:
+        handle = _INDEX_CACHE.get(key)
+        if handle is None:
+            handle = _INDEX_CACHE[key] = _IndexHandle(key)
+        return handle
+
+
+def clear_index_cache():
+    """Forget every loaded index, e.g. after deleting data_index/."""
+    with _CACHE_LOCK:
+        _INDEX_CACHE.clear()
+
+
 class ContextBuilder:
-    def __init__(self, index):
+    def __init__(self, index=None, index_dir=INDEX_DIR, top_k=4, check_interval=2.0,
+                 mode="hybrid", candidates=None, rrf_k=60, nprobe=None):
+        """
+        Args:
+            index: An already-loaded index to query; when None the persisted
+                index in index_dir is loaded once per process and kept warm
+            index_dir: Directory written by scripts/index_novel_documents.py
+            top_k: Default number of chunks returned per query
+            check_interval: Seconds between checks for a new index version
+            mode: "hybrid" (BM25 and vector results fused by reciprocal rank),
+                "vector" or "lexical"
+            candidates: Results taken from each side before fusion (default 4 * top_k)
+            rrf_k: Reciprocal rank fusion constant; larger values flatten rank differences
+            nprobe: IVF lists scanned when the index was built with --ann
+                (None = the index default, 0 = exact search)
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
         self.index = index
+        self.index_dir = index_dir
+        self.top_k = top_k
+        self.check_interval = check_interval
+        self.mode = mode
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.nprobe = nprobe
+        self._handle = _IndexHandle(None, index) if index is not None else _handle_for(index_dir)
+
+    @property
+    def stats(self):
+        """Load and BM25 sync counters of the index this builder reads."""
+        with self._handle.lock:
+            return dict(self._handle.stats)
+
+    def _resolve(self, top_k, mode):
+        top_k = top_k or self.top_k
+        mode = mode or self.mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        depth = top_k if mode != "hybrid" else (self.candidates or 4 * top_k)
+        return top_k, mode, depth
+
+    def _results(self, index, mode, dense, lexical, nodes, top_k):
+        """Rank one query's dense and lexical hits and materialise the top_k chunks."""
+        if mode == "vector":
+            ranked = dense
+        elif mode == "lexical":
+            ranked = lexical
+        else:
+            ranked = reciprocal_rank_fusion([[i for i, _ in dense], [i for i, _ in lexical]], k=self.rrf_k)
+
+        results = []
+        for node_id, score in ranked[:top_k]:
+            node = nodes.get(node_id) or index.docstore.get_node(node_id)
+            results.append({
+                "id": node_id,
+                "text": node.get_content(),
+                "score": score,
+                "metadata": dict(node.metadata),
+            })
+        return results
+
+    def get_context(self, query, top_k=None, mode=None):
+        """
+        Return the chunks most relevant to the query, best first, as a list of
+        {"id", "text", "score", "metadata"} dicts. In hybrid mode the score is
+        the fused reciprocal-rank score; otherwise it is the similarity or BM25 score.
+        """
+        top_k, mode, depth = self._resolve(top_k, mode)
+        handle = self._handle
+        handle.refresh(self.check_interval)
+        with handle.lock:
+            index = handle.index
+            retriever = handle.retriever(depth, self.nprobe) if mode != "lexical" else None
+            lexical = handle.lexical.search(query, depth) if mode != "vector" else []
+
+        nodes = {}
+        dense = []
+        if retriever is not None:
+            for result in retriever.retrieve(query):
+                nodes[result.node.node_id] = result.node
+                dense.append((result.node.node_id, result.score))
+        return self._results(index, mode, dense, lexical, nodes, top_k)
+
+    def get_contexts(self, queries, top_k=None, mode=None):
+        """
+        get_context() for a list of queries (e.g. every scene outline of a
+        part), returning one result list per query. With the numpy vector
+        store the queries are embedded in one call and scored together with a
+        single matrix-matrix product instead of one retrieval per query.
+        """
+        queries = list(queries)
+        top_k, mode, depth = self._resolve(top_k, mode)
+        handle = self._handle
+        handle.refresh(self.check_interval)
+        with handle.lock:
+            index = handle.index
+            store = index.vector_store
+            batched = mode != "lexical" and isinstance(store, NumpyVectorStore)
+            retriever = handle.retriever(depth, self.nprobe) if mode != "lexical" and not batched else None
+            lexical = [handle.lexical.search(query, depth) if mode != "vector" else [] for query in queries]
 
-    def get_context(self, query):
-        # Placeholder: In the future, use llama-index to retrieve relevant docs
-        print(f"Retrieving context for: {query}")
-        return []
+        if not queries:
+            return []
+        if batched:
+            embeddings = embed_queries(index._embed_model, queries)
+            dense = [list(zip(ids, similarities))
+                     for ids, similarities in store.query_batch(embeddings, depth, self.nprobe)]
+        else:
+            dense = [[] for _ in queries]
+        results = []
+        for query, query_dense, query_lexical in zip(queries, dense, lexical):
+            nodes = {}
+            if retriever is not None:
+                for result in retriever.retrieve(query):
+                    nodes[result.node.node_id] = result.node
+                    query_dense.append((result.node.node_id, result.score))
+            results.append(self._results(index, mode, query_dense, query_lexical, nodes, top_k))
+        return results
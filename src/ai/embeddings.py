@@ -0,0 +1,212 @@
+"""
+Embedding models for the RAG index.
+
+CachedEmbedding wraps any llama-index embedding model with a content-addressed
+SQLite cache keyed by (model, SHA-256 of the text), so re-indexing unchanged
+chunks, or rebuilding after refresh_all.py, never pays for the same embedding
+twice. HashingEmbedding is a deterministic local model built from hashed word
+and character n-gram features: it needs no network or API key, which makes
+indexing and retrieval reproducible in benchmarks and offline runs.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# Kept outside data_index/ so it survives refresh_all.py and full rebuilds
+EMBEDDING_CACHE_PATH = PROJECT_ROOT / "embedding_cache" / "embeddings.sqlite"
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedding(BaseEmbedding):
+    """Signed feature hashing of word unigrams, word bigrams and character trigrams."""
+
+    embed_dim: int = 384
+
+    def __init__(self, embed_dim=384, **kwargs):
+        super().__init__(embed_dim=embed_dim, model_name=f"hashing-{embed_dim}", **kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "HashingEmbedding"
+
+    def _features(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text):
+        # crc32 rather than hash(): Python string hashing is salted per process
+        codes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in self._features(text)), dtype=np.uint32)
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        if codes.size:
+            signs = np.where(codes & 0x80000000, -1.0, 1.0)
+            vector = np.bincount(codes % self.embed_dim, weights=signs, minlength=self.embed_dim)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+        return vector.astype(np.float32).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self.embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed(text)
+
+    def get_query_embedding_batch(self, queries):
+        return [self.embed(query) for query in queries]
+
+
+class EmbeddingCache:
+    """SQLite table of float32 embeddings keyed by model and text hash."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+
+    @staticmethod
+    def key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: embedding list} for the keys present in the cache."""
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Consult the EmbeddingCache before calling the wrapped model."""
+
+    _inner: Any = PrivateAttr()
+    _cache: Any = PrivateAttr()
+    _stats: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, inner, cache=None, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._cache = cache if cache is not None else EmbeddingCache()
+        self.reset_stats()
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def inner(self):
+        return self._inner
+
+    @property
+    def stats(self):
+        """{"hits", "misses", "hit_rate"} since the last reset_stats()."""
+        total = self._stats["hits"] + self._stats["misses"]
+        return dict(self._stats, hit_rate=self._stats["hits"] / total if total else 0.0)
+
+    def reset_stats(self):
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _cached(self, texts, compute, kind):
+        keys = [self._cache.key(f"{self.model_name}:{kind}", text) for text in texts]
+        found = self._cache.get_many(list(dict.fromkeys(keys)))
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        self._stats["hits"] += len(texts) - len(missing)
+        self._stats["misses"] += len(missing)
+        if missing:
+            computed = compute([texts[i] for i in missing])
+            fresh = {keys[i]: vector for i, vector in zip(missing, computed)}
+            self._cache.put_many(fresh.items())
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._cached([query], lambda qs: [self._inner.get_query_embedding(q) for q in qs], "query")[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._cached(texts, self._inner.get_text_embedding_batch, "text")
+
+    def get_query_embedding_batch(self, queries):
+        return self._cached(list(queries), lambda qs: embed_queries(self._inner, qs), "query")
+
+
+def embed_queries(model, queries):
+    """Embed several queries, in one request when the model allows it."""
+    queries = list(queries)
+    batch = getattr(model, "get_query_embedding_batch", None)
+    if batch is not None:
+        return batch(queries)
+    # OpenAIEmbedding uses one engine for queries and texts with the
+    # text-embedding-3 models, so the texts endpoint batches them
+    query_engine = getattr(model, "_query_engine", None)
+    if query_engine is not None and query_engine == getattr(model, "_text_engine", None):
+        return model.get_text_embedding_batch(queries)
+    return [model.get_query_embedding(query) for query in queries]
+
+
+def get_embed_model(name="openai", cache=True, cache_path=EMBEDDING_CACHE_PATH):
+    """
+    Args:
+        name: "openai" (llama-index OpenAIEmbedding), an OpenAI model name such
+            as "text-embedding-3-small", or "hashing" / "hashing-<dim>"
+        cache: Wrap the model in CachedEmbedding
+    """
+    if name == "openai" or name.startswith("text-embedding"):
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        model = OpenAIEmbedding() if name == "openai" else OpenAIEmbedding(model=name)
+    elif name.startswith("hashing"):
+        dim = name.partition("-")[2]
+        model = HashingEmbedding(embed_dim=int(dim)) if dim else HashingEmbedding()
+    else:
+        raise ValueError(f"Unknown embedding model: {name}")
+    return CachedEmbedding(model, EmbeddingCache(cache_path)) if cache else model
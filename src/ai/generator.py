@@ -1,22 +1,257 @@
 
+import asyncio
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
 from typing import Any, Dict, List
 
-import openai
-
+from src.ai.candidate_scorer import CandidateScorer
+from src.ai.llm_client import get_llm_client
 from src.ai.prompt_builder import PromptBuilder
-from src.ai.seed_prompt_loader import load_seed_data
+from src.ai.seed_prompt_loader import load_scenes_config, load_seed_data
+from src.ai.telemetry import current_tags, get_telemetry, telemetry_tags
+from src.graph.cluster import CHAPTER_NUMBER
+from src.graph.context_ranker import estimate_tokens
+from src.graph.entity_linker import EntityLinker
+
+NOVEL_DIR = os.path.join("data", "novel")
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+# Kept outside data/ so recorded completions survive refresh_all.py
+COMPLETION_CACHE_PATH = PROJECT_ROOT / "llm_cache" / "completions.sqlite"
+COMPLETION_CACHE_MODES = ("bypass", "record", "replay")
+DEFAULT_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "bypass").lower()
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+DEFAULT_STREAM = os.environ.get("LLM_STREAM", "false").lower() == "true"
+# Continuity revisions should change as little as the reconciliation needs
+REVISION_TEMPERATURE = 0.4
+# Completion limits of one scene, and of a rewritten scene opening, in scene fan-out
+SCENE_MAX_TOKENS = 1000
+TRANSITION_MAX_TOKENS = 300
+# Planned outlines (src/ai/novel_planner.py) are just "Chapter N"
+PLANNED_OUTLINE = re.compile(r"chapter\s+(\d+)", re.IGNORECASE)
+
+
+def _usage(response):
+    usage = getattr(response, "usage", None)
+    return usage.model_dump() if usage is not None else None
+
+
+class CompletionCacheMiss(RuntimeError):
+    """Replay mode found no recorded completion for a prompt."""
+
+
+class CompletionCache:
+    """
+    SQLite table of chat completions keyed by a hash of the model, sampling
+    parameters and messages. Entries are evicted least recently used first
+    once their total size exceeds max_bytes.
+    """
+
+    def __init__(self, path=COMPLETION_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, entry TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS completions_lru ON completions (last_used)")
+        self.reset_stats()
+
+    @staticmethod
+    def key(params):
+        """Hash of everything that determines the completion; streaming flags are ignored."""
+        relevant = {name: value for name, value in params.items() if name not in ("stream", "stream_options")}
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @property
+    def stats(self):
+        """{"hits", "misses", "hit_rate"} since the last reset_stats()."""
+        total = self._stats["hits"] + self._stats["misses"]
+        return dict(self._stats, hit_rate=self._stats["hits"] / total if total else 0.0)
+
+    def reset_stats(self):
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, params):
+        """The recorded {"content", "model", "usage"} entry for these parameters, or None."""
+        key = self.key(params)
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT entry FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._stats["hits" if row is not None else "misses"] += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, params, content, usage=None):
+        entry = json.dumps({"content": content, "model": params.get("model"), "usage": usage})
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions (key, entry, size, last_used) VALUES (?, ?, ?, ?)",
+                (self.key(params), entry, len(entry.encode("utf-8")), time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in self._connection.execute("SELECT key, size FROM completions ORDER BY last_used"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._connection.executemany("DELETE FROM completions WHERE key = ?", stale)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def nbytes(self):
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+class StreamingChapterWriter:
+    """
+    Appends streamed completion text to `<chapter>.part` as it arrives and
+    renames it over the chapter file once the stream completes, so a partial
+    chapter is visible while it is written and survives a crash, and readers
+    never see a half-written chapter_*.md. Leading and trailing whitespace is
+    stripped, as for a buffered completion.
+    """
+
+    def __init__(self, path, started=None):
+        self.path = path
+        self.tmp_path = f"{path}.part"
+        self.started = started if started is not None else time.perf_counter()
+        self.first_token_at = None
+        self.deltas = 0
+        self.usage = None
+        self._parts = []
+        self._pending = ""
+        self._handle = open(self.tmp_path, "w", encoding="utf-8")
+
+    def add_chunk(self, chunk):
+        """Consume one chat.completion.chunk."""
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            if choice.delta.content:
+                self.write(choice.delta.content)
+
+    def write(self, text):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.deltas += 1
+        if not self._parts:
+            text = text.lstrip()
+        # Hold trailing whitespace back until more text follows it
+        text = self._pending + text
+        body = text.rstrip()
+        self._pending = text[len(body):]
+        if body:
+            self._parts.append(body)
+            self._handle.write(body)
+            self._handle.flush()
+
+    def finish(self):
+        """Move the completed file into place; returns (content, stats)."""
+        finished = time.perf_counter()
+        self._handle.close()
+        os.replace(self.tmp_path, self.path)
+        tokens = self.usage["completion_tokens"] if self.usage else self.deltas
+        first = self.first_token_at if self.first_token_at is not None else finished
+        stats = {
+            "ttft": first - self.started,
+            "duration": finished - self.started,
+            "completion_tokens": tokens,
+            "tokens_per_second": tokens / (finished - first) if finished > first else 0.0,
+            "prompt_tokens": self.usage["prompt_tokens"] if self.usage else None,
+        }
+        return "".join(self._parts), stats
+
+    def abort(self):
+        """Close the file, leaving the partial text in `<chapter>.part`."""
+        self._handle.close()
 
 
 class ChapterGenerator:
-    def __init__(self, graph):
+    def __init__(self, graph, output_dir=NOVEL_DIR, semaphore=None, max_retries=None,
+                 stream=None, cache_mode=None, completion_cache=None, llm_client=None, timeout=None,
+                 best_of=None, novel_id=None):
+        """
+        Args:
+            graph: StoryGraph the chapters are added to
+            output_dir: Directory chapter_*.md files are written to
+            semaphore: asyncio.Semaphore bounding agenerate_chapter requests in
+                flight (default: the shared client's, LLM_MAX_CONCURRENCY)
+            max_retries: Retries of a 429/5xx/connection failure (default: the client's)
+            stream: Stream completions into the chapter file as they arrive and
+                record time to first token and tokens/s in stream_stats
+                (default: LLM_STREAM)
+            cache_mode: "bypass" (never use the completion cache), "record"
+                (serve recorded completions, call the API and record on a miss)
+                or "replay" (serve recorded completions only; a miss raises
+                CompletionCacheMiss). Default: LLM_CACHE_MODE, else "bypass"
+            completion_cache: CompletionCache to use (default: llm_cache/completions.sqlite)
+            llm_client: LLMClient to call (default: the process-wide get_llm_client(),
+                whose connection pool and rate limits every generator shares)
+            timeout: Per-call timeout in seconds (default: the client's, LLM_TIMEOUT)
+            best_of: Candidates requested per chapter in one call (n=best_of);
+                the one scoring best on required elements, main characters and
+                validation.target_words is kept (default: validation.best_of, else 1).
+                Chapters chosen this way are not streamed.
+            novel_id: Tag on this generator's telemetry events (default: the
+                output directory's name)
+        """
         self.graph = graph
+        self.output_dir = output_dir
+        self.novel_id = novel_id or os.path.basename(os.path.abspath(output_dir))
+        self.semaphore = semaphore
+        self.max_retries = max_retries
+        self.llm_client = llm_client
+        self.timeout = timeout
+        self.stream = DEFAULT_STREAM if stream is None else stream
+        self.cache_mode = (cache_mode or DEFAULT_CACHE_MODE).lower()
+        if self.cache_mode not in COMPLETION_CACHE_MODES:
+            raise ValueError(f"Unknown completion cache mode: {self.cache_mode}")
+        if completion_cache is None and self.cache_mode != "bypass":
+            completion_cache = CompletionCache()
+        self.completion_cache = completion_cache
+        # One {"chapter", "ttft", "duration", "completion_tokens", "tokens_per_second"} per streamed chapter
+        self.stream_stats = []
         self.use_placeholder = (
             os.environ.get("USE_PLACEHOLDER_LLM", "false").lower() == "true"
         )
         self.seed_data = load_seed_data()
         self.first_chapter_generated = False
         self.prompt_builder = PromptBuilder()
+        # Links characters, locations and objects named in each chapter to its scene node
+        self.entity_linker = EntityLinker(self.seed_data)
+        self.graph.entity_linker = self.entity_linker
+        # Story graph retrieval settings (mode, token budget, weights) from structure.yaml
+        retrieval_config = dict(self.prompt_builder.structure_config.get('retrieval', {}))
+        if retrieval_config.get('cluster_by') == 'part':
+            retrieval_config['parts'] = load_scenes_config().get('novel_structure', {}).get('parts', {})
+        if retrieval_config:
+            self.graph.configure_context(**retrieval_config)
+        self.validation = self.prompt_builder.structure_config.get('validation', {})
+        self.best_of = max(1, int(best_of or self.validation.get('best_of', 1)))
 
     def _validate_chapter_content(self, content: str, seed_data: Dict[str, Any]) -> List[str]:
         """Check if generated content includes key elements."""
@@ -40,14 +275,19 @@ class ChapterGenerator:
 
 
 
-    def generate_chapter(self, chapter_outline):
+    def _is_first_chapter(self):
+        # A graph loaded from disk may already hold scenes from earlier runs
+        return not self.first_chapter_generated and not self.graph.find_nodes(node_type="scene")
+
+    def _build_chapter_prompt(self, chapter_outline, instructions=None):
         # Build prompt using generic prompt builder
-        if not self.first_chapter_generated:
+        if self._is_first_chapter():
             # First chapter: use only seed data
             prompt_dict = self.prompt_builder.build_prompt(
                 chapter_outline=chapter_outline,
                 seed_data=self.seed_data,
-                is_first_chapter=True
+                is_first_chapter=True,
+                additional_instructions=instructions
             )
             self.first_chapter_generated = True
         else:
@@ -57,28 +297,358 @@ class ChapterGenerator:
                 chapter_outline=chapter_outline,
                 seed_data=self.seed_data,
                 rag_context=rag_context,
-                is_first_chapter=False
+                is_first_chapter=False,
+                additional_instructions=instructions
             )
+        self._report_prompt_tokens(chapter_outline, prompt_dict.get("token_counts"))
+        return prompt_dict
+
+    def _report_prompt_tokens(self, chapter_outline, token_counts):
+        if not token_counts:
+            return
+        sections = ", ".join(f"{name} {tokens}" for name, tokens in token_counts["sections"].items() if tokens)
+        trimmed = ", ".join(f"{name} -{tokens}" for name, tokens in token_counts["trimmed"].items())
+        print(f"[PROMPT] {chapter_outline}: {token_counts['total']}/{token_counts['budget']} tokens"
+              f"{'' if token_counts['exact'] else ' (estimated)'} - system {token_counts['system']}, {sections}"
+              + (f"; trimmed {trimmed}" if trimmed else ""))
+        telemetry = get_telemetry()
+        if telemetry is not None:
+            telemetry.emit("prompt_budget", **token_counts)
+
+    def _completion_params(self, prompt_dict):
+        return {
+            "model": os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
+            "messages": [
+                {"role": "system", "content": prompt_dict["system"]},
+                {"role": "user", "content": prompt_dict["user"]},
+            ],
+            "max_tokens": 1500,  # Adjust as needed
+            "temperature": 0.8,
+        }
+
+    def _placeholder_content(self, chapter_outline, prompt_dict):
+        print(f"[PLACEHOLDER] Generating chapter for outline: {chapter_outline}")
+        return f"Placeholder content for: {chapter_outline}\n\nPrompt used:\n{prompt_dict['user']}"
+
+    def _chapter_path(self, chapter_outline):
+        # chapter_5.md for "Chapter 5" rather than chapter_chapter_5.md
+        match = PLANNED_OUTLINE.fullmatch(chapter_outline.strip())
+        name = match.group(1) if match else chapter_outline.replace(' ', '_').lower()
+        return os.path.join(self.output_dir, f"chapter_{name}.md")
+
+    def _save_chapter(self, chapter_outline, generated_content, written=False):
+        filename = self._chapter_path(chapter_outline)
+        if not written:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(generated_content)
+
+        scene_node = self.graph.add_node("scene", chapter_outline, generated_content)
+        mentions = self.entity_linker.link(self.graph, scene_node)
+        if mentions:
+            print("Linked entities: " + ", ".join(f"{name} ({count})" for name, count in mentions.items()))
+        return filename
+
+    def _record_stream(self, chapter_outline, stats):
+        self.stream_stats.append(dict(stats, chapter=chapter_outline))
+        print(f"[OPENAI] Streamed {stats['completion_tokens']} tokens: first token after {stats['ttft']:.2f}s, "
+              f"{stats['tokens_per_second']:.1f} tokens/s")
+
+    def _stream_params(self, params):
+        return dict(params, stream=True, stream_options={"include_usage": True})
+
+    def _cached_completion(self, chapter_outline, params):
+        """Recorded completion text for these parameters, or None when it must be generated."""
+        if self.cache_mode == "bypass" or self.completion_cache is None:
+            return None
+        entry = self.completion_cache.get(params)
+        if entry is not None:
+            print(f"[CACHE] Replaying recorded completion for outline: {chapter_outline}")
+            telemetry = get_telemetry()
+            if telemetry is not None:
+                telemetry.emit("cache_hit", usage=entry.get("usage"))
+            return entry["content"]
+        if self.cache_mode == "replay":
+            raise CompletionCacheMiss(f"No recorded completion for outline: {chapter_outline}")
+        return None
+
+    def _record_completion(self, params, content, usage=None):
+        if self.cache_mode == "record" and self.completion_cache is not None:
+            self.completion_cache.put(params, content, usage)
+
+    def _telemetry_tags(self, chapter_outline, kind):
+        """
+        Tag the LLM calls made for chapter_outline with the novel id, chapter
+        number and kind of call. An outline without a number keeps the chapter
+        of an enclosing telemetry_tags() block, if any.
+        """
+        match = CHAPTER_NUMBER.search(chapter_outline)
+        chapter = int(match.group(1)) if match else current_tags().get("chapter")
+        return telemetry_tags(novel_id=self.novel_id, chapter=chapter, outline=chapter_outline, kind=kind)
+
+    @property
+    def llm(self):
+        return self.llm_client or get_llm_client()
+
+    def _call_options(self):
+        return {"timeout": self.timeout, "max_retries": self.max_retries}
+
+    @property
+    def selects_candidates(self):
+        """Whether chapters are chosen from best_of > 1 scored candidates."""
+        return self.best_of > 1
+
+    def _candidate_scorer(self, is_first_chapter):
+        requirements = self.prompt_builder.structure_config.get('chapter_requirements', {})
+        chapter_config = requirements.get('first_chapter' if is_first_chapter else 'subsequent_chapters', {})
+        characters = [
+            char.get('name', '') for char in (self.seed_data.get('characters') or {}).get('characters', [])
+            if char.get('role', '') in ['Protagonist', 'Deuteragonist']
+        ]
+        return CandidateScorer(chapter_config.get('required_elements', []), characters,
+                               self.validation.get('target_words'))
+
+    def _report_candidates(self, chapter_outline, stream):
+        print(f"[OPENAI] Generating {self.best_of} candidates for outline: {chapter_outline}")
+        if stream:
+            print(f"[BEST-OF] Not streaming: the {self.best_of} candidates are scored once they are complete")
+
+    def _candidate_params(self, params):
+        return dict(params, n=self.best_of)
+
+    def _choose_candidate(self, chapter_outline, params, is_first_chapter, response, reserved):
+        """Score the choices of one n=best_of response and record the best one with the call's usage."""
+        usage = _usage(response)
+        self.llm.settle(reserved, usage)
+        candidates = [choice.message.content.strip() for choice in response.choices if choice.message.content]
+        if not candidates:
+            raise RuntimeError("The completion returned no content")
+        scorer = self._candidate_scorer(is_first_chapter)
+        index, report = scorer.best(candidates)
+        print(f"[BEST-OF] Kept 1 of {len(candidates)} candidates for outline: {chapter_outline} "
+              f"(score {report['scores'][index]:.2f})")
+        missing = scorer.missing(report, index)
+        if missing and self.validation.get('missing_element_severity', 'warning') != 'ignore':
+            print("[BEST-OF] Still missing: " + "; ".join(missing))
+        self._record_completion(params, candidates[index], usage)
+        return candidates[index]
+
+    def _prepare_request(self, chapter_outline, stream, instructions):
+        """
+        Build a chapter's prompt and decide how it is produced. Returns a dict
+        with the completion "params" (the cache key), the "call_params" sent to
+        the API and the call's "mode": "candidates", "stream" or "single", or
+        None when the chapter's "content" needs no call (placeholder or
+        recorded completion).
+        """
+        stream = self.stream if stream is None else stream
+        is_first_chapter = self._is_first_chapter()
+        prompt_dict = self._build_chapter_prompt(chapter_outline, instructions)
+        params = self._completion_params(prompt_dict)
+        if self.selects_candidates:
+            params = self._candidate_params(params)
+        request = {"params": params, "call_params": params, "mode": None, "is_first_chapter": is_first_chapter}
 
         if self.use_placeholder:
-            print(f"[PLACEHOLDER] Generating chapter for outline: {chapter_outline}")
-            generated_content = f"Placeholder content for: {chapter_outline}\n\nPrompt used:\n{prompt_dict['user']}"
+            request["content"] = self._placeholder_content(chapter_outline, prompt_dict)
+            return request
+        request["content"] = self._cached_completion(chapter_outline, params)
+        if request["content"] is not None:
+            return request
+
+        if self.selects_candidates:
+            self._report_candidates(chapter_outline, stream)
+            request["mode"] = "candidates"
+        elif stream:
+            print(f"[OPENAI] Streaming chapter for outline: {chapter_outline}")
+            request["mode"] = "stream"
+            request["call_params"] = self._stream_params(params)
         else:
             print(f"[OPENAI] Generating chapter for outline: {chapter_outline}")
-            openai.api_key = os.environ["OPENAI_API_KEY"]
-            response = openai.chat.completions.create(
-                model=os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
-                messages=[
-                    {"role": "system", "content": prompt_dict["system"]},
-                    {"role": "user", "content": prompt_dict["user"]},
-                ],
-                max_tokens=1500,  # Adjust as needed
-                temperature=0.8,
-            )
-            generated_content = response.choices[0].message.content.strip()
+            request["mode"] = "single"
+        return request
 
-        filename = os.path.join("data", "novel", f"chapter_{chapter_outline.replace(' ', '_').lower()}.md")
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(generated_content)
+    def _stream_writer(self, chapter_outline):
+        """Factory of StreamingChapterWriters for one chapter, timed from now."""
+        path = self._chapter_path(chapter_outline)
+        started = time.perf_counter()
+        return lambda: StreamingChapterWriter(path, started)
+
+    def _finish_chapter(self, chapter_outline, request, result, reserved):
+        """Settle the call's tokens, record its completion and save the chapter."""
+        params = request["params"]
+        if request["mode"] == "stream":
+            generated_content, stats = result
+            self._record_stream(chapter_outline, stats)
+            usage = {"prompt_tokens": stats["prompt_tokens"], "completion_tokens": stats["completion_tokens"]}
+            self.llm.settle(reserved, usage)
+            self._record_completion(params, generated_content, usage)
+            return self._save_chapter(chapter_outline, generated_content, written=True)
+        if request["mode"] == "candidates":
+            generated_content = self._choose_candidate(chapter_outline, params, request["is_first_chapter"],
+                                                       result, reserved)
+        else:
+            generated_content = result.choices[0].message.content.strip()
+            self.llm.settle(reserved, _usage(result))
+            self._record_completion(params, generated_content, _usage(result))
+        return self._save_chapter(chapter_outline, generated_content)
+
+    def generate_chapter(self, chapter_outline, stream=None, instructions=None):
+        """
+        Generate and save one chapter. instructions (e.g. a chapter brief
+        from src/ai/novel_planner.py) are appended to the prompt's task.
+        """
+        with self._telemetry_tags(chapter_outline, "chapter"):
+            return self._generate_chapter(chapter_outline, stream, instructions)
+
+    def _generate_chapter(self, chapter_outline, stream, instructions):
+        request = self._prepare_request(chapter_outline, stream, instructions)
+        if request["mode"] is None:
+            return self._save_chapter(chapter_outline, request["content"])
+        consume = None
+        if request["mode"] == "stream":
+            new_writer = self._stream_writer(chapter_outline)
+
+            def consume(response):
+                # A retried request starts the .part file over
+                writer = new_writer()
+                try:
+                    for chunk in response:
+                        writer.add_chunk(chunk)
+                except BaseException:
+                    writer.abort()
+                    raise
+                return writer.finish()
 
-        self.graph.add_node("scene", chapter_outline, generated_content)
\ No newline at end of file
+        result, reserved = self.llm.complete(request["call_params"], consume, **self._call_options())
+        return self._finish_chapter(chapter_outline, request, result, reserved)
+
+    async def agenerate_chapter(self, chapter_outline, stream=None, instructions=None):
+        """
+        generate_chapter() on the async OpenAI client. Requests in flight are
+        bounded by the generator's semaphore, so many novels can be generated
+        concurrently in one process; 429 and 5xx responses are retried with
+        jittered exponential backoff.
+        """
+        with self._telemetry_tags(chapter_outline, "chapter"):
+            return await self._agenerate_chapter(chapter_outline, stream, instructions)
+
+    async def _agenerate_chapter(self, chapter_outline, stream, instructions):
+        request = self._prepare_request(chapter_outline, stream, instructions)
+        if request["mode"] is None:
+            return self._save_chapter(chapter_outline, request["content"])
+        consume = None
+        if request["mode"] == "stream":
+            new_writer = self._stream_writer(chapter_outline)
+
+            async def consume(response):
+                # A retried request starts the .part file over
+                writer = new_writer()
+                try:
+                    async for chunk in response:
+                        writer.add_chunk(chunk)
+                except BaseException:
+                    writer.abort()
+                    raise
+                return writer.finish()
+
+        result, reserved = await self.llm.acomplete(request["call_params"], consume, semaphore=self.semaphore,
+                                                    **self._call_options())
+        return self._finish_chapter(chapter_outline, request, result, reserved)
+
+    async def _acomplete_text(self, chapter_outline, label, params, kind):
+        """Completion text for params, from the completion cache or the shared async client."""
+        with self._telemetry_tags(chapter_outline, kind):
+            cached = self._cached_completion(label, params)
+            if cached is not None:
+                return cached
+            response, reserved = await self.llm.acomplete(params, semaphore=self.semaphore, **self._call_options())
+        content = response.choices[0].message.content.strip()
+        self.llm.settle(reserved, _usage(response))
+        self._record_completion(params, content, _usage(response))
+        return content
+
+    async def _asmooth_transition(self, chapter_outline, label, previous, scene_text):
+        """scene_text with its opening paragraph rewritten to follow on from the previous scene."""
+        opening, _, rest = scene_text.partition("\n\n")
+        if not rest:
+            # A single-paragraph scene would be replaced wholesale
+            return scene_text
+        prompt_dict = self.prompt_builder.build_transition_prompt(previous.rsplit("\n\n", 1)[-1], opening)
+        params = dict(self._completion_params(prompt_dict), max_tokens=TRANSITION_MAX_TOKENS,
+                      temperature=REVISION_TEMPERATURE)
+        rewritten = await self._acomplete_text(chapter_outline, label, params, "transition")
+        return f"{rewritten}\n\n{rest}" if rewritten else scene_text
+
+    async def agenerate_scenes(self, chapter_outline, scenes, instructions=None, smooth=True):
+        """
+        Scene fan-out: write a chapter's scenes concurrently, one request per
+        scene (each up to SCENE_MAX_TOKENS, so a chapter can run longer than
+        one completion), all sharing the chapter prompt as context. With
+        smooth, the opening paragraph of every scene after the first is then
+        rewritten, again concurrently, to follow on from the scene before it.
+        The scenes are saved in order under `## <setting>` headings.
+
+        Args:
+            chapter_outline: The chapter outline, as for generate_chapter()
+            scenes: [{"scene", "setting", "brief"}] in order (see
+                src/ai/novel_planner.py scene_plans())
+            instructions: Chapter-level instructions added to the shared prompt
+            smooth: Rewrite scene openings so consecutive scenes join up
+        """
+        chapter_prompt = self._build_chapter_prompt(chapter_outline, instructions)
+        labels = [f"{chapter_outline}, scene {plan['scene']}" for plan in scenes]
+        prompts = [
+            self.prompt_builder.build_scene_prompt(
+                chapter_prompt, plan["brief"], position + 1, len(scenes),
+                scenes[position - 1]["brief"] if position else None,
+                scenes[position + 1]["brief"] if position + 1 < len(scenes) else None)
+            for position, plan in enumerate(scenes)
+        ]
+
+        if self.use_placeholder:
+            texts = [self._placeholder_content(label, prompt) for label, prompt in zip(labels, prompts)]
+        else:
+            print(f"[OPENAI] Generating {len(scenes)} scenes concurrently for outline: {chapter_outline}")
+            texts = list(await asyncio.gather(*(
+                self._acomplete_text(chapter_outline, label,
+                                     dict(self._completion_params(prompt), max_tokens=SCENE_MAX_TOKENS), "scene")
+                for label, prompt in zip(labels, prompts))))
+            if smooth and len(texts) > 1:
+                texts[1:] = await asyncio.gather(*(
+                    self._asmooth_transition(chapter_outline, f"{label}, transition", previous, text)
+                    for label, previous, text in zip(labels[1:], texts, texts[1:])))
+
+        generated_content = "\n\n".join(f"## {plan['setting']}\n\n{text}" for plan, text in zip(scenes, texts))
+        return self._save_chapter(chapter_outline, generated_content)
+
+    def generate_scenes(self, chapter_outline, scenes, instructions=None, smooth=True):
+        """Blocking agenerate_scenes(); must not be called from a running event loop."""
+        return asyncio.run(self.agenerate_scenes(chapter_outline, scenes, instructions, smooth))
+
+    async def arevise_chapter(self, chapter_outline, brief=None, previous_excerpt=None, next_excerpt=None):
+        """
+        Continuity pass over a saved chapter: ask for a revision that agrees
+        with the excerpts of its neighbouring chapters, then rewrite the
+        chapter file and its scene node. Returns the chapter filename.
+        """
+        filename = self._chapter_path(chapter_outline)
+        with open(filename, "r", encoding="utf-8") as f:
+            draft = f.read()
+        prompt_dict = self.prompt_builder.build_revision_prompt(draft, brief, previous_excerpt, next_excerpt)
+        params = self._completion_params(prompt_dict)
+        # Room for the whole draft, which scene fan-out can make longer than one completion
+        params.update(max_tokens=max(params["max_tokens"], int(estimate_tokens(draft) * 1.25)),
+                      temperature=REVISION_TEMPERATURE)
+
+        if self.use_placeholder:
+            print(f"[PLACEHOLDER] Keeping draft for outline: {chapter_outline}")
+            return filename
+        print(f"[OPENAI] Revising chapter for outline: {chapter_outline}")
+        revised = await self._acomplete_text(chapter_outline, chapter_outline, params, "revision")
+
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(revised)
+        drafts = self.graph.find_nodes(node_type="scene", name=chapter_outline)
+        if drafts:
+            self.graph.update_node(drafts[-1], revised)
+        return filename
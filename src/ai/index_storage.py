@@ -0,0 +1,56 @@
+"""
+Locations and loading of the persisted RAG index.
+
+scripts/index_novel_documents.py writes the index into data_index/ together
+with a manifest of the files it was built from; ContextBuilder and the
+scripts load it back through load_index().
+"""
+
+import json
+import os
+from pathlib import Path
+
+from llama_index.core import StorageContext, load_index_from_storage
+
+from src.ai.embeddings import get_embed_model
+from src.ai.vector_store import NumpyVectorStore
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+INDEX_DIR = str(PROJECT_ROOT / "data_index")
+JSON_VECTOR_STORE = "default__vector_store.json"
+MANIFEST_FILE = "manifest.json"
+
+
+def load_manifest(persist_dir=INDEX_DIR):
+    """The manifest written with the index, or None if there is none (or it is unreadable)."""
+    try:
+        with open(os.path.join(persist_dir, MANIFEST_FILE), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(persist_dir, manifest):
+    path = os.path.join(persist_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_index(persist_dir=INDEX_DIR, embed_model=None, **stores):
+    """
+    Load the persisted index. Already-loaded stores (docstore, index_store,
+    graph_store, vector_stores) can be passed in to skip re-reading their files.
+    Queries are embedded with embed_model, defaulting to the model recorded in
+    the manifest at build time.
+    """
+    if embed_model is None:
+        manifest = load_manifest(persist_dir)
+        if manifest and manifest.get("embed_model"):
+            embed_model = get_embed_model(manifest["embed_model"])
+    if "vector_stores" not in stores and NumpyVectorStore.exists(persist_dir):
+        stores["vector_stores"] = {"default": NumpyVectorStore.from_persist_dir(persist_dir)}
+    storage_context = StorageContext.from_defaults(persist_dir=persist_dir, **stores)
+    if embed_model is None:
+        return load_index_from_storage(storage_context)
+    return load_index_from_storage(storage_context, embed_model=embed_model)
@@ -0,0 +1,228 @@
+"""
+In-process BM25 index over RAG chunks.
+
+Postings are kept per term as delta-encoded chunk rows and term frequencies,
+each packed into the narrowest unsigned dtype that holds them (most gaps and
+frequencies fit in one byte), and decoded with a single cumsum at query time.
+Chunks can be added and removed one at a time: new postings collect in a small
+per-term tail that is packed on the next query touching that term, and removed
+chunks are masked out, so the index follows incremental re-indexing without
+ever being rebuilt. Once masked rows pass COMPACT_DEAD_RATIO of all rows the
+postings are compacted to the live rows only.
+"""
+
+import math
+import re
+
+import numpy as np
+
+UINT_DTYPES = (np.uint8, np.uint16, np.uint32)
+COMPACT_DEAD_RATIO = 0.25
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Function words only: unlike the outline ranker's list, words such as
+# "chapter" or "story" carry meaning in the indexed manuscripts and notes
+STOPWORDS = frozenset(
+    "a an and are as at be been but by for from had has have he her him his i if in into is it its me my "
+    "of on or our she so than that the their them then there these they this those to was we were what "
+    "when which who will with would you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def _pack(values):
+    """Store non-negative integers in the narrowest unsigned dtype."""
+    values = np.asarray(values, dtype=np.int64)
+    top = int(values.max()) if values.size else 0
+    for dtype in UINT_DTYPES:
+        if top <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+
+class PostingList:
+    """Delta-encoded chunk rows with parallel term frequencies."""
+
+    __slots__ = ("gaps", "tfs", "last_row", "tail")
+
+    def __init__(self):
+        self.gaps = np.empty(0, dtype=np.uint8)
+        self.tfs = np.empty(0, dtype=np.uint8)
+        self.last_row = 0
+        self.tail = []
+
+    def append(self, row, tf):
+        self.tail.append((row, tf))
+
+    def decode(self):
+        """Return (rows, tfs) as int64 arrays, packing any pending tail first."""
+        if self.tail:
+            rows = np.array([row for row, _tf in self.tail], dtype=np.int64)
+            gaps = np.diff(rows, prepend=self.last_row)
+            self.gaps = np.concatenate([self.gaps.astype(np.int64), gaps])
+            self.gaps = _pack(self.gaps)
+            self.tfs = _pack(np.concatenate([self.tfs.astype(np.int64), [tf for _row, tf in self.tail]]))
+            self.last_row = int(rows[-1])
+            self.tail = []
+        return np.cumsum(self.gaps, dtype=np.int64), self.tfs.astype(np.int64)
+
+    def nbytes(self):
+        return self.gaps.nbytes + self.tfs.nbytes + len(self.tail) * 16
+
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # Chunk row i belongs to self._ids[i]; rows are never reused. Lengths and
+        # the live mask are preallocated arrays grown by doubling
+        self._ids = []
+        self._rows = {}
+        self._lengths = np.zeros(64)
+        self._live = np.zeros(64, dtype=bool)
+        self._live_count = 0
+        self._total_length = 0
+        self._postings = {}
+
+    def __len__(self):
+        return self._live_count
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._rows
+
+    @property
+    def ids(self):
+        return list(self._rows)
+
+    def add(self, chunk_id, text):
+        """Index a chunk; re-adding an id replaces its previous text."""
+        if chunk_id in self._rows:
+            self.remove(chunk_id)
+        row = len(self._ids)
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = PostingList()
+            postings.append(row, count)
+        if row == len(self._live):
+            self._lengths = np.concatenate([self._lengths, np.zeros(row)])
+            self._live = np.concatenate([self._live, np.zeros(row, dtype=bool)])
+        self._ids.append(chunk_id)
+        self._rows[chunk_id] = row
+        self._lengths[row] = len(terms)
+        self._live[row] = True
+        self._live_count += 1
+        self._total_length += len(terms)
+
+    def copy(self):
+        """
+        An independent index over the same chunks, for building the next
+        version while this one keeps answering queries. Packed arrays are
+        shared, since neither index modifies them in place.
+        """
+        clone = BM25Index(self.k1, self.b)
+        clone._ids = list(self._ids)
+        clone._rows = dict(self._rows)
+        clone._lengths = self._lengths.copy()
+        clone._live = self._live.copy()
+        clone._live_count = self._live_count
+        clone._total_length = self._total_length
+        for term, postings in self._postings.items():
+            copied = clone._postings[term] = PostingList()
+            copied.gaps, copied.tfs, copied.last_row = postings.gaps, postings.tfs, postings.last_row
+            copied.tail = list(postings.tail)
+        return clone
+
+    def remove(self, chunk_id):
+        row = self._rows.pop(chunk_id, None)
+        if row is None:
+            return
+        self._live[row] = False
+        self._live_count -= 1
+        self._total_length -= self._lengths[row]
+        if len(self._ids) - self._live_count > COMPACT_DEAD_RATIO * len(self._ids):
+            self.compact()
+
+    def compact(self):
+        """Drop removed rows from the postings and renumber the live rows densely."""
+        n = len(self._ids)
+        live = self._live[:n]
+        new_rows = np.cumsum(live) - 1
+        for term in list(self._postings):
+            rows, tfs = self._postings[term].decode()
+            keep = live[rows]
+            if not keep.any():
+                del self._postings[term]
+                continue
+            rows = new_rows[rows[keep]]
+            # New arrays rather than in-place edits: copy() shares the old ones
+            postings = self._postings[term] = PostingList()
+            postings.gaps = _pack(np.diff(rows, prepend=0))
+            postings.tfs = _pack(tfs[keep])
+            postings.last_row = int(rows[-1])
+        self._ids = [chunk_id for chunk_id, alive in zip(self._ids, live) if alive]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        size = max(64, len(self._ids))
+        self._lengths = np.concatenate([self._lengths[:n][live], np.zeros(size - len(self._ids))])
+        self._live = np.zeros(size, dtype=bool)
+        self._live[:len(self._ids)] = True
+
+    def sync(self, chunks):
+        """
+        Make the index hold exactly the given {chunk id: text} chunks, adding
+        and removing only the difference. Returns (added, removed) counts.
+        """
+        removed = [chunk_id for chunk_id in self._rows if chunk_id not in chunks]
+        for chunk_id in removed:
+            self.remove(chunk_id)
+        added = [chunk_id for chunk_id in chunks if chunk_id not in self._rows]
+        for chunk_id in added:
+            self.add(chunk_id, chunks[chunk_id])
+        return len(added), len(removed)
+
+    def search(self, query, k=10):
+        """Return up to k (chunk id, BM25 score) pairs, best first."""
+        if not self._live_count:
+            return []
+        n = len(self._ids)
+        lengths, live = self._lengths[:n], self._live[:n]
+        avg_length = self._total_length / self._live_count or 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        scores = np.zeros(n)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            rows, tfs = postings.decode()
+            keep = live[rows]
+            rows, tfs = rows[keep], tfs[keep]
+            if not rows.size:
+                continue
+            idf = math.log(1 + (self._live_count - rows.size + 0.5) / (rows.size + 0.5))
+            scores += np.bincount(rows, weights=idf * tfs * (self.k1 + 1) / (tfs + norm[rows]), minlength=n)
+
+        hits = np.flatnonzero(scores > 0)
+        if not hits.size:
+            return []
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self._ids[row], float(scores[row])) for row in hits]
+
+    def pack(self):
+        """Pack every pending posting tail (search packs only the terms it touches)."""
+        for postings in self._postings.values():
+            if postings.tail:
+                postings.decode()
+
+    def nbytes(self):
+        """Approximate size of the packed postings."""
+        return sum(postings.nbytes() for postings in self._postings.values())
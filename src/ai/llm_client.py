@@ -0,0 +1,308 @@
+"""
+Process-wide LLM client shared by every ChapterGenerator and script.
+
+One OpenAI client, plus one AsyncOpenAI client per event loop, sits on a sized
+keep-alive connection pool, so consecutive chapters reuse warm connections
+instead of re-handshaking. Every call first takes from two token buckets,
+requests per minute and tokens per minute, so bursts of work are smoothed on
+the client instead of tripping the provider's 429s. Each call has its own
+timeout, and 429/5xx/connection failures are retried with jittered backoff.
+Every attempt is reported to the run's telemetry (src/ai/telemetry.py) when
+it is enabled.
+
+Limits come from the environment (LLM_RPM, LLM_TPM, LLM_BURST_SECONDS,
+LLM_TIMEOUT, LLM_POOL_SIZE, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES) or
+configure_llm_client().
+"""
+
+import asyncio
+import inspect
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import openai
+
+from src.ai.telemetry import StreamTap, get_telemetry
+from src.graph.context_ranker import estimate_tokens
+
+DEFAULT_RPM = float(os.environ.get("LLM_RPM", "500"))
+DEFAULT_TPM = float(os.environ.get("LLM_TPM", "200000"))
+DEFAULT_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+DEFAULT_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+# Seconds of quota a bucket can hand out at once; providers may enforce their
+# per-minute limits over shorter windows, so bursts stay well under a minute's worth
+DEFAULT_BURST_SECONDS = float(os.environ.get("LLM_BURST_SECONDS", "6"))
+# Requests in flight per event loop for the async client
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+CONNECT_TIMEOUT = 10.0
+KEEPALIVE_EXPIRY = 60.0
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+# 429 and 5xx responses, plus connection failures and timeouts (APITimeoutError
+# subclasses APIConnectionError), all retried with backoff
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(params):
+    """Tokens a completion request may use: its messages plus max_tokens for each of its n choices."""
+    prompt = sum(estimate_tokens(str(message.get("content") or "")) for message in params.get("messages", []))
+    return prompt + int(params.get("max_tokens") or 0) * int(params.get("n") or 1)
+
+
+class TokenBucket:
+    """
+    Holds up to `capacity` tokens, refilled at rate_per_minute. take() debits
+    immediately, possibly into debt, and returns how long the caller must wait
+    before its share has been refilled, so waiters are served in arrival order
+    without polling, from threads or coroutines alike.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount):
+        """Debit amount (capped at capacity) and return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self, amount):
+        """Return tokens reserved but not used (amount may be negative for overruns)."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMClient:
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, burst_seconds=DEFAULT_BURST_SECONDS,
+                 timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            rpm: Requests per minute allowed by the client (None = unlimited)
+            tpm: Prompt + completion tokens per minute (None = unlimited); a
+                request reserves its estimated prompt plus max_tokens and the
+                unused part is refunded from the response usage
+            burst_seconds: Quota either bucket can hand out at once, in seconds
+            timeout: Default per-call timeout in seconds
+            pool_size: Keep-alive HTTP connections per client
+            max_concurrency: Async requests in flight per event loop
+            max_retries: Retries of a 429/5xx/connection failure
+        """
+        self.requests = TokenBucket(rpm, max(1.0, rpm * burst_seconds / 60)) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm * burst_seconds / 60) if tpm else None
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.stats = {"requests": 0, "retries": 0, "throttled_seconds": 0.0}
+        self._sync_client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                            keepalive_expiry=KEEPALIVE_EXPIRY)
+
+    def _timeout(self, timeout=None):
+        return openai.Timeout(timeout or self.timeout, connect=CONNECT_TIMEOUT)
+
+    @property
+    def client(self):
+        """The shared OpenAI client (OPENAI_API_KEY / OPENAI_BASE_URL from the environment)."""
+        with self._lock:
+            if self._sync_client is None:
+                # Retries are done here so they go through the rate limiter
+                self._sync_client = openai.OpenAI(
+                    max_retries=0, timeout=self._timeout(),
+                    http_client=openai.DefaultHttpxClient(limits=self._limits(), timeout=self._timeout()))
+            return self._sync_client
+
+    def async_client(self):
+        """AsyncOpenAI client for the running event loop (connections are bound to one loop)."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = openai.AsyncOpenAI(
+                max_retries=0, timeout=self._timeout(),
+                http_client=openai.DefaultAsyncHttpxClient(limits=self._limits(), timeout=self._timeout()))
+        return client
+
+    def semaphore(self):
+        """The async concurrency limit for the running event loop."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _reserve(self, params):
+        """Debit both buckets for one request; returns (seconds to wait, tokens reserved)."""
+        reserved = estimate_request_tokens(params)
+        wait = self.requests.take(1) if self.requests else 0.0
+        if self.tokens:
+            wait = max(wait, self.tokens.take(reserved))
+        self.stats["requests"] += 1
+        self.stats["throttled_seconds"] += wait
+        return wait, reserved
+
+    def settle(self, reserved, usage):
+        """Refund the difference between the tokens reserved and a response's usage."""
+        if self.tokens is None or not usage:
+            return
+        used = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+        if used:
+            self.tokens.refund(reserved - used)
+
+    def _release(self, reserved):
+        # A failed request produced no tokens; its request slot stays spent
+        if self.tokens is not None:
+            self.tokens.refund(reserved)
+
+    def _observe(self, params, started, throttled, attempt, response=None, error=None):
+        """Report one attempt to the run's telemetry, if enabled."""
+        telemetry = get_telemetry()
+        if telemetry is None:
+            return
+        latency = time.perf_counter() - started
+        if isinstance(response, StreamTap):
+            usage = response.usage
+            ttft = response.first_at - started if response.first_at is not None else None
+        else:
+            usage = getattr(response, "usage", None)
+            usage = usage.model_dump() if usage is not None else None
+            ttft = None
+        telemetry.record_call(params, latency, throttled, attempt, usage, ttft, error)
+
+    def _retry(self, error, attempt, max_retries):
+        """Seconds to back off before the next attempt; re-raises once retries are exhausted."""
+        if attempt >= max_retries:
+            raise error
+        self.stats["retries"] += 1
+        delay = backoff_delay(attempt, _retry_after(error))
+        reason = getattr(error, "status_code", None) or type(error).__name__
+        print(f"[OPENAI] {reason}; retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        return delay
+
+    def complete(self, params, consume=None, timeout=None, max_retries=None):
+        """
+        Run a chat completion (blocking). consume(response), when given, reads
+        a streamed response inside the retry loop and its result is returned.
+        Returns (result, tokens reserved) for settle(). A failed attempt,
+        whatever the exception, gives its reserved tokens back.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            wait, reserved = self._reserve(params)
+            if wait:
+                time.sleep(wait)
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.client.chat.completions.create(**params, timeout=self._timeout(timeout))
+                if params.get("stream"):
+                    response = StreamTap(response)
+                result = consume(response) if consume is not None else response
+            except RETRYABLE_ERRORS as error:
+                self._observe(params, started, wait, attempt, response, error)
+                self._release(reserved)
+                delay = self._retry(error, attempt, max_retries)
+            except BaseException as error:
+                # Non-retryable API errors, consumer errors, interrupts
+                self._observe(params, started, wait, attempt, response, error)
+                self._release(reserved)
+                raise
+            else:
+                self._observe(params, started, wait, attempt, response)
+                return result, reserved
+            attempt += 1
+            time.sleep(delay)
+
+    async def acomplete(self, params, consume=None, timeout=None, max_retries=None, semaphore=None):
+        """
+        complete() on the async client, bounded by semaphore (default: the
+        client's per-loop semaphore). consume may be a plain or a coroutine
+        function; its result is awaited when it is awaitable.
+        Backoff and rate-limit waits happen outside the semaphore, so a slot
+        always belongs to a request on the wire.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        semaphore = semaphore or self.semaphore()
+        client = self.async_client()
+        attempt = 0
+        while True:
+            wait, reserved = self._reserve(params)
+            if wait:
+                await asyncio.sleep(wait)
+            async with semaphore:
+                started = time.perf_counter()
+                response = None
+                try:
+                    response = await client.chat.completions.create(**params, timeout=self._timeout(timeout))
+                    if params.get("stream"):
+                        response = StreamTap(response)
+                    result = consume(response) if consume is not None else response
+                    if inspect.isawaitable(result):
+                        result = await result
+                except RETRYABLE_ERRORS as error:
+                    self._observe(params, started, wait, attempt, response, error)
+                    self._release(reserved)
+                    delay = self._retry(error, attempt, max_retries)
+                except BaseException as error:
+                    # Non-retryable API errors, consumer errors, cancellation
+                    self._observe(params, started, wait, attempt, response, error)
+                    self._release(reserved)
+                    raise
+                else:
+                    self._observe(params, started, wait, attempt, response)
+                    return result, reserved
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_llm_client():
+    """The process-wide LLMClient, created from the environment on first use."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = LLMClient()
+        return _CLIENT
+
+
+def configure_llm_client(**options):
+    """Replace the process-wide client, e.g. configure_llm_client(rpm=60, tpm=90000)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        _CLIENT = LLMClient(**options)
+        return _CLIENT
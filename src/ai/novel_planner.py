@@ -0,0 +1,226 @@
+"""
+Chapter plans built from scenes.yaml, for drafting chapters in parallel.
+
+Each plan carries a short outline ("Chapter 5"), which names the chapter file
+and its scene node, and a brief: the chapter's title, part, pacing and tone,
+every scene's setting, purpose and key elements, and what the neighbouring
+chapters cover, including the key transitions into and out of it. Because a
+chapter no longer has to read its predecessor's text to know where it stands,
+the chapters of a part (or of any window of consecutive chapters) can be
+drafted at the same time and reconciled afterwards by a continuity pass.
+
+draft_novel() runs the waves through one ChapterGenerator, opening chapter
+first: the chapters of a wave are drafted concurrently, at most `workers` requests at a time, and
+then every chapter is revised against the end of the chapter before it and
+the opening of the chapter after it, all concurrently again.
+"""
+
+import asyncio
+
+from src.graph.cluster import parse_chapter_ranges
+
+# Characters of each neighbouring draft shown to the continuity pass
+CONTINUITY_EXCERPT_CHARS = 2000
+
+
+def _part_label(part_key, parts):
+    part = parts.get(part_key) or {}
+    label = part_key.replace("_", " ").title()
+    return f"{label}: {part['title']}" if part.get("title") else label
+
+
+def _ordered_scenes(planned):
+    scenes = planned.get("scenes") or {}
+    return [scenes[key] or {} for key in sorted(scenes, key=lambda name: int(name.rsplit("_", 1)[-1]))]
+
+
+def _scene_lines(planned):
+    lines = []
+    for number, scene in enumerate(_ordered_scenes(planned), start=1):
+        line = f"{number}. {scene.get('setting', 'Untitled scene')}"
+        if scene.get("purpose"):
+            line += f" - {scene['purpose']}"
+        if scene.get("key_elements"):
+            line += ". Key elements: " + "; ".join(scene["key_elements"])
+        if scene.get("ending_line"):
+            line += f'. End on: "{scene["ending_line"]}"'
+        lines.append(line)
+    return lines
+
+
+def _covers(planned):
+    """One line summarising what a chapter's scenes are for."""
+    purposes = [scene.get("purpose") for scene in (planned.get("scenes") or {}).values() if scene]
+    return "; ".join(purpose for purpose in purposes if purpose)
+
+
+def scene_plans(planned):
+    """
+    The scenes of one scenes.yaml chapter entry, in order, as
+    {"scene", "setting", "brief"} dicts for scene-level generation.
+    """
+    plans = []
+    for number, scene in enumerate(_ordered_scenes(planned), start=1):
+        lines = [f"Setting: {scene.get('setting', 'Untitled scene')}"]
+        if scene.get("purpose"):
+            lines.append(f"Purpose: {scene['purpose']}")
+        if scene.get("key_elements"):
+            lines.append("Key elements: " + "; ".join(scene["key_elements"]))
+        if scene.get("ending_line"):
+            lines.append(f'End on: "{scene["ending_line"]}"')
+        plans.append({"scene": number, "setting": scene.get("setting") or f"Scene {number}",
+                      "brief": "\n".join(lines)})
+    return plans
+
+
+def chapter_plans(scenes_config, max_chapters=None):
+    """
+    Plans for chapters 1..max_chapters (default: novel_structure.total_chapters,
+    else every chapter_N in scenes.yaml), as a list of
+    {"chapter", "title", "part", "outline", "brief", "scenes"} dicts in
+    chapter order; "scenes" holds the chapter's scene_plans().
+    """
+    structure = scenes_config.get("novel_structure") or {}
+    parts = structure.get("parts") or {}
+    chapters = scenes_config.get("chapters") or {}
+    guidance = scenes_config.get("generation_guidance") or {}
+    transitions = guidance.get("key_transitions") or {}
+    chapter_parts = parse_chapter_ranges(parts)
+
+    numbers = sorted(int(key.split("_", 1)[1]) for key in chapters if key.split("_", 1)[-1].isdigit())
+    total = structure.get("total_chapters") or (numbers[-1] if numbers else 0)
+    count = max_chapters or total
+    total = max(total, count)
+
+    plans = []
+    for number in range(1, count + 1):
+        planned = chapters.get(f"chapter_{number}") or {}
+        part = planned.get("part") or chapter_parts.get(number)
+        lines = [f"This is chapter {number} of {total}"
+                 + (f', "{planned["title"]}"' if planned.get("title") else "")
+                 + (f", in {_part_label(part, parts)}." if part else ".")]
+        if part:
+            if (parts.get(part) or {}).get("theme"):
+                lines.append(f"Part theme: {parts[part]['theme']}")
+            if (guidance.get("pacing") or {}).get(part):
+                lines.append(f"Pacing: {guidance['pacing'][part]}")
+            if (guidance.get("tone_progression") or {}).get(part):
+                lines.append(f"Tone: {guidance['tone_progression'][part]}")
+        if planned.get("opening_line_reference"):
+            lines.append(f"Open with {planned['opening_line_reference']}.")
+        scene_lines = _scene_lines(planned)
+        if scene_lines:
+            lines.append("Scenes, in order:")
+            lines.extend(scene_lines)
+
+        previous = chapters.get(f"chapter_{number - 1}")
+        if previous and _covers(previous):
+            lines.append(f"Chapter {number - 1} (just before this one) covers: {_covers(previous)}")
+        if transitions.get(f"chapter_{number - 1}_to_{number}"):
+            lines.append(f"Transition into this chapter: {transitions[f'chapter_{number - 1}_to_{number}']}")
+        following = chapters.get(f"chapter_{number + 1}") if number < total else None
+        if following and _covers(following):
+            lines.append(f"Chapter {number + 1} (right after this one) covers: {_covers(following)}; do not anticipate it.")
+        if transitions.get(f"chapter_{number}_to_{number + 1}"):
+            lines.append(f"Transition out of this chapter: {transitions[f'chapter_{number}_to_{number + 1}']}")
+        if guidance.get("recurring_motifs"):
+            lines.append("Recurring motifs: " + "; ".join(guidance["recurring_motifs"]))
+
+        plans.append({
+            "chapter": number,
+            "title": planned.get("title"),
+            "part": part,
+            "outline": f"Chapter {number}",
+            "brief": "\n".join(lines),
+            "scenes": scene_plans(planned),
+        })
+    return plans
+
+
+def drafting_waves(plans, window=None):
+    """
+    Group plans into waves drafted concurrently, in order: one wave per part
+    (window None or "part"), or runs of `window` consecutive chapters. Each
+    wave sees the chapters of the waves before it as story context. Chapter 1
+    is a wave of its own: it is prompted from the seed data alone, and the
+    rest of its part would otherwise be drafted with no story context at all.
+    """
+    waves = []
+    for plan in plans:
+        if not waves or waves[-1][-1]["chapter"] == 1:
+            fresh = True
+        elif window in (None, "part"):
+            fresh = waves[-1][-1]["part"] != plan["part"]
+        else:
+            fresh = len(waves[-1]) >= int(window)
+        if fresh:
+            waves.append([])
+        waves[-1].append(plan)
+    return waves
+
+
+async def draft_novel(generator, plans, window=None, workers=None, continuity=True, scenes=False):
+    """
+    Draft the planned chapters wave by wave with generator.agenerate_chapter
+    (or, with scenes, generator.agenerate_scenes, which writes each chapter's
+    scenes concurrently), then (if continuity) revise each one against its
+    neighbours. Drafting
+    stops after a wave in which any chapter failed, since later waves build
+    on it. Returns {chapter number: filename} for the chapters written.
+    """
+    semaphore = generator.semaphore
+    if workers:
+        generator.semaphore = asyncio.Semaphore(workers)
+    filenames = {}
+    try:
+        waves = drafting_waves(plans, window)
+        for number, wave in enumerate(waves, start=1):
+            chapters = ", ".join(str(plan["chapter"]) for plan in wave)
+            print(f"[PLAN] Drafting wave {number}/{len(waves)}: chapters {chapters}")
+            results = await asyncio.gather(
+                *(generator.agenerate_scenes(plan["outline"], plan["scenes"], instructions=plan["brief"])
+                  if scenes and plan["scenes"] else
+                  generator.agenerate_chapter(plan["outline"], instructions=plan["brief"])
+                  for plan in wave),
+                return_exceptions=True)
+            failed = False
+            for plan, result in zip(wave, results):
+                if isinstance(result, BaseException) and not isinstance(result, Exception):
+                    raise result
+                if isinstance(result, Exception):
+                    print(f"[PLAN] Chapter {plan['chapter']} failed: {result}")
+                    failed = True
+                else:
+                    filenames[plan["chapter"]] = result
+            if failed:
+                break
+
+        if continuity and len(filenames) > 1:
+            print(f"[PLAN] Continuity pass over {len(filenames)} chapters")
+            drafts = {}
+            for chapter, filename in filenames.items():
+                with open(filename, "r", encoding="utf-8") as f:
+                    drafts[chapter] = f.read()
+
+            def excerpt(chapter, tail):
+                draft = drafts.get(chapter)
+                if not draft:
+                    return None
+                return draft[-CONTINUITY_EXCERPT_CHARS:] if tail else draft[:CONTINUITY_EXCERPT_CHARS]
+
+            revisions = [plan for plan in plans if plan["chapter"] in drafts]
+            results = await asyncio.gather(
+                *(generator.arevise_chapter(plan["outline"], plan["brief"],
+                                            excerpt(plan["chapter"] - 1, tail=True),
+                                            excerpt(plan["chapter"] + 1, tail=False))
+                  for plan in revisions),
+                return_exceptions=True)
+            for plan, result in zip(revisions, results):
+                if isinstance(result, BaseException) and not isinstance(result, Exception):
+                    raise result
+                if isinstance(result, Exception):
+                    # The draft stays in place
+                    print(f"[PLAN] Revision of chapter {plan['chapter']} failed: {result}")
+    finally:
+        generator.semaphore = semaphore
+    return filenames
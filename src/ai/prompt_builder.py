@@ -4,10 +4,12 @@ Constructs prompts from seed data and RAG context without hardcoding story-speci
 """
 
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import yaml
 
+from src.ai.token_budget import TokenCounter, fit_sections
+
 
 class PromptBuilder:
     """
@@ -25,6 +27,8 @@ class PromptBuilder:
         """
         self.structure_config = self._load_structure_config(structure_config_path)
         self.templates = prompt_templates or self.structure_config.get('templates', self._get_default_templates())
+        self.prompt_budget = self._get_prompt_budget()
+        self.token_counter = TokenCounter(use_tiktoken=self.prompt_budget.get('tokenizer', 'auto') != 'heuristic')
     
     def _load_structure_config(self, config_path: Optional[str] = None) -> Dict[str, Any]:
         """Load structure configuration from YAML file."""
@@ -61,11 +65,36 @@ class PromptBuilder:
             'validation': {
                 'check_elements': [],
                 'missing_element_severity': 'warning',
-                'retry_on_missing': False
+                'retry_on_missing': False,
+                'best_of': 1,
+                'target_words': [800, 1200]
+            },
+            'prompt_budget': {
+                'tokenizer': 'auto',
+                'context_window': 128000,
+                'completion_tokens': 1500,
+                'max_prompt_tokens': 8000,
+                'sections': {
+                    'seed': {'max_tokens': 3500, 'priority': 1},
+                    'rag': {'max_tokens': 2500, 'priority': 2},
+                    'formatting': {'max_tokens': 300, 'priority': 3},
+                    'task': {'max_tokens': None, 'priority': 4}
+                }
             },
             'templates': self._get_default_templates()
         }
     
+    def _get_prompt_budget(self) -> Dict[str, Any]:
+        """prompt_budget from structure.yaml, with defaults for any missing key or section."""
+        defaults = self._get_default_structure_config()['prompt_budget']
+        configured = self.structure_config.get('prompt_budget') or {}
+        budget = {**defaults, **configured}
+        budget['sections'] = {
+            name: {**defaults['sections'].get(name, {}), **(section or {})}
+            for name, section in {**defaults['sections'], **(configured.get('sections') or {})}.items()
+        }
+        return budget
+    
     def _get_default_templates(self) -> Dict[str, str]:
         """Default templates for prompt sections."""
         return {
@@ -73,7 +102,24 @@ class PromptBuilder:
             "seed_intro": "Here is the foundational information for this story:",
             "rag_intro": "Here is what has happened in the story so far:",
             "task_intro": "Your task:",
-            "formatting_guide": "Write engaging prose with vivid descriptions, authentic dialogue, and emotional depth."
+            "formatting_guide": "Write engaging prose with vivid descriptions, authentic dialogue, and emotional depth.",
+            "revision_intro": "Here is a draft chapter written in parallel with its neighbours:",
+            "revision_task": (
+                "Revise the draft so it is continuous with the surrounding chapters: make names, facts, "
+                "objects and the timeline agree with them, let it pick up where the previous chapter ends "
+                "and leave the story where the next chapter begins, and remove anything that repeats or "
+                "anticipates their events. Keep the draft's scenes, scene headings, voice and length. "
+                "Return only the full revised chapter."
+            ),
+            "scene_task": (
+                "Write only scene {scene} of {scene_count} of this chapter, as continuous prose without a "
+                "heading; the other scenes are written separately."
+            ),
+            "transition_task": (
+                "Rewrite the opening paragraph of the next scene so it follows naturally from the end of the "
+                "scene before it, without repeating it. Keep its setting and events. Return only the rewritten "
+                "paragraph."
+            ),
         }
     
     def build_prompt(
@@ -95,26 +141,162 @@ class PromptBuilder:
             additional_instructions: Any extra guidance for the LLM
             
         Returns:
-            Dictionary with 'system' and 'user' messages for the LLM
+            Dictionary with 'system' and 'user' messages for the LLM, and
+            'token_counts' (see fit_prompt_sections)
         """
-        user_prompt_parts = []
+        sections = {}
         
         # Add seed data section (for first chapter or as reference)
         if seed_data and (is_first_chapter or self._should_include_seed_reference(rag_context)):
             seed_section = self._format_seed_data(seed_data)
             if seed_section.strip():
-                user_prompt_parts.append(f"{self.templates['seed_intro']}\n{seed_section}")
+                sections['seed'] = f"{self.templates['seed_intro']}\n{seed_section}"
         
         # Add RAG context section (for subsequent chapters)
         if rag_context and not is_first_chapter:
-            user_prompt_parts.append(f"{self.templates['rag_intro']}\n{rag_context}")
+            sections['rag'] = f"{self.templates['rag_intro']}\n{rag_context}"
         
         # Add task section
         task_section = self._format_task(chapter_outline, is_first_chapter, additional_instructions)
-        user_prompt_parts.append(f"{self.templates['task_intro']}\n{task_section}")
+        sections['task'] = f"{self.templates['task_intro']}\n{task_section}"
         
         # Add formatting guidance
-        user_prompt_parts.append(self.templates['formatting_guide'])
+        sections['formatting'] = self.templates['formatting_guide']
+        
+        system = self.templates['system']
+        texts, token_counts = self.fit_prompt_sections(sections, system)
+        return {
+            "system": system,
+            "user": "\n\n".join(text for text in texts.values() if text),
+            "token_counts": token_counts
+        }
+    
+    def fit_prompt_sections(self, sections: Dict[str, str], system: str = "") -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """
+        Fit named prompt sections into the prompt budget of structure.yaml.
+        
+        Each section is first cut to its max_tokens; if the prompt (system
+        message included) is still over min(max_prompt_tokens, context_window -
+        completion_tokens), sections are trimmed lowest priority first.
+        
+        Returns:
+            (texts by section name, token_counts) where token_counts holds the
+            tokens of each section, the tokens trimmed from each, the system
+            message's tokens, the total and budget, and whether the counts are
+            exact (model tokenizer) or estimated
+        """
+        config = self.prompt_budget
+        limits = [config.get('max_prompt_tokens'), None]
+        if config.get('context_window'):
+            limits[1] = config['context_window'] - (config.get('completion_tokens') or 0)
+        limits = [limit for limit in limits if limit]
+        budget = min(limits) if limits else None
+        
+        specs = []
+        for name, text in sections.items():
+            section_config = config['sections'].get(name, {})
+            specs.append({
+                'name': name,
+                'text': text,
+                'max_tokens': section_config.get('max_tokens'),
+                'priority': section_config.get('priority', 0),
+                'min_tokens': section_config.get('min_tokens', 0)
+            })
+        system_tokens = self.token_counter.count(system)
+        texts, report = fit_sections(specs, budget, self.token_counter, fixed_tokens=system_tokens)
+        report['system'] = system_tokens
+        report['exact'] = self.token_counter.exact
+        return texts, report
+    
+    def build_revision_prompt(
+        self,
+        draft: str,
+        chapter_brief: Optional[str] = None,
+        previous_excerpt: Optional[str] = None,
+        next_excerpt: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Build a continuity-pass prompt that reconciles a chapter drafted in
+        parallel with the chapters around it.
+        
+        Args:
+            draft: The chapter draft to revise
+            chapter_brief: The chapter's plan (see src/ai/novel_planner.py)
+            previous_excerpt: The end of the previous chapter's draft
+            next_excerpt: The opening of the next chapter's draft
+            
+        Returns:
+            Dictionary with 'system' and 'user' messages for the LLM
+        """
+        defaults = self._get_default_templates()
+        user_prompt_parts = []
+        
+        if chapter_brief:
+            user_prompt_parts.append(f"Chapter plan:\n{chapter_brief}")
+        if previous_excerpt:
+            user_prompt_parts.append(f"The previous chapter ends:\n{previous_excerpt}")
+        if next_excerpt:
+            user_prompt_parts.append(f"The next chapter begins:\n{next_excerpt}")
+        
+        user_prompt_parts.append(f"{self.templates.get('revision_intro', defaults['revision_intro'])}\n{draft}")
+        user_prompt_parts.append(self.templates.get('revision_task', defaults['revision_task']))
+        
+        return {
+            "system": self.templates['system'],
+            "user": "\n\n".join(user_prompt_parts)
+        }
+    
+    def build_scene_prompt(
+        self,
+        chapter_prompt: Dict[str, str],
+        scene_brief: str,
+        scene: int,
+        scene_count: int,
+        previous_brief: Optional[str] = None,
+        next_brief: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Build the prompt for one scene of a chapter whose scenes are written
+        concurrently. Every scene shares the chapter prompt as its prefix.
+        
+        Args:
+            chapter_prompt: The chapter's prompt from build_prompt()
+            scene_brief: This scene's plan (setting, purpose, key elements)
+            scene: 1-based position of the scene in the chapter
+            scene_count: Number of scenes in the chapter
+            previous_brief: Plan of the scene before this one, if any
+            next_brief: Plan of the scene after this one, if any
+            
+        Returns:
+            Dictionary with 'system' and 'user' messages for the LLM
+        """
+        defaults = self._get_default_templates()
+        task = self.templates.get('scene_task', defaults['scene_task'])
+        user_prompt_parts = [chapter_prompt['user'], task.format(scene=scene, scene_count=scene_count)]
+        
+        if previous_brief:
+            user_prompt_parts.append(f"The previous scene:\n{previous_brief}")
+        user_prompt_parts.append(f"This scene:\n{scene_brief}")
+        if next_brief:
+            user_prompt_parts.append(f"The next scene (do not write it):\n{next_brief}")
+        
+        return {
+            "system": chapter_prompt['system'],
+            "user": "\n\n".join(user_prompt_parts)
+        }
+    
+    def build_transition_prompt(self, previous_ending: str, opening: str) -> Dict[str, str]:
+        """
+        Build the prompt that smooths the join between two scenes written
+        concurrently: the next scene's opening paragraph is rewritten to
+        follow from the end of the previous scene.
+        """
+        defaults = self._get_default_templates()
+        user_prompt_parts = [
+            f"The previous scene ends:\n{previous_ending}",
+            f"The next scene opens:\n{opening}",
+            self.templates.get('transition_task', defaults['transition_task'])
+        ]
         
         return {
             "system": self.templates['system'],
@@ -32,4 +32,13 @@ def load_seed_data():
         "characters": characters,
         "arcs": arcs,
         "world": world,
-    }
\ No newline at end of file
+    }
+
+
+def load_scenes_config():
+    """Load scenes.yaml (parts, chapters and scenes), or an empty dict if absent."""
+    scenes_path = os.path.join(DATA_DIR, "scenes.yaml")
+    if not os.path.exists(scenes_path):
+        return {}
+    with open(scenes_path, "r") as f:
+        return yaml.safe_load(f) or {}
@@ -0,0 +1,255 @@
+"""
+Per-call telemetry for LLM requests.
+
+LLMClient reports every chat.completions.create attempt here: its latency
+(and time to first token when streamed), the time it waited on the rate
+limiter, the prompt's size, the tokens the response used, and the error of a
+failed attempt. Each event is appended as one JSON line to the run's file,
+tagged with whatever telemetry_tags() are active where the call was made;
+ChapterGenerator tags its calls with the novel id, chapter number and kind of
+call ("chapter", "scene", "transition", "revision"). Tags live in a
+ContextVar, so concurrent chapters drafted on one event loop keep their own.
+
+summary() aggregates a run: p50/p95 latency, tokens, estimated cost and the
+prompt tokens of each chapter, which is where prompt bloat shows first.
+
+Telemetry is off unless LLM_TELEMETRY=true or configure_telemetry() is called;
+files go to LLM_TELEMETRY_DIR (default telemetry/) as <run id>.jsonl.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from src.graph.context_ranker import estimate_tokens
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+TELEMETRY_DIR = Path(os.environ.get("LLM_TELEMETRY_DIR", PROJECT_ROOT / "telemetry"))
+TELEMETRY_ENABLED = os.environ.get("LLM_TELEMETRY", "false").lower() == "true"
+# USD per million (prompt, completion) tokens; LLM_PRICE_INPUT/LLM_PRICE_OUTPUT override them
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+_TAGS = contextvars.ContextVar("telemetry_tags", default={})
+
+
+@contextmanager
+def telemetry_tags(**tags):
+    """Tag the LLM calls made inside the block (e.g. novel_id=..., chapter=5)."""
+    token = _TAGS.set({**_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        _TAGS.reset(token)
+
+
+def current_tags():
+    return dict(_TAGS.get())
+
+
+def model_price(model):
+    """(prompt, completion) USD per million tokens for a model, or None if unknown."""
+    if "LLM_PRICE_INPUT" in os.environ or "LLM_PRICE_OUTPUT" in os.environ:
+        return (float(os.environ.get("LLM_PRICE_INPUT", "0")), float(os.environ.get("LLM_PRICE_OUTPUT", "0")))
+    # Longest prefix first, so "gpt-4o-mini-2024-07-18" is not priced as gpt-4o
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+class StreamTap:
+    """
+    Passes a streamed response through unchanged, noting when the first
+    chunk arrived and the usage sent with the final chunk.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.first_at = None
+        self.usage = None
+
+    def _see(self, chunk):
+        if self.first_at is None and chunk.choices:
+            self.first_at = time.perf_counter()
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage.model_dump()
+        return chunk
+
+    def __iter__(self):
+        for chunk in self.stream:
+            yield self._see(chunk)
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield self._see(chunk)
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+class Telemetry:
+    def __init__(self, path=None, run_id=None, **tags):
+        """
+        Args:
+            path: JSONL file events are appended to (default:
+                TELEMETRY_DIR/<run_id>.jsonl; False keeps events in memory only)
+            run_id: Identifier written on every event (default: start time + random suffix)
+            tags: Tags written on every event of the run (e.g. novel_id)
+        """
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.path = None if path is False else str(path or TELEMETRY_DIR / f"{self.run_id}.jsonl")
+        self.tags = tags
+        self.events = []
+        self._lock = threading.Lock()
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    @classmethod
+    def load(cls, path):
+        """A read-only Telemetry holding the events of a recorded run file."""
+        with open(path, encoding="utf-8") as handle:
+            events = [json.loads(line) for line in handle if line.strip()]
+        run_id = next((event.get("run_id") for event in events), None)
+        telemetry = cls(path=False, run_id=run_id or os.path.basename(str(path)))
+        telemetry.events = [event for event in events if event["event"] != "summary"]
+        return telemetry
+
+    def emit(self, event, **fields):
+        """Record one event with the run's and the caller's tags."""
+        record = {"event": event, "time": time.time(), "run_id": self.run_id, **self.tags, **current_tags(), **fields}
+        with self._lock:
+            self.events.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(record, default=str) + "\n")
+        return record
+
+    def record_call(self, params, latency, throttled=0.0, attempt=0, usage=None, ttft=None, error=None):
+        """Record one chat.completions.create attempt."""
+        messages = params.get("messages", [])
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in messages)
+        fields = {
+            "model": params.get("model"),
+            "stream": bool(params.get("stream")),
+            "n": params.get("n") or 1,
+            "max_tokens": params.get("max_tokens"),
+            "attempt": attempt,
+            "latency": latency,
+            "throttled": throttled,
+            "prompt_chars": prompt_chars,
+            "prompt_tokens_estimate": sum(estimate_tokens(str(message.get("content") or ""))
+                                          for message in messages),
+            "status": "ok" if error is None else str(getattr(error, "status_code", None) or type(error).__name__),
+        }
+        if ttft is not None:
+            fields["ttft"] = ttft
+        if usage:
+            fields["prompt_tokens"] = usage.get("prompt_tokens")
+            fields["completion_tokens"] = usage.get("completion_tokens")
+            price = model_price(params.get("model"))
+            if price is not None:
+                fields["cost"] = ((usage.get("prompt_tokens") or 0) * price[0]
+                                  + (usage.get("completion_tokens") or 0) * price[1]) / 1e6
+        return self.emit("llm_call", **fields)
+
+    def summary(self):
+        """
+        Aggregate the run's llm_call events: call and error counts, p50/p95
+        latency and time to first token, token totals, estimated cost (None
+        if a model had no price) and the largest chapter prompt of each chapter.
+        """
+        with self._lock:
+            calls = [event for event in self.events if event["event"] == "llm_call"]
+            cache_hits = sum(1 for event in self.events if event["event"] == "cache_hit")
+        ok = [event for event in calls if event["status"] == "ok"]
+        latencies = [event["latency"] for event in ok]
+        ttfts = [event["ttft"] for event in ok if event.get("ttft") is not None]
+        prompt_tokens = sum(event.get("prompt_tokens") or 0 for event in ok)
+        completion_tokens = sum(event.get("completion_tokens") or 0 for event in ok)
+        costs = [event.get("cost") for event in ok if event.get("completion_tokens") is not None]
+        chapters = {}
+        for event in ok:
+            # Chapter prompts only; revision prompts carry the whole draft
+            if event.get("chapter") is not None and event.get("kind", "chapter") == "chapter":
+                tokens = event.get("prompt_tokens") or event["prompt_tokens_estimate"]
+                chapters[event["chapter"]] = max(chapters.get(event["chapter"], 0), tokens)
+        return {
+            "run_id": self.run_id,
+            "calls": len(calls),
+            "errors": len(calls) - len(ok),
+            "cache_hits": cache_hits,
+            "latency_p50": _percentile(latencies, 50),
+            "latency_p95": _percentile(latencies, 95),
+            "ttft_p50": _percentile(ttfts, 50),
+            "ttft_p95": _percentile(ttfts, 95),
+            "throttled_seconds": sum(event["throttled"] for event in calls),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": sum(costs) if costs and None not in costs else None,
+            "prompt_tokens_by_chapter": dict(sorted(chapters.items())),
+        }
+
+    def write_summary(self):
+        """Append the run summary to the event file as a "summary" event and return it."""
+        summary = self.summary()
+        self.emit("summary", **{key: value for key, value in summary.items() if key != "run_id"})
+        return summary
+
+    @staticmethod
+    def format_summary(summary):
+        def seconds(value):
+            return f"{value:.2f}s" if value is not None else "-"
+
+        lines = [
+            f"[TELEMETRY] {summary['calls']} calls ({summary['errors']} failed, {summary['cache_hits']} cache hits), "
+            f"latency p50 {seconds(summary['latency_p50'])} p95 {seconds(summary['latency_p95'])}"
+            + (f", ttft p50 {seconds(summary['ttft_p50'])} p95 {seconds(summary['ttft_p95'])}"
+               if summary["ttft_p50"] is not None else ""),
+            f"[TELEMETRY] {summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion tokens, "
+            + (f"estimated cost ${summary['cost']:.4f}" if summary["cost"] is not None else "cost unknown"),
+        ]
+        if summary["prompt_tokens_by_chapter"]:
+            lines.append("[TELEMETRY] Prompt tokens by chapter: " + ", ".join(
+                f"{chapter}: {tokens}" for chapter, tokens in summary["prompt_tokens_by_chapter"].items()))
+        return "\n".join(lines)
+
+
+_TELEMETRY = None
+_TELEMETRY_LOCK = threading.Lock()
+
+
+def get_telemetry():
+    """The process-wide Telemetry, or None when telemetry is off."""
+    global _TELEMETRY
+    with _TELEMETRY_LOCK:
+        if _TELEMETRY is None and TELEMETRY_ENABLED:
+            _TELEMETRY = Telemetry()
+        return _TELEMETRY
+
+
+def configure_telemetry(path=None, run_id=None, **tags):
+    """Start recording a new run, e.g. configure_telemetry(novel_id="liminal"); returns the Telemetry."""
+    global _TELEMETRY
+    with _TELEMETRY_LOCK:
+        _TELEMETRY = Telemetry(path, run_id, **tags)
+        return _TELEMETRY
+
+
+def disable_telemetry():
+    global _TELEMETRY
+    with _TELEMETRY_LOCK:
+        _TELEMETRY = None
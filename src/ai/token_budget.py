@@ -0,0 +1,195 @@
+"""
+Token counting and budgeting for prompts.
+
+TokenCounter counts with tiktoken when it is installed and its encoding can
+be loaded, and otherwise with a heuristic calibrated for English prose:
+words and punctuation are counted separately and long words cost extra, which
+tracks BPE tokenizers far better than a flat characters-per-token ratio on
+text full of names and punctuation. When tiktoken is available,
+calibrate() fits the heuristic's scale to it on sample text.
+
+fit_sections() trims a prompt's sections to per-section caps and then, while
+the whole prompt is still over budget, trims the lowest-priority sections
+first, dropping trailing paragraphs before cutting inside one.
+"""
+
+import math
+import os
+import re
+import threading
+
+# Pieces the heuristic counts: runs of letters/digits, and single punctuation marks
+PIECE = re.compile(r"\w+|[^\w\s]")
+# A word costs one token per this many characters, rounded up
+WORD_CHARS_PER_TOKEN = 6
+# Tokens of the blank line joining two prompt sections
+SEPARATOR_TOKENS = 1
+TRIM_MARK = "[...]"
+# Smallest remainder worth filling with the start of a paragraph that does not fit whole
+MIN_PARTIAL_TOKENS = 50
+
+_ENCODINGS = {}
+_ENCODINGS_LOCK = threading.Lock()
+
+
+def _load_encoding(model):
+    """tiktoken's encoding for model, or None when tiktoken or its encoding files are unavailable."""
+    with _ENCODINGS_LOCK:
+        if model not in _ENCODINGS:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:  # pylint: disable=broad-except
+                # Not installed, or the encoding cannot be downloaded
+                encoding = None
+            _ENCODINGS[model] = encoding
+        return _ENCODINGS[model]
+
+
+class TokenCounter:
+    def __init__(self, model=None, use_tiktoken=True, scale=1.0):
+        """
+        Args:
+            model: Model whose tokenizer to use (default: OPENAI_MODEL, else gpt-4o-mini)
+            use_tiktoken: Count with tiktoken when it can be loaded
+            scale: Multiplier applied to the heuristic count (see calibrate())
+        """
+        self.model = model or os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+        self.encoding = _load_encoding(self.model) if use_tiktoken else None
+        self.scale = scale
+
+    @property
+    def exact(self):
+        """Whether counts come from the model's tokenizer rather than the heuristic."""
+        return self.encoding is not None
+
+    def heuristic(self, text):
+        tokens = 0
+        for piece in PIECE.findall(text):
+            tokens += math.ceil(len(piece) / WORD_CHARS_PER_TOKEN) if piece[0].isalnum() else 1
+        return int(math.ceil(tokens * self.scale))
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return self.heuristic(text)
+
+    def calibrate(self, samples):
+        """Fit the heuristic's scale to the tokenizer on sample texts; returns the scale."""
+        if self.encoding is None:
+            return self.scale
+        self.scale = 1.0
+        heuristic = sum(self.heuristic(text) for text in samples)
+        if heuristic:
+            self.scale = sum(self.count(text) for text in samples) / heuristic
+        return self.scale
+
+    def truncate(self, text, max_tokens):
+        """The longest prefix of text within max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        # Binary search on whole pieces keeps the heuristic consistent with count()
+        ends = [match.end() for match in PIECE.finditer(text)]
+        low, high = 0, len(ends)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(text[:ends[middle - 1]]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:ends[low - 1]] if low else ""
+
+
+def trim_text(text, max_tokens, counter):
+    """
+    Cut text to max_tokens: whole trailing paragraphs (then lines) are
+    dropped first, and only the first paragraph that does not fit is cut
+    mid-way, when enough budget is left for it to be worth keeping.
+    A trimmed text ends with TRIM_MARK.
+    """
+    if counter.count(text) <= max_tokens:
+        return text
+    budget = max_tokens - counter.count(TRIM_MARK) - SEPARATOR_TOKENS
+    if budget <= 0:
+        return ""
+    for separator in ("\n\n", "\n"):
+        blocks = text.split(separator)
+        if len(blocks) < 2:
+            continue
+        kept, used = [], 0
+        for block in blocks:
+            tokens = counter.count(block) + (SEPARATOR_TOKENS if kept else 0)
+            if used + tokens > budget:
+                # Rather than waste a large remainder, cut into the first block that does not fit
+                remainder = budget - used - (SEPARATOR_TOKENS if kept else 0)
+                if remainder >= MIN_PARTIAL_TOKENS:
+                    partial = counter.truncate(block, remainder).rstrip()
+                    trimmed = separator.join(kept + [partial]) + f" {TRIM_MARK}"
+                    if partial and counter.count(trimmed) <= max_tokens:
+                        return trimmed
+                break
+            kept.append(block)
+            used += tokens
+        if kept:
+            return separator.join(kept) + f"{separator}{TRIM_MARK}"
+    return counter.truncate(text, budget).rstrip() + f" {TRIM_MARK}"
+
+
+def fit_sections(sections, budget, counter, fixed_tokens=0):
+    """
+    Fit prompt sections into a token budget.
+
+    Args:
+        sections: [{"name", "text", "max_tokens" (None = uncapped),
+            "priority" (lower is trimmed first), "min_tokens" (default 0)}]
+        budget: Tokens allowed for all sections together (None = no overall limit)
+        counter: TokenCounter
+        fixed_tokens: Tokens already spent outside the sections (e.g. the system message)
+
+    Returns:
+        (texts by section name in input order, report) where report is
+        {"sections": {name: tokens}, "trimmed": {name: tokens removed},
+        "total": tokens including fixed_tokens, "budget": budget}
+    """
+    texts = {}
+    counts = {}
+    original = {}
+    for section in sections:
+        text = section["text"]
+        original[section["name"]] = counter.count(text)
+        if section.get("max_tokens") is not None:
+            text = trim_text(text, section["max_tokens"], counter)
+        texts[section["name"]] = text
+        counts[section["name"]] = counter.count(text)
+
+    def total():
+        present = [name for name in texts if texts[name]]
+        return fixed_tokens + sum(counts[name] for name in present) + SEPARATOR_TOKENS * max(0, len(present) - 1)
+
+    if budget is not None:
+        for section in sorted(sections, key=lambda item: item.get("priority", 0)):
+            excess = total() - budget
+            if excess <= 0:
+                break
+            name = section["name"]
+            floor = section.get("min_tokens", 0)
+            target = max(floor, counts[name] - excess)
+            if target < counts[name]:
+                texts[name] = trim_text(texts[name], target, counter) if target else ""
+                counts[name] = counter.count(texts[name])
+
+    report = {
+        "sections": dict(counts),
+        "trimmed": {name: original[name] - counts[name] for name in counts if original[name] > counts[name]},
+        "total": total(),
+        "budget": budget,
+    }
+    return texts, report
@@ -0,0 +1,435 @@
+"""
+Memory-mapped NumPy vector store for the llama-index index.
+
+Embeddings are kept as one contiguous, L2-normalised float32 (or float16)
+matrix saved as ``<namespace>__vector_store.<version>.npy`` with a small JSON
+sidecar (``<namespace>__vector_store.ids.json``) of node ids. The sidecar
+records which matrix file holds how many committed rows and which rows are
+deleted; persisting again appends only the new rows to the matrix file and
+then atomically replaces the sidecar, so a crash leaves either the old or the
+new version whole. Loading maps the matrix instead of parsing it, and a query is a
+single matrix-vector product, so cosine top-k over a million chunks costs a few
+milliseconds instead of a full JSON parse plus a Python loop. A batch of
+queries is a single matrix-matrix product (query_batch). For larger
+corpora an optional IVF index (``.ivf.npz``, see IVFIndex) restricts each
+query to a few inverted lists.
+"""
+
+import json
+import os
+import uuid
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (BasePydanticVectorStore,
+                                                  VectorStoreQuery,
+                                                  VectorStoreQueryResult)
+
+from src.ai.ann_index import IVFIndex
+
+DEFAULT_NAMESPACE = "default"
+SIDECAR_SUFFIX = "__vector_store.ids.json"
+# Files a persist writes besides the sidecar; older versions' are removed
+VERSIONED_SUFFIXES = (".npy", ".ivf.npz")
+# Share of deleted rows above which persist() rewrites the matrix instead of appending to it
+COMPACT_DEAD_RATIO = 0.25
+
+# Rows converted to float32 at a time when scoring a float16 matrix
+SCORE_BLOCK_ROWS = 65536
+# Upper bound on the (queries, rows) score matrix built by one batched query
+SCORE_BLOCK_CELLS = 1 << 24
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _replace_atomically(path, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as handle:
+        write(handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """Flat cosine-similarity store over a memory-mapped embedding matrix."""
+
+    stores_text: bool = False
+    dtype: str = "float32"
+
+    _matrix: Any = PrivateAttr(default=None)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _live: Any = PrivateAttr(default=None)
+    _rows: dict = PrivateAttr(default_factory=dict)
+    _ann: Any = PrivateAttr(default=None)
+    # Preallocated matrix and live-mask storage that add() fills; _matrix and
+    # _live are views of their first rows. Capacity doubles when full, so
+    # building an index copies each row a bounded number of times
+    _buffer: Any = PrivateAttr(default=None)
+    _live_buffer: Any = PrivateAttr(default=None)
+    # Where the matrix was last loaded from or persisted to, so persist() can append to it
+    _persisted: Any = PrivateAttr(default=None)
+
+    def __init__(self, dtype="float32", **kwargs):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        super().__init__(dtype=dtype, **kwargs)
+        self._live = np.zeros(0, dtype=bool)
+
+    @classmethod
+    def class_name(cls):
+        return "NumpyVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def size(self):
+        """Number of live rows. (No __len__: llama-index tests stores for truthiness.)"""
+        return int(self._live.sum())
+
+    @property
+    def matrix(self):
+        """The normalised embedding matrix, including deleted rows (see live_mask)."""
+        return self._matrix
+
+    @property
+    def live_mask(self):
+        return self._live
+
+    @property
+    def ids(self):
+        return self._ids
+
+    @property
+    def ann(self):
+        """The IVFIndex used for queries, or None for exact search."""
+        return self._ann
+
+    def train_ann(self, nlist=None, nprobe=8, **options):
+        """Train an IVF index over the current rows (see IVFIndex.train)."""
+        self._ann = IVFIndex.train(self._matrix, nlist=nlist, nprobe=nprobe, **options)
+        return self._ann
+
+    def drop_ann(self):
+        self._ann = None
+
+    def _set_rows(self, matrix, ids, ref_doc_ids, deleted=()):
+        self._matrix = matrix
+        self._ids = list(ids)
+        self._ref_doc_ids = list(ref_doc_ids)
+        self._live = np.ones(len(self._ids), dtype=bool)
+        self._live[np.asarray(deleted, dtype=np.int64)] = False
+        self._rows = {node_id: row for row, node_id in enumerate(self._ids) if self._live[row]}
+        self._buffer = self._live_buffer = None
+        # Rows no longer line up with any persisted matrix
+        self._persisted = None
+
+    @classmethod
+    def from_arrays(cls, embeddings, ids, ref_doc_ids=None, dtype="float32"):
+        """Build a store directly from an (n, dim) embedding array and its node ids."""
+        store = cls(dtype=dtype)
+        matrix = _normalise(np.asarray(embeddings, dtype=np.float32)).astype(dtype)
+        store._set_rows(matrix, ids, ref_doc_ids or [None] * len(ids))
+        return store
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        embeddings = _normalise(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        embeddings = embeddings.astype(self.dtype)
+        for node in nodes:
+            # Re-adding a node replaces its previous row
+            if node.node_id in self._rows:
+                self._live[self._rows.pop(node.node_id)] = False
+        start = len(self._ids)
+        end = start + len(nodes)
+        if self._buffer is None or len(self._buffer) < end:
+            # A memory-mapped matrix is read-only; the first append copies it into memory
+            capacity = max(end, 2 * (len(self._buffer) if self._buffer is not None else 0))
+            buffer = np.empty((capacity, embeddings.shape[1]), dtype=self.dtype)
+            live = np.zeros(capacity, dtype=bool)
+            if start:
+                buffer[:start] = self._matrix
+                live[:start] = self._live
+            self._buffer, self._live_buffer = buffer, live
+        self._buffer[start:end] = embeddings
+        self._live_buffer[start:end] = True
+        self._matrix = self._buffer[:end]
+        self._live = self._live_buffer[:end]
+        self._ids.extend(node.node_id for node in nodes)
+        self._ref_doc_ids.extend(node.ref_doc_id for node in nodes)
+        for offset, node in enumerate(nodes):
+            self._rows[node.node_id] = start + offset
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Drop every row that came from the given source document."""
+        for row, doc_id in enumerate(self._ref_doc_ids):
+            if doc_id == ref_doc_id and self._live[row]:
+                self._live[row] = False
+                self._rows.pop(self._ids[row], None)
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise ValueError("NumpyVectorStore does not support metadata filters")
+        for node_id in node_ids or []:
+            row = self._rows.pop(node_id, None)
+            if row is not None:
+                self._live[row] = False
+
+    def clear(self) -> None:
+        self._set_rows(None, [], [])
+        self._ann = None
+
+    def scores(self, query_embeddings):
+        """
+        Cosine similarity of each query (rows of a 2-D array, or one 1-D vector)
+        against every row; deleted rows score -inf.
+        """
+        queries = _normalise(np.asarray(query_embeddings, dtype=np.float32))
+        if self._matrix is None or len(self._matrix) == 0:
+            return np.empty(queries.shape[:-1] + (0,), dtype=np.float32)
+        if self._matrix.dtype == np.float32:
+            scores = self._matrix @ queries.T
+        else:
+            # NumPy has no BLAS path for float16; score in float32 blocks
+            scores = np.concatenate([
+                self._matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32) @ queries.T
+                for start in range(0, len(self._matrix), SCORE_BLOCK_ROWS)
+            ])
+        scores = scores.T
+        scores[..., ~self._live] = -np.inf
+        return scores
+
+    def top_k(self, scores, k):
+        """Row indices and scores of the k best entries of a 1-D score array."""
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.argpartition(-scores, k - 1)[:k]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return rows, scores[rows]
+
+    def top_k_batch(self, scores, k):
+        """Per-row top_k of a 2-D (queries, rows) score array: a list of (rows, scores)."""
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return [self.top_k(row, k) for row in scores]
+        rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-best, axis=1, kind="stable")
+        rows = np.take_along_axis(rows, order, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        finite = np.isfinite(best)
+        return [(r[f], b[f]) for r, b, f in zip(rows, best, finite)]
+
+    def query_batch(self, query_embeddings, k, nprobe=None):
+        """
+        Top-k (ids, similarities) for each row of a 2-D query array. Exact
+        search scores the whole batch with one matrix-matrix product; with an
+        ANN index (and nprobe != 0) each query scans its own inverted lists.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self._matrix is None or len(self._matrix) == 0:
+            return [([], []) for _ in queries]
+        if self._ann is not None and nprobe != 0:
+            results = [self._ann.search(self._matrix, self._live, query, k, nprobe) for query in queries]
+        else:
+            results = []
+            step = max(1, SCORE_BLOCK_CELLS // len(self._matrix))
+            for start in range(0, len(queries), step):
+                results.extend(self.top_k_batch(self.scores(queries[start:start + step]), k))
+        return [([self._ids[row] for row in rows], [float(s) for s in similarities])
+                for rows, similarities in results]
+
+    def query(self, query: VectorStoreQuery, nprobe=None, **kwargs: Any) -> VectorStoreQueryResult:
+        """
+        nprobe: IVF lists scanned when an ANN index is present (None = the
+        index default, 0 = exact search).
+        """
+        if query.filters is not None:
+            raise ValueError("NumpyVectorStore does not support metadata filters")
+        restricted = query.node_ids is not None or query.doc_ids is not None
+        if self._ann is not None and nprobe != 0 and not restricted and self._matrix is not None:
+            rows, similarities = self._ann.search(self._matrix, self._live, query.query_embedding,
+                                                  query.similarity_top_k, nprobe)
+            return VectorStoreQueryResult(
+                similarities=[float(s) for s in similarities],
+                ids=[self._ids[row] for row in rows],
+            )
+        scores = self.scores(query.query_embedding)
+        if query.node_ids is not None or query.doc_ids is not None:
+            allowed = np.zeros(len(self._ids), dtype=bool)
+            node_ids = set(query.node_ids or ())
+            doc_ids = set(query.doc_ids or ())
+            for row, (node_id, doc_id) in enumerate(zip(self._ids, self._ref_doc_ids)):
+                allowed[row] = node_id in node_ids or doc_id in doc_ids
+            scores[~allowed] = -np.inf
+        rows, similarities = self.top_k(scores, query.similarity_top_k)
+        return VectorStoreQueryResult(
+            similarities=[float(s) for s in similarities],
+            ids=[self._ids[row] for row in rows],
+        )
+
+    @staticmethod
+    def _base(persist_path):
+        return persist_path[:-len(".json")] if persist_path.endswith(".json") else persist_path
+
+    @classmethod
+    def sidecar_path(cls, persist_path):
+        """The id sidecar for a llama-index vector store persist path."""
+        return f"{cls._base(persist_path)}.ids.json"
+
+    @classmethod
+    def _read_sidecar(cls, persist_path):
+        with open(cls.sidecar_path(persist_path), encoding="utf-8") as handle:
+            return json.load(handle)
+
+    @classmethod
+    def files(cls, persist_path):
+        """Paths of the sidecar and every file the current version consists of."""
+        directory = os.path.dirname(persist_path)
+        sidecar = cls._read_sidecar(persist_path)
+        names = [segment["file"] for segment in sidecar["segments"]]
+        if sidecar.get("ann"):
+            names.append(sidecar["ann"])
+        return [cls.sidecar_path(persist_path)] + [os.path.join(directory, name) for name in names]
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        """
+        Save the store. When it was loaded from (or last persisted to) this
+        path, only the rows added since are appended to the matrix file and
+        deleted rows are recorded in the sidecar; once more than
+        COMPACT_DEAD_RATIO of the rows are deleted, or on a first persist, the
+        live rows are written to a new matrix file instead. Either way the
+        sidecar is replaced last and is the commit point: readers see the old
+        version until then, and rows appended past the count it records are
+        ignored.
+        """
+        base = self._base(persist_path)
+        directory, name = os.path.dirname(base), os.path.basename(base)
+        os.makedirs(directory or ".", exist_ok=True)
+        sidecar_path = os.path.abspath(self.sidecar_path(persist_path))
+        persisted = self._persisted
+        rows = len(self._ids)
+        appendable = (persisted is not None and persisted["sidecar"] == sidecar_path
+                      and os.path.exists(sidecar_path) and self._matrix is not None
+                      and self._matrix.shape[1] == persisted["dim"] and persisted["rows"] <= rows
+                      and rows - self.size <= COMPACT_DEAD_RATIO * rows)
+        version = uuid.uuid4().hex[:12]
+        if appendable:
+            segment = self._append_rows(directory, persisted)
+        else:
+            segment = self._rewrite_rows(directory, f"{name}.{version}.npy")
+
+        ann_name = None
+        if self._ann is not None and segment is not None:
+            if appendable and self._ann is persisted["ann_index"] and len(self._ann.assignments) == rows:
+                ann_name = persisted["ann"]
+            else:
+                # New rows join their nearest list; the saved index is small next to the matrix
+                self._ann.assign(self._matrix, start=len(self._ann.assignments))
+                ann_name = f"{name}.{version}.ivf.npz"
+                _replace_atomically(os.path.join(directory, ann_name), self._ann.save)
+
+        sidecar = {
+            "dtype": self.dtype,
+            "segments": [segment] if segment is not None else [],
+            "ann": ann_name,
+            "ids": self._ids,
+            "ref_doc_ids": self._ref_doc_ids,
+            "deleted": np.flatnonzero(~self._live).tolist(),
+        }
+        _replace_atomically(self.sidecar_path(persist_path),
+                            lambda handle: handle.write(json.dumps(sidecar).encode("utf-8")))
+        self._remove_unreferenced(directory, name, sidecar)
+        self._persisted = self._persisted_state(sidecar_path, sidecar) if segment is not None else None
+
+    def _rewrite_rows(self, directory, file_name):
+        """Compact the store to its live rows and write them to a new matrix file; returns its segment entry."""
+        live = np.flatnonzero(self._live)
+        if live.size != len(self._ids):
+            matrix = self._matrix[live] if live.size else None
+            ann = self._ann.compacted(live, matrix) if self._ann is not None and live.size else None
+            self._set_rows(matrix, [self._ids[row] for row in live], [self._ref_doc_ids[row] for row in live])
+            self._ann = ann
+        if not self._ids:
+            return None
+        matrix = np.ascontiguousarray(self._matrix, dtype=self.dtype)
+        path = os.path.join(directory, file_name)
+        _replace_atomically(path, lambda handle: np.save(handle, matrix))
+        return {"file": file_name, "rows": len(matrix), "dim": int(matrix.shape[1]),
+                "offset": os.path.getsize(path) - matrix.nbytes}
+
+    def _append_rows(self, directory, persisted):
+        """Append the rows added since the last persist to its matrix file; returns the new segment entry."""
+        path = os.path.join(directory, persisted["file"])
+        row_bytes = persisted["dim"] * np.dtype(self.dtype).itemsize
+        end = persisted["offset"] + persisted["rows"] * row_bytes
+        new_rows = np.ascontiguousarray(self._matrix[persisted["rows"]:], dtype=self.dtype)
+        with open(path, "r+b") as handle:
+            # Drop rows an interrupted persist appended but never committed
+            handle.truncate(end)
+            handle.seek(end)
+            handle.write(new_rows.tobytes())
+            handle.flush()
+            os.fsync(handle.fileno())
+        return {"file": persisted["file"], "rows": len(self._ids), "dim": persisted["dim"],
+                "offset": persisted["offset"]}
+
+    def _persisted_state(self, sidecar_path, sidecar):
+        segment = sidecar["segments"][0]
+        return dict(segment, sidecar=sidecar_path, ann=sidecar["ann"], ann_index=self._ann)
+
+    @staticmethod
+    def _remove_unreferenced(directory, name, sidecar):
+        keep = {segment["file"] for segment in sidecar["segments"]} | {sidecar["ann"]}
+        for entry in os.scandir(directory or "."):
+            if (entry.name.startswith(f"{name}.") and entry.name.endswith(VERSIONED_SUFFIXES)
+                    and entry.name not in keep):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def from_persist_path(cls, persist_path, fs=None):
+        """Map a persisted matrix read-only; rows are only paged in when scored."""
+        try:
+            return cls._load(persist_path)
+        except FileNotFoundError:
+            # A writer replaced the version between our reading its sidecar and its files
+            return cls._load(persist_path)
+
+    @classmethod
+    def _load(cls, persist_path):
+        directory = os.path.dirname(persist_path)
+        sidecar = cls._read_sidecar(persist_path)
+        store = cls(dtype=sidecar["dtype"])
+        matrix = None
+        for segment in sidecar["segments"]:
+            # Only the rows the sidecar committed; the file may hold uncommitted ones after them
+            matrix = np.memmap(os.path.join(directory, segment["file"]), dtype=store.dtype, mode="r",
+                               offset=segment["offset"], shape=(segment["rows"], segment["dim"]))
+        store._set_rows(matrix, sidecar["ids"], sidecar["ref_doc_ids"], sidecar["deleted"])
+        if matrix is not None and sidecar["ann"]:
+            store._ann = IVFIndex.load(os.path.join(directory, sidecar["ann"]))
+        if matrix is not None:
+            store._persisted = store._persisted_state(os.path.abspath(cls.sidecar_path(persist_path)), sidecar)
+        return store
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, namespace=DEFAULT_NAMESPACE, fs=None):
+        return cls.from_persist_path(os.path.join(persist_dir, f"{namespace}__vector_store.json"))
+
+    @staticmethod
+    def exists(persist_dir, namespace=DEFAULT_NAMESPACE):
+        return os.path.exists(os.path.join(persist_dir, f"{namespace}{SIDECAR_SUFFIX}"))
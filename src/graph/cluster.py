@@ -1,3 +1,23 @@
+"""
+Community layer over the StoryGraph.
+
+Nodes are partitioned into clusters, either by the novel's parts (from
+scenes.yaml) or by label-propagation communities over the CSR adjacency. Each
+cluster keeps a cached summary that is only recomputed when a member node is
+added or changes, so retrieval can pull a handful of cluster summaries instead
+of hundreds of scene nodes.
+"""
+
+import math
+import re
+
+import numpy as np
+
+from src.graph.context_ranker import estimate_tokens, tokenize
+
+CHAPTER_NUMBER = re.compile(r"chapter[\s_-]*(\d+)", re.IGNORECASE)
+
+
 class Cluster:
     def __init__(self, name, nodes=None):
         self.name = name
@@ -5,3 +25,206 @@ class Cluster:
 
     def add_node(self, node):
         self.nodes.append(node)
+
+    def signature(self, versions):
+        """Identity of the cluster's contents: member ids and their versions."""
+        return tuple((node.node_id, versions[node.node_id]) for node in self.nodes)
+
+
+def extractive_summary(cluster, chars_per_node=240, max_chars=1600):
+    """Default summarizer: the opening sentences of each member, in story order."""
+    lines = []
+    used = 0
+    for node in cluster.nodes:
+        content = " ".join(str(node.content or "").split())
+        lead = content[:chars_per_node]
+        cut = lead.rfind(". ")
+        if len(content) > chars_per_node and cut > chars_per_node // 3:
+            lead = lead[:cut + 1]
+        line = f"- {node.name}: {lead}" if lead else f"- {node.name}"
+        if used + len(line) > max_chars:
+            lines.append(f"- ... and {len(cluster.nodes) - len(lines)} more")
+            break
+        lines.append(line)
+        used += len(line)
+    return "\n".join(lines)
+
+
+def parse_chapter_ranges(parts):
+    """Map chapter number -> part key from scenes.yaml `parts` entries like chapters: "1-4"."""
+    chapter_parts = {}
+    for part_key, part in (parts or {}).items():
+        spec = str(part.get("chapters", ""))
+        for piece in spec.split(","):
+            bounds = [int(b) for b in re.findall(r"\d+", piece)]
+            if bounds:
+                for chapter in range(bounds[0], bounds[-1] + 1):
+                    chapter_parts[chapter] = part_key
+    return chapter_parts
+
+
+def partition_by_part(graph, parts, node_type="scene"):
+    """
+    Group scene nodes by the part of the novel they belong to.
+    The chapter number is read from the node name ("... Chapter 7") and falls
+    back to the scene's position among all scenes.
+    """
+    chapter_parts = parse_chapter_ranges(parts)
+    titles = {key: part.get("title", key) for key, part in (parts or {}).items()}
+    clusters = {}
+    for position, node in enumerate(graph.find_nodes(node_type=node_type), start=1):
+        match = CHAPTER_NUMBER.search(node.name)
+        chapter = int(match.group(1)) if match else position
+        part_key = chapter_parts.get(chapter, "unassigned")
+        name = titles.get(part_key, part_key)
+        clusters.setdefault(name, Cluster(name)).add_node(node)
+    return list(clusters.values())
+
+
+def partition_by_community(graph, relations=None, iterations=10, min_size=2):
+    """
+    Label propagation over the CSR adjacency: every node repeatedly adopts the
+    most common label among itself and its neighbours (ties go to the smallest label).
+    Nodes without edges, and communities smaller than min_size, are left out.
+    """
+    traversal = graph.traversal()
+    n = traversal.node_count
+    if n == 0 or traversal.edge_count == 0:
+        return []
+    mask = traversal.edge_mask(relations)
+    sources, targets = traversal.sources, traversal.indices
+    if mask is not None:
+        sources, targets = sources[mask], targets[mask]
+
+    labels = np.arange(n, dtype=np.int64)
+    voters = np.concatenate([sources, np.arange(n)]).astype(np.int64)
+    for _ in range(iterations):
+        # Count (node, neighbour label) pairs, then keep each node's most frequent label.
+        # Every node also votes for its own label, which stops synchronous updates
+        # from oscillating on bipartite scene/character graphs.
+        voted = np.concatenate([labels[targets], labels])
+        pairs, counts = np.unique(voters * n + voted, return_counts=True)
+        nodes, neighbour_labels = pairs // n, pairs % n
+        order = np.lexsort((neighbour_labels, -counts, nodes))
+        first = np.unique(nodes[order], return_index=True)[1]
+        updated = labels.copy()
+        updated[nodes[order][first]] = neighbour_labels[order][first]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+
+    has_edges = np.bincount(sources, minlength=n) > 0
+    clusters = {}
+    for node_id in np.flatnonzero(has_edges):
+        label = int(labels[node_id])
+        clusters.setdefault(label, []).append(graph.nodes[node_id])
+
+    result = []
+    for members in clusters.values():
+        if len(members) < min_size:
+            continue
+        # Name communities after their best-connected member
+        hub = max(members, key=lambda node: traversal.indptr[node.node_id + 1] - traversal.indptr[node.node_id])
+        result.append(Cluster(f"{hub.node_type.title()}: {hub.name}", members))
+    return result
+
+
+class ClusterIndex:
+    def __init__(self, graph, by="part", parts=None, relations=None, summarizer=None, summary_count=3):
+        """
+        Args:
+            graph: The StoryGraph to partition
+            by: "part" (scenes grouped by novel part) or "community" (label propagation)
+            parts: scenes.yaml novel_structure.parts, required for by="part"
+            relations: Relation filter for community detection
+            summarizer: Callable(cluster) -> str; defaults to extractive_summary
+            summary_count: Number of cluster summaries returned by build_context
+        """
+        if by not in ("part", "community"):
+            raise ValueError(f"Unknown clustering: {by}")
+        self.graph = graph
+        self.by = by
+        self.parts = parts
+        self.relations = relations
+        self.summarizer = summarizer or extractive_summary
+        self.summary_count = summary_count
+        self.clusters = []
+        self._partition_key = None
+        # Summaries keyed by cluster signature, so an unchanged cluster is never
+        # re-summarized even if a repartition renames or reorders it
+        self._summaries = {}
+        self.stats = {"computed": 0, "reused": 0}
+
+    def reset(self):
+        """Forget the partition and cached summaries (e.g. after the graph was reloaded)."""
+        self.clusters = []
+        self._partition_key = None
+        self._summaries = {}
+
+    def _refresh_partition(self):
+        key = (len(self.graph.nodes), self.graph.edge_count, self.graph.node_version_total)
+        if key == self._partition_key:
+            return
+        if self.by == "part":
+            self.clusters = partition_by_part(self.graph, self.parts)
+        else:
+            self.clusters = partition_by_community(self.graph, self.relations)
+        self._partition_key = key
+
+    def summaries(self):
+        """Return [(cluster, summary)], recomputing only clusters whose members changed."""
+        self._refresh_partition()
+        versions = self.graph.node_versions
+        live = {}
+        result = []
+        for cluster in self.clusters:
+            signature = cluster.signature(versions)
+            summary = self._summaries.get(signature)
+            if summary is None:
+                summary = self.summarizer(cluster)
+                self.stats["computed"] += 1
+            else:
+                self.stats["reused"] += 1
+            live[signature] = summary
+            result.append((cluster, summary))
+        self._summaries = live
+        return result
+
+    def build_context(self, query, token_budget):
+        """
+        Pack the cluster summaries most relevant to the query into the budget.
+        The cluster holding the newest node is always included for continuity.
+        """
+        summaries = self.summaries()
+        if not summaries:
+            return ""
+
+        query_terms = set(tokenize(query))
+        documents = [set(tokenize(f"{cluster.name} {summary}")) for cluster, summary in summaries]
+        scores = []
+        for index, terms in enumerate(documents):
+            score = sum(
+                math.log(1 + len(documents) / sum(1 for d in documents if term in d))
+                for term in query_terms & terms
+            )
+            scores.append((score, index))
+        newest = max(range(len(summaries)), key=lambda i: summaries[i][0].nodes[-1].node_id)
+
+        chosen = [newest]
+        for _score, index in sorted(scores, reverse=True):
+            if len(chosen) >= self.summary_count:
+                break
+            if index not in chosen:
+                chosen.append(index)
+
+        parts = []
+        used = 0
+        for index in sorted(chosen, key=lambda i: summaries[i][0].nodes[0].node_id):
+            cluster, summary = summaries[index]
+            block = f"## {cluster.name}\n{summary}"
+            cost = estimate_tokens(block)
+            if parts and used + cost > token_budget:
+                continue
+            parts.append(block)
+            used += cost
+        return "\n\n".join(parts)
@@ -0,0 +1,232 @@
+"""
+Relevance-ranked, token-budgeted context selection for StoryGraph.
+
+Node contents are split into paragraph-sized passages and indexed in an
+inverted index as nodes arrive. Postings and per-passage data are NumPy
+arrays, so a query scores every posting of its terms (names of main characters
+appear in nearly every passage) and every candidate passage in a few vector
+operations rather than a Python loop per passage. The selected text is capped
+by a token budget, so the cost of building context stays roughly flat as the
+novel grows.
+"""
+
+import math
+import re
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by chapter continue for from had has have he her his i in is it its "
+    "of on or she story that the their them then there they this to was were with".split()
+)
+
+DEFAULT_TYPE_WEIGHTS = {"scene": 1.0, "character": 1.2, "location": 0.9}
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return max(1, len(text) // 4)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def split_passages(text, passage_chars):
+    """Split text on paragraph breaks and merge paragraphs into ~passage_chars windows."""
+    passages = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > passage_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        # Paragraphs longer than a whole window are cut on sentence boundaries
+        while len(current) > passage_chars * 2:
+            cut = current.rfind(". ", 0, passage_chars) + 1 or passage_chars
+            passages.append(current[:cut].strip())
+            current = current[cut:].strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+class _Column:
+    """Append-only 1-D array that doubles its capacity when full."""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, dtype):
+        self.data = np.empty(16, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            self.data = np.concatenate([self.data, np.empty_like(self.data)])
+        self.data[self.size] = value
+        self.size += 1
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class ContextRanker:
+    def __init__(self, token_budget=1200, type_weights=None, recency_weight=0.3,
+                 recency_half_life=20, recency_window=8, passage_chars=600,
+                 graph_weight=0.3, graph_candidates=16, graph_max_hops=3, k1=1.2, b=0.75):
+        """
+        Args:
+            token_budget: Maximum estimated tokens of context returned
+            type_weights: Multiplier per node type (unlisted types weigh 1.0)
+            recency_weight: Share of the score given to recency (0 = pure relevance)
+            recency_half_life: Number of nodes after which the recency prior halves
+            recency_window: Latest passages always considered, even without term matches
+            passage_chars: Target passage size when splitting node content
+            graph_weight: Weight of relationship scores (personalized PageRank from
+                the outline's characters) added to each passage's score
+            graph_candidates: Top relationship-scored nodes whose passages are always considered
+            graph_max_hops: Neighbourhood radius for the PageRank walk (None = whole graph)
+            k1, b: BM25 parameters
+        """
+        self.token_budget = token_budget
+        self.type_weights = dict(DEFAULT_TYPE_WEIGHTS if type_weights is None else type_weights)
+        self.recency_weight = recency_weight
+        self.recency_half_life = recency_half_life
+        self.recency_window = recency_window
+        self.passage_chars = passage_chars
+        self.graph_weight = graph_weight
+        self.graph_candidates = graph_candidates
+        self.graph_max_hops = graph_max_hops
+        self.k1 = k1
+        self.b = b
+
+        self.reset()
+
+    def reset(self):
+        """Drop every indexed passage."""
+        # Passage i belongs to self._passage_nodes[i]; postings map term ->
+        # (passage ids, term frequencies), ids ascending
+        self._passages = []
+        self._passage_nodes = []
+        self._passage_lengths = _Column(np.float64)
+        self._passage_node_ids = _Column(np.int64)
+        # Index into self._types of each passage's node type
+        self._passage_types = _Column(np.int32)
+        self._types = {}
+        self._node_passages = {}
+        self._postings = {}
+        self._total_length = 0
+
+    def configure(self, **options):
+        for key, value in options.items():
+            if not hasattr(self, key) or key.startswith("_"):
+                raise ValueError(f"Unknown context ranking option: {key}")
+            setattr(self, key, value)
+
+    def add_node(self, node):
+        """Index a node's name and content; called once per node, in node order."""
+        header = f"{node.node_type} {node.name}"
+        content = str(node.content) if node.content else ""
+        first_passage = len(self._passages)
+        type_id = self._types.setdefault(node.node_type, len(self._types))
+        for passage in split_passages(content, self.passage_chars) or [""]:
+            passage_id = len(self._passages)
+            terms = tokenize(f"{header} {passage}")
+            self._passages.append(passage)
+            self._passage_nodes.append(node)
+            self._passage_lengths.append(len(terms))
+            self._passage_node_ids.append(node.node_id)
+            self._passage_types.append(type_id)
+            self._total_length += len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (_Column(np.int64), _Column(np.float64))
+                postings[0].append(passage_id)
+                postings[1].append(count)
+        self._node_passages[node.node_id] = range(first_passage, len(self._passages))
+
+    def _lexical_scores(self, query_terms):
+        """BM25 score of every passage (0 where no query term occurs)."""
+        n = len(self._passages)
+        avg_length = self._total_length / n if n else 0.0
+        norm = self.k1 * (1 - self.b + self.b * self._passage_lengths.view() / (avg_length or 1))
+        scores = np.zeros(n)
+        for term in set(query_terms):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            passage_ids, tfs = postings[0].view(), postings[1].view()
+            idf = math.log(1 + (n - len(passage_ids) + 0.5) / (len(passage_ids) + 0.5))
+            scores += np.bincount(passage_ids, weights=idf * tfs * (self.k1 + 1) / (tfs + norm[passage_ids]),
+                                  minlength=n)
+        return scores
+
+    def rank(self, query, limit=64, node_scores=None):
+        """
+        Return up to `limit` (score, passage_id) pairs, best first.
+        node_scores optionally maps node id -> relationship score in [0, 1].
+        """
+        if not self._passages:
+            return []
+        n = len(self._passages)
+        lexical = self._lexical_scores(tokenize(query))
+        candidates = lexical > 0
+        candidates[max(0, n - self.recency_window):] = True
+        if node_scores is not None:
+            k = min(self.graph_candidates, len(node_scores))
+            for node_id in np.argpartition(-node_scores, k - 1)[:k]:
+                if node_scores[node_id] > 0:
+                    passages = self._node_passages.get(int(node_id))
+                    if passages:
+                        candidates[passages.start:passages.stop] = True
+
+        passage_ids = np.flatnonzero(candidates)
+        node_ids = self._passage_node_ids.view()[passage_ids]
+        top_lexical = lexical.max() or 1.0
+        if self.recency_half_life:
+            ages = self._passage_nodes[-1].node_id - node_ids
+            recency = 0.5 ** (ages / self.recency_half_life)
+        else:
+            recency = 1.0
+        scores = ((1 - self.recency_weight) * lexical[passage_ids] / top_lexical
+                  + self.recency_weight * recency)
+        if node_scores is not None:
+            scores += self.graph_weight * np.asarray(node_scores)[node_ids]
+        type_weights = np.array([self.type_weights.get(node_type, 1.0) for node_type in self._types])
+        scores *= type_weights[self._passage_types.view()[passage_ids]]
+
+        # Best first; ties go to the later passage
+        order = np.lexsort((-passage_ids, -scores))[:limit]
+        return [(float(scores[i]), int(passage_ids[i])) for i in order]
+
+    def build_context(self, query, token_budget=None, node_scores=None):
+        """Pack the best-scoring passages into the token budget, in story order."""
+        budget = self.token_budget if token_budget is None else token_budget
+        selected = []
+        used = 0
+        for _score, passage_id in self.rank(query, node_scores=node_scores):
+            cost = estimate_tokens(self._passages[passage_id]) + 8  # allow for the node header
+            if used + cost > budget:
+                continue
+            selected.append(passage_id)
+            used += cost
+
+        parts = []
+        current_node = None
+        for passage_id in sorted(selected):
+            node = self._passage_nodes[passage_id]
+            if node is not current_node:
+                parts.append(f"- {node.node_type.title()}: {node.name}")
+                current_node = node
+            if self._passages[passage_id]:
+                parts.append(self._passages[passage_id])
+        return "\n\n".join(parts)
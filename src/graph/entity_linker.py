@@ -0,0 +1,147 @@
+"""
+Single-pass entity linking for generated chapters.
+
+Every character, location and object name (plus aliases) from the seed data is
+compiled into one Aho-Corasick automaton. A chapter is scanned once, character
+by character, and each whole-word match is counted against its entity, so the
+cost is linear in the chapter length regardless of how large the cast grows.
+Mentions become weighted scene -> entity edges in the StoryGraph.
+"""
+
+from collections import deque
+
+# Seed sections scanned for entities: (seed key, list key, node type, relation)
+ENTITY_SOURCES = [
+    ("characters", "characters", "character", "features"),
+    ("world", "locations", "location", "set_at"),
+    ("world", "objects", "object", "mentions"),
+    ("world", "artifacts", "object", "mentions"),
+]
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over lowercase text with whole-word matching."""
+
+    def __init__(self, patterns):
+        """patterns: iterable of (pattern, value); matching is case-insensitive."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern, value in patterns:
+            self._add(pattern.lower(), value)
+        self._build_failure_links()
+
+    def _add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), value))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                # Inherit matches that end at the fallback state
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """Yield (start, end, value) for every whole-word match in the text."""
+        lowered = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(lowered):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            end = index + 1
+            after_ok = end == len(lowered) or not lowered[end].isalnum()
+            if not after_ok:
+                continue
+            for length, value in output[state]:
+                start = end - length
+                if start == 0 or not lowered[start - 1].isalnum():
+                    yield start, end, value
+
+
+def _aliases(name, entry):
+    """The entity's name, its configured aliases, and the name without a leading article."""
+    names = [name] + [str(alias) for alias in entry.get("aliases", []) or []]
+    for candidate in list(names):
+        for article in ("the ", "a ", "an "):
+            if candidate.lower().startswith(article) and len(candidate) > len(article) + 2:
+                names.append(candidate[len(article):])
+    return names
+
+
+class EntityLinker:
+    def __init__(self, seed_data):
+        """Compile every seeded entity name and alias into a single automaton."""
+        # entity key -> (node type, name, description, relation)
+        self.entities = {}
+        patterns = []
+        for seed_key, list_key, node_type, relation in ENTITY_SOURCES:
+            section = (seed_data or {}).get(seed_key) or {}
+            for entry in section.get(list_key, []) or []:
+                if not isinstance(entry, dict) or not entry.get("name"):
+                    continue
+                name = entry["name"]
+                key = (node_type, name)
+                self.entities[key] = (node_type, name, entry.get("description", ""), relation)
+                for alias in _aliases(name, entry):
+                    patterns.append((alias, key))
+        self.automaton = AhoCorasick(patterns)
+
+    def count_mentions(self, text):
+        """Return {entity key: mention count} from one pass over the text."""
+        counts = {}
+        last_end = {}
+        for start, end, key in self.automaton.find_all(text):
+            # "The Cliff House" also contains the alias "Cliff House"; count it once
+            if last_end.get(key, -1) >= start:
+                continue
+            last_end[key] = end
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def entity_node(self, graph, key):
+        """Find or create the graph node for an entity."""
+        node_type, name, description, _relation = self.entities[key]
+        existing = graph.find_nodes(node_type=node_type, name=name)
+        if existing:
+            return existing[0]
+        return graph.add_node(node_type, name, description)
+
+    def find_mentioned_nodes(self, graph, text):
+        """Existing graph nodes for every entity mentioned in the text."""
+        nodes = []
+        for node_type, name in self.count_mentions(text):
+            nodes.extend(graph.find_nodes(node_type=node_type, name=name)[:1])
+        return nodes
+
+    def link(self, graph, scene_node, text=None):
+        """
+        Add scene -> entity edges weighted by mention count.
+        Returns {entity name: mention count}.
+        """
+        counts = self.count_mentions(str(scene_node.content or "") if text is None else text)
+        for key, count in counts.items():
+            relation = self.entities[key][3]
+            graph.add_edge(scene_node, self.entity_node(graph, key), relation, weight=count)
+        return {key[1]: count for key, count in counts.items()}
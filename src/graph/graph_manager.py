@@ -1,4 +1,8 @@
+from src.graph.cluster import ClusterIndex
+from src.graph.context_ranker import ContextRanker
+from src.graph.graph_store import GRAPH_STORE_DIR, GraphStore
 from src.graph.node import Node
+from src.graph.traversal import GraphTraversal
 
 
 def initialise_graph():
@@ -6,42 +10,282 @@ def initialise_graph():
     print("Graph initialized (empty, no seed data added).")
     return graph
 
+
+def load_graph(directory=GRAPH_STORE_DIR, **store_options):
+    """
+    Load the persistent StoryGraph from disk, creating an empty store if needed.
+    Every add_node/add_edge on the returned graph is appended to the store's journal.
+    A journal over the compaction threshold is compacted only when no other
+    process (e.g. a generate_full_novel worker) has the store open.
+    """
+    store = GraphStore(directory, **store_options)
+    graph = StoryGraph(store=store)
+    store.load_into(graph)
+    if store.journal_size() > store.compact_threshold and not store.try_compact(graph):
+        print(f"Graph store {directory} is in use by another process; compaction deferred.")
+    print(f"Graph loaded from {directory} ({len(graph.nodes)} nodes).")
+    return graph
+
 class StoryGraph:
-    def __init__(self):
+    def __init__(self, store=None, context_mode="ranked", **ranking_options):
         self.nodes = []
+        self.store = store
+        # "ranked" packs the passages most relevant to the outline into a token
+        # budget; "clustered" packs cached cluster summaries; "summary" lists a
+        # preview of every node
+        self.context_mode = context_mode
+        self.cluster_index = None
+        self.ranker = ContextRanker(**ranking_options)
+        self._ranked_upto = 0
+        # Summary mode memoizes each node's rendered line and the joined text of
+        # the first _summary_upto lines; both are only invalidated by update_node
+        self._summary_lines = []
+        self._summary_text = ""
+        self._summary_upto = 0
+        self.last_context_stats = {"hits": 0, "misses": 0}
+        self.context_debug_hook = None
+        self.edge_count = 0
+        # Non-default edge weights (e.g. mention counts), keyed by (source id, target id, relation)
+        self.edge_weights = {}
+        self.entity_linker = None
+        # Bumped by update_node so cached renderings can tell a node has changed
+        self.node_versions = []
+        self.node_version_total = 0
+        # Frozen CSR adjacency, rebuilt when nodes or edges have been added since
+        self._traversal = None
+        self._traversal_key = None
+        # Secondary indexes kept in sync by add_node so lookups never scan self.nodes
+        self._by_type = {}
+        self._by_name = {}
+        self._by_type_name = {}
 
     def add_node(self, node_type, name, content):
-        node = Node(node_type, name, content)
+        node = self._add_loaded_node(node_type, name, content)
+        # Render now while the content is in hand; loaded nodes render on first use
+        self._summary_lines[node.node_id] = self._render_summary(node)
+        if self.store is not None:
+            self.store.append_node(node)
+        return node
+
+    def _add_loaded_node(self, node_type, name, content):
+        # Integer ids double as positions in self.nodes
+        node = Node(node_type, name, content, node_id=len(self.nodes))
         self.nodes.append(node)
+        self.node_versions.append(0)
+        self._summary_lines.append(None)
+        self._index_node(node)
         return node
 
-    def find_nodes(self, node_type=None, name=None):
+    def update_node(self, node, content):
+        """Replace a node's content and invalidate everything rendered from it."""
+        self._update_loaded_node(node, content)
+        if self.store is not None:
+            self.store.append_update(node)
+
+    def _update_loaded_node(self, node, content):
+        # Shared with journal replay, so updates made by other processes invalidate the same caches
+        node.content = content
+        self.node_versions[node.node_id] += 1
+        self.node_version_total += 1
+        self._summary_lines[node.node_id] = None
+        if node.node_id < self._summary_upto:
+            self._summary_text = ""
+            self._summary_upto = 0
+        if node.node_id < self._ranked_upto:
+            # The passage index is append-only, so rebuild it on the next retrieval
+            self.ranker.reset()
+            self._ranked_upto = 0
+
+    def add_edge(self, source, target, relation, weight=1.0):
+        """Connect two nodes of this graph, journaling the edge when persisted."""
+        self._add_loaded_edge(source, target, relation, weight)
+        if self.store is not None:
+            self.store.append_edge(source, target, relation, weight)
+
+    def _add_loaded_edge(self, source, target, relation, weight=1.0):
+        source.add_edge(target, relation)
+        if weight != 1.0:
+            self.edge_weights[(source.node_id, target.node_id, relation)] = weight
+        self.edge_count += 1
+
+    def edge_weight(self, source, target, relation):
+        return self.edge_weights.get((source.node_id, target.node_id, relation), 1.0)
+
+    def traversal(self):
+        """Return the CSR traversal engine over the current edges (see GraphTraversal)."""
+        key = (len(self.nodes), self.edge_count)
+        if self._traversal is None or self._traversal_key != key:
+            self._traversal = GraphTraversal.from_graph(self)
+            self._traversal_key = key
+        return self._traversal
+
+    def find_mentioned_nodes(self, text, node_type="character"):
+        """Nodes of the given type whose name appears in the text (case-insensitive)."""
+        if self.entity_linker is not None:
+            # One automaton pass instead of a substring test per name
+            return [node for node in self.entity_linker.find_mentioned_nodes(self, text)
+                    if node.node_type == node_type]
+        lowered = text.lower()
         return [
-            n
-            for n in self.nodes
-            if (node_type is None or n.node_type == node_type)
-            and (name is None or n.name == name)
+            nodes[0]
+            for (ntype, name), nodes in self._by_type_name.items()
+            if ntype == node_type and name and name.lower() in lowered
         ]
 
-    def get_relevant_context(self, chapter_outline):
+    def sync(self):
+        """
+        Pick up nodes and edges other processes appended to the store.
+        Returns the number of operations applied, or of nodes loaded when
+        another process compacted the store and the graph had to be reloaded.
+        """
+        if self.store is None:
+            return 0
+        applied = self.store.replay_journal(self)
+        if applied is None:
+            self._reload()
+            return len(self.nodes)
+        return applied
+
+    def save(self):
+        """Fold the journal into a fresh snapshot."""
+        if self.store is not None:
+            self.sync()
+            self.store.compact(self)
+
+    def _reload(self):
+        """Drop everything loaded from the store and load it again from its latest snapshot."""
+        self.nodes = []
+        self.node_versions = []
+        # Keeps increasing, so caches keyed on it (e.g. cluster partitions) never match stale entries
+        self.node_version_total += 1
+        self._summary_lines = []
+        self._summary_text = ""
+        self._summary_upto = 0
+        self.ranker.reset()
+        self._ranked_upto = 0
+        self.edge_count = 0
+        self.edge_weights = {}
+        self._traversal = None
+        self._traversal_key = None
+        self._by_type = {}
+        self._by_name = {}
+        self._by_type_name = {}
+        if self.cluster_index is not None:
+            self.cluster_index.reset()
+        self.store.load_into(self)
+
+    def _index_node(self, node):
+        self._by_type.setdefault(node.node_type, []).append(node)
+        self._by_name.setdefault(node.name, []).append(node)
+        self._by_type_name.setdefault((node.node_type, node.name), []).append(node)
+
+    def find_nodes(self, node_type=None, name=None):
+        """
+        Return nodes matching the given type and/or name, in insertion order.
+        Uses the hash indexes, so the cost is O(1) plus the size of the result.
+        """
+        if node_type is None and name is None:
+            return list(self.nodes)
+        if node_type is None:
+            matches = self._by_name.get(name)
+        elif name is None:
+            matches = self._by_type.get(node_type)
+        else:
+            matches = self._by_type_name.get((node_type, name))
+        return list(matches) if matches else []
+
+    def configure_context(self, mode=None, cluster_by=None, cluster_summaries=None, parts=None,
+                          **ranking_options):
+        """
+        Set the retrieval mode and ranking options (see ContextRanker).
+        cluster_by, cluster_summaries and parts configure the "clustered" mode
+        (see ClusterIndex).
+        """
+        if mode is not None:
+            if mode not in ("ranked", "clustered", "summary"):
+                raise ValueError(f"Unknown context mode: {mode}")
+            self.context_mode = mode
+        if cluster_by is not None or parts is not None or cluster_summaries is not None:
+            self.configure_clusters(by=cluster_by or ("part" if parts else "community"), parts=parts,
+                                    summary_count=cluster_summaries or 3)
+        self.ranker.configure(**ranking_options)
+
+    def configure_clusters(self, by="community", **options):
+        """Create the cluster index used by the "clustered" context mode."""
+        self.cluster_index = ClusterIndex(self, by=by, **options)
+        return self.cluster_index
+
+    def get_relevant_context(self, chapter_outline, token_budget=None):
         """
         Retrieve relevant context for chapter generation.
-        For now, this returns a summary of all existing nodes.
-        You can enhance this with more sophisticated retrieval logic.
+        In "ranked" mode, passages are scored against the chapter outline with
+        recency and node-type weights, then packed into the token budget.
         """
         if not self.nodes:
             return "No previous story content available."
-        
-        context_parts = []
-        for node in self.nodes:
-            # Create a brief summary of each node
-            summary = f"- {node.node_type.title()}: {node.name}"
-            if hasattr(node, 'content') and node.content:
-                # Truncate content for brevity
-                content_preview = str(node.content)[:200]
-                if len(str(node.content)) > 200:
-                    content_preview += "..."
-                summary += f" - {content_preview}"
-            context_parts.append(summary)
-        
-        return "\n".join(context_parts)
+
+        if self.context_mode == "summary":
+            return self._summary_context()
+
+        if self.context_mode == "clustered":
+            if self.cluster_index is None:
+                self.configure_clusters()
+            budget = self.ranker.token_budget if token_budget is None else token_budget
+            return self.cluster_index.build_context(chapter_outline, budget)
+
+        # Index lazily so loading a persisted graph does not read every node's text
+        for node in self.nodes[self._ranked_upto:]:
+            self.ranker.add_node(node)
+        self._ranked_upto = len(self.nodes)
+        return self.ranker.build_context(chapter_outline, token_budget,
+                                         node_scores=self._relationship_scores(chapter_outline))
+
+    def _relationship_scores(self, chapter_outline):
+        """
+        Personalized PageRank seeded from the characters named in the outline,
+        scaled so the best-connected node scores 1. None when the graph has no edges.
+        """
+        if not self.edge_count or not self.ranker.graph_weight:
+            return None
+        seeds = [node.node_id for node in self.find_mentioned_nodes(chapter_outline)]
+        if not seeds:
+            return None
+        scores = self.traversal().personalized_pagerank(seeds, max_hops=self.ranker.graph_max_hops)
+        top = scores.max()
+        return scores / top if top > 0 else None
+
+    def _render_summary(self, node):
+        # Create a brief summary of each node
+        summary = f"- {node.node_type.title()}: {node.name}"
+        if node.content:
+            # Truncate content for brevity
+            content = str(node.content)
+            content_preview = content[:200]
+            if len(content) > 200:
+                content_preview += "..."
+            summary += f" - {content_preview}"
+        return summary
+
+    def _summary_context(self):
+        # Lines already folded into the joined text are hits without being touched
+        hits = self._summary_upto
+        misses = 0
+        new_parts = []
+        for node in self.nodes[self._summary_upto:]:
+            line = self._summary_lines[node.node_id]
+            if line is None:
+                line = self._summary_lines[node.node_id] = self._render_summary(node)
+                misses += 1
+            else:
+                hits += 1
+            new_parts.append(line)
+
+        if new_parts:
+            joined = "\n".join(new_parts)
+            self._summary_text = f"{self._summary_text}\n{joined}" if self._summary_text else joined
+            self._summary_upto = len(self.nodes)
+
+        self.last_context_stats = {"hits": hits, "misses": misses}
+        if self.context_debug_hook is not None:
+            self.context_debug_hook(self.last_context_stats)
+        return self._summary_text
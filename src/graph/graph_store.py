@@ -0,0 +1,389 @@
+"""
+On-disk persistence for StoryGraph.
+
+The store is a directory holding two files:
+
+- ``snapshot.bin``: a binary snapshot with a packed node table, a packed edge
+  table and a blob of UTF-8 names and contents. It is memory-mapped on load and
+  node contents stay in the mapping until they are first read, so startup cost
+  does not grow with the amount of text in the novel.
+- ``journal.jsonl``: an append-only log of ``add_node``/``add_edge``/``update_node`` operations
+  made since the snapshot was written. It is replayed on top of the snapshot.
+
+``compact()`` folds the journal into a fresh snapshot. ``load_graph`` does this
+automatically once the journal grows past ``compact_threshold`` bytes, so the
+part of startup that has to parse text stays bounded, but only when no other
+process has the store open.
+
+Several processes may share a store. Appends, replays and compaction hold
+``store.lock`` (exclusive for writes, shared for reads), and every open store
+holds a shared lock on ``users.lock`` so a process can tell whether it is the
+only user. Each snapshot records a compaction generation; a process whose
+generation is behind the snapshot's reloads instead of replaying a journal
+it no longer has offsets into.
+
+Compaction sets the journal aside as ``journal.jsonl.<new generation>``
+before replacing the snapshot and deletes it afterwards. If it is
+interrupted in between, the next process to lock the store deletes the
+aside journal when the snapshot already has that generation (its entries
+are in the snapshot) and restores it otherwise.
+"""
+
+import json
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+
+from src.graph.node import LazyContent
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so a store has a single user
+    fcntl = None
+
+GRAPH_STORE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "graph_store"))
+
+SNAPSHOT_FILE = "snapshot.bin"
+JOURNAL_FILE = "journal.jsonl"
+LOCK_FILE = "store.lock"
+USERS_FILE = "users.lock"
+
+SNAPSHOT_MAGIC = b"NGRSNAP2"
+# magic, node count, edge count, vocabulary length
+HEADER = struct.Struct("<8sIII")
+# type id, name offset, name length, content offset, content length
+NODE_RECORD = struct.Struct("<IQIQQ")
+# source id, target id, relation id, weight
+EDGE_RECORD = struct.Struct("<IIIf")
+NO_CONTENT = 2**64 - 1
+
+
+class GraphStore:
+    def __init__(self, directory=GRAPH_STORE_DIR, compact_threshold=4 * 2**20, sync_writes=False):
+        """
+        Args:
+            directory: Folder holding the snapshot and journal
+            compact_threshold: Journal size in bytes above which load_graph compacts
+            sync_writes: fsync the journal after every append (slower, crash-safe)
+        """
+        self.directory = directory
+        self.compact_threshold = compact_threshold
+        self.sync_writes = sync_writes
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.users_path = os.path.join(directory, USERS_FILE)
+        # Compaction generation of the snapshot the graph was loaded from
+        self.generation = 0
+        self._snapshot_map = None
+        self._journal = None
+        self._journal_offset = 0
+        # Start offsets of entries this process appended after another
+        # process's, which replay must skip since they are already applied
+        self._written = set()
+        self._lock_handle = None
+        self._users_handle = None
+
+    # ------------------------------------------------------------------
+    # Locking
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """Hold store.lock: exclusively to write the journal or snapshot, shared to read them."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_handle is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_handle = open(self.lock_path, "ab")
+        fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_UN)
+
+    def _register(self):
+        """Hold a shared lock on users.lock for as long as the store is open."""
+        if fcntl is None or self._users_handle is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._users_handle = open(self.users_path, "ab")
+        fcntl.flock(self._users_handle.fileno(), fcntl.LOCK_SH)
+
+    def _snapshot_generation(self):
+        """Compaction generation of the snapshot on disk (0 before the first compaction)."""
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return 0
+                vocab_len = HEADER.unpack(header)[3]
+                return json.loads(f.read(vocab_len).decode("utf-8")).get("generation", 0)
+        except FileNotFoundError:
+            return 0
+
+    def _aside_path(self, generation):
+        return f"{self.journal_path}.{generation}"
+
+    def _recover(self):
+        """Finish or undo an interrupted compaction (see the module docstring); call with a lock held."""
+        generation = self._snapshot_generation()
+        try:
+            if os.path.exists(self._aside_path(generation)):
+                os.remove(self._aside_path(generation))
+            elif os.path.exists(self._aside_path(generation + 1)):
+                os.replace(self._aside_path(generation + 1), self.journal_path)
+        except FileNotFoundError:
+            # Another process holding a shared lock recovered it first
+            pass
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def load_into(self, graph):
+        """Populate an empty graph from the snapshot, then replay the journal."""
+        self._register()
+        if self._journal is not None:
+            # A compaction by another process may have replaced the file it appends to
+            self._journal.close()
+            self._journal = None
+        with self._locked(exclusive=False):
+            self._recover()
+            self.generation = self._load_snapshot(graph)
+            self._journal_offset = 0
+            self._written.clear()
+            self._replay(graph)
+
+    def _load_snapshot(self, graph):
+        """Load the snapshot into graph and return its compaction generation."""
+        if not os.path.exists(self.snapshot_path) or os.path.getsize(self.snapshot_path) == 0:
+            return 0
+
+        with open(self.snapshot_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Keep the mapping open for as long as nodes may lazily read from it
+        self._snapshot_map = buffer
+
+        magic, node_count, edge_count, vocab_len = HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a StoryGraph snapshot: {self.snapshot_path}")
+
+        offset = HEADER.size
+        vocab = json.loads(bytes(buffer[offset:offset + vocab_len]).decode("utf-8"))
+        types, relations = vocab["types"], vocab["relations"]
+        offset += vocab_len
+
+        view = memoryview(buffer)
+        node_table_end = offset + node_count * NODE_RECORD.size
+        for type_id, name_off, name_len, content_off, content_len in NODE_RECORD.iter_unpack(
+            view[offset:node_table_end]
+        ):
+            name = bytes(view[name_off:name_off + name_len]).decode("utf-8")
+            if content_len == NO_CONTENT:
+                content = None
+            else:
+                content = LazyContent(buffer, content_off, content_off + content_len)
+            graph._add_loaded_node(types[type_id], name, content)
+
+        offset = node_table_end
+        nodes = graph.nodes
+        edge_table_end = offset + edge_count * EDGE_RECORD.size
+        for source_id, target_id, relation_id, weight in EDGE_RECORD.iter_unpack(view[offset:edge_table_end]):
+            graph._add_loaded_edge(nodes[source_id], nodes[target_id], relations[relation_id], weight)
+        view.release()
+        return vocab.get("generation", 0)
+
+    def replay_journal(self, graph):
+        """
+        Apply journal entries written since the last replay.
+        Returns the number of operations applied, or None when another process
+        has compacted the store since the graph was loaded; the graph must then
+        be reloaded (see StoryGraph.sync). Safe to call repeatedly to pick up
+        nodes appended by another process.
+        """
+        with self._locked(exclusive=False):
+            self._recover()
+            if self._snapshot_generation() != self.generation:
+                return None
+            return self._replay(graph)
+
+    def _replay(self, graph):
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        applied = 0
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            while True:
+                start = f.tell()
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    # End of the journal, or a torn write from an interrupted
+                    # process; ignore the partial entry
+                    break
+                # Offsets always come from the file, never from the length of our own writes
+                self._journal_offset = f.tell()
+                if start in self._written:
+                    self._written.discard(start)
+                    continue
+                entry = json.loads(line)
+                if entry["op"] == "add_node":
+                    graph._add_loaded_node(entry["type"], entry["name"], entry["content"])
+                elif entry["op"] == "update_node":
+                    graph._update_loaded_node(graph.nodes[entry["node"]], entry["content"])
+                elif entry["op"] == "add_edge":
+                    graph._add_loaded_edge(graph.nodes[entry["source"]], graph.nodes[entry["target"]],
+                                           entry["relation"], entry.get("weight", 1.0))
+                applied += 1
+        return applied
+
+    def journal_size(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        return os.path.getsize(self.journal_path)
+
+    # ------------------------------------------------------------------
+    # Journal writes
+    # ------------------------------------------------------------------
+    def append_node(self, node):
+        self._append({"op": "add_node", "type": node.node_type, "name": node.name, "content": node.content})
+
+    def append_update(self, node):
+        self._append({"op": "update_node", "node": node.node_id, "content": node.content})
+
+    def append_edge(self, source, target, relation, weight=1.0):
+        entry = {"op": "add_edge", "source": source.node_id, "target": target.node_id, "relation": relation}
+        if weight != 1.0:
+            entry["weight"] = weight
+        self._append(entry)
+
+    def _append(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked():
+            self._recover()
+            if fcntl is not None and self._snapshot_generation() != self.generation:
+                # Node ids in the entry refer to a graph the journal no longer extends
+                raise RuntimeError(f"Graph store {self.directory} was compacted by another process; "
+                                   "sync() the graph before changing it")
+            if self._journal is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._journal = open(self.journal_path, "ab")
+            # Nobody else writes while the lock is held, so the entry starts at the end of the file
+            start = self._journal.seek(0, os.SEEK_END)
+            self._journal.write(line)
+            self._journal.flush()
+            if self.sync_writes:
+                os.fsync(self._journal.fileno())
+            if start == self._journal_offset:
+                self._journal_offset = self._journal.tell()
+            else:
+                # Other processes appended since our last replay; theirs are
+                # applied by the next replay, which skips this entry
+                self._written.add(start)
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def compact(self, graph):
+        """
+        Write the whole graph to a new snapshot and start an empty journal.
+        Entries other processes appended are replayed first, so none are
+        lost; those processes reload on their next sync().
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked():
+            self._recover()
+            if self._snapshot_generation() != self.generation:
+                raise RuntimeError(f"Graph store {self.directory} was compacted by another process; "
+                                   "sync() the graph before compacting it")
+            self._replay(graph)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            aside = self._aside_path(self.generation + 1)
+            if os.path.exists(self.journal_path):
+                os.replace(self.journal_path, aside)
+            self._write_snapshot(graph, self.generation + 1)
+            if os.path.exists(aside):
+                os.remove(aside)
+            self.generation += 1
+            self._journal_offset = 0
+            self._written.clear()
+
+    def try_compact(self, graph):
+        """compact() only if no other process has the store open; returns whether it did."""
+        if fcntl is None or self._users_handle is None:
+            self.compact(graph)
+            return True
+        handle = self._users_handle.fileno()
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        else:
+            self.compact(graph)
+            return True
+        finally:
+            # Back to a shared lock (a failed conversion may have dropped it)
+            fcntl.flock(handle, fcntl.LOCK_SH)
+
+    def _write_snapshot(self, graph, generation):
+        types, type_ids = [], {}
+        relations, relation_ids = [], {}
+        edges = []
+        for node in graph.nodes:
+            if node.node_type not in type_ids:
+                type_ids[node.node_type] = len(types)
+                types.append(node.node_type)
+            for target, relation in node.edges:
+                if relation not in relation_ids:
+                    relation_ids[relation] = len(relations)
+                    relations.append(relation)
+                edges.append((node.node_id, target.node_id, relation_ids[relation],
+                              graph.edge_weight(node, target, relation)))
+
+        vocab = json.dumps({"types": types, "relations": relations, "generation": generation}).encode("utf-8")
+        blob_start = (HEADER.size + len(vocab) + len(graph.nodes) * NODE_RECORD.size
+                      + len(edges) * EDGE_RECORD.size)
+
+        node_table = bytearray()
+        blob = bytearray()
+        for node in graph.nodes:
+            name = node.name.encode("utf-8")
+            name_off = blob_start + len(blob)
+            blob += name
+            content = node._content
+            if content is None:
+                content_off, content_len = 0, NO_CONTENT
+            else:
+                # Copy still-unread snapshot text as raw bytes instead of decoding it
+                if type(content) is LazyContent:
+                    encoded = bytes(content.buffer[content.start:content.end])
+                else:
+                    encoded = str(content).encode("utf-8")
+                content_off, content_len = blob_start + len(blob), len(encoded)
+                blob += encoded
+            node_table += NODE_RECORD.pack(type_ids[node.node_type], name_off, len(name),
+                                           content_off, content_len)
+
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, len(graph.nodes), len(edges), len(vocab)))
+            f.write(vocab)
+            f.write(node_table)
+            for edge in edges:
+                f.write(EDGE_RECORD.pack(*edge))
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        # Atomic swap; lazily loaded nodes keep reading the old mapping until released
+        os.replace(tmp_path, self.snapshot_path)
+
+    def close(self):
+        for name in ("_journal", "_lock_handle", "_users_handle"):
+            handle = getattr(self, name)
+            if handle is not None:
+                # Closing the file releases any lock held on it
+                handle.close()
+                setattr(self, name, None)
@@ -1,9 +1,52 @@
+import sys
+
+
+class LazyContent:
+    """
+    Reference to UTF-8 text inside a memory-mapped graph snapshot.
+    The bytes are only decoded the first time the owning node's content is read.
+    """
+
+    __slots__ = ("buffer", "start", "end")
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    def load(self):
+        return bytes(self.buffer[self.start:self.end]).decode("utf-8")
+
+
 class Node:
-    def __init__(self, node_type, name, content):
-        self.node_type = node_type
+    # Slots instead of a per-instance __dict__: graphs hold tens of thousands of
+    # nodes and the dict overhead outweighs the metadata each node carries.
+    __slots__ = ("node_id", "node_type", "name", "_content", "edges")
+
+    def __init__(self, node_type, name, content, node_id=None):
+        self.node_id = node_id
+        # Node types and relation labels come from a tiny vocabulary, so interning
+        # them lets every node share a single string object per label.
+        self.node_type = sys.intern(node_type) if isinstance(node_type, str) else node_type
         self.name = name
-        self.content = content
+        self._content = content
         self.edges = []
 
+    @property
+    def content(self):
+        content = self._content
+        if type(content) is LazyContent:
+            content = self._content = content.load()
+        return content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
     def add_edge(self, node, relation):
+        if isinstance(relation, str):
+            relation = sys.intern(relation)
         self.edges.append((node, relation))
+
+    def __repr__(self):
+        return f"Node({self.node_id!r}, {self.node_type!r}, {self.name!r})"
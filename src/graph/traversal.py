@@ -0,0 +1,236 @@
+"""
+Array-backed traversal over StoryGraph relationships.
+
+A GraphTraversal freezes the graph's edges into a compressed sparse row (CSR)
+adjacency: ``indptr[i]:indptr[i + 1]`` is the slice of ``indices`` holding the
+neighbours of node ``i``, with a parallel array of interned relation codes and
+edge weights. Queries work on whole frontiers with NumPy instead of walking
+Node objects, so k-hop, shortest-path and personalized PageRank stay in the
+millisecond range on graphs with millions of edges.
+"""
+
+import numpy as np
+
+
+class GraphTraversal:
+    def __init__(self, node_count, sources, targets, relation_codes, relation_labels,
+                 weights=None, undirected=True):
+        """
+        Build the CSR arrays from parallel edge arrays.
+
+        Args:
+            node_count: Number of nodes; node ids are 0..node_count-1
+            sources, targets: Edge endpoints as node ids
+            relation_codes: Per-edge index into relation_labels
+            relation_labels: Relation label for each code
+            weights: Optional per-edge weights (default 1.0)
+            undirected: Also traverse every edge from target to source
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        codes = np.asarray(relation_codes, dtype=np.int32)
+        if weights is None:
+            weights = np.ones(len(sources), dtype=np.float32)
+        weights = np.asarray(weights, dtype=np.float32)
+        if undirected:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            codes = np.concatenate([codes, codes])
+            weights = np.concatenate([weights, weights])
+
+        order = np.argsort(sources, kind="stable")
+        self.node_count = node_count
+        self.undirected = undirected
+        self.relation_labels = list(relation_labels)
+        self.relation_ids = {label: code for code, label in enumerate(self.relation_labels)}
+        self.indices = targets[order].astype(np.int32)
+        self.relations = codes[order]
+        self.weights = weights[order]
+        self.indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=node_count), out=self.indptr[1:])
+        # Source of every CSR slot, used to scatter along edges in PageRank
+        self.sources = np.repeat(np.arange(node_count, dtype=np.int32), np.diff(self.indptr))
+        self._mask_cache = {}
+        self._pagerank_cache = {}
+
+    @classmethod
+    def from_graph(cls, graph, undirected=True):
+        """Freeze the edges of a StoryGraph."""
+        sources, targets, codes = [], [], []
+        labels, label_ids = [], {}
+        for node in graph.nodes:
+            for target, relation in node.edges:
+                code = label_ids.get(relation)
+                if code is None:
+                    code = label_ids[relation] = len(labels)
+                    labels.append(relation)
+                sources.append(node.node_id)
+                targets.append(target.node_id)
+                codes.append(code)
+        weights = None
+        if graph.edge_weights:
+            weights = [graph.edge_weights.get((s, t, labels[c]), 1.0) for s, t, c in zip(sources, targets, codes)]
+        return cls(len(graph.nodes), sources, targets, codes, labels, weights=weights, undirected=undirected)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def edge_mask(self, relations):
+        """Boolean mask over CSR slots whose relation is in `relations` (None = all)."""
+        if relations is None:
+            return None
+        key = frozenset(relations)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            codes = [self.relation_ids[r] for r in key if r in self.relation_ids]
+            mask = self._mask_cache[key] = np.isin(self.relations, codes)
+        return mask
+
+    def _expand(self, frontier, mask):
+        """Return (source, slot) arrays for every edge leaving the frontier."""
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        # Ragged gather: slot ids of every frontier node's adjacency slice, concatenated
+        slots = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        sources = np.repeat(frontier, counts)
+        if mask is not None:
+            keep = mask[slots]
+            slots, sources = slots[keep], sources[keep]
+        return sources, slots
+
+    def k_hop(self, seeds, k, relations=None):
+        """
+        Nodes within k hops of the seeds.
+        Returns (node_ids, distances) sorted by distance; seeds have distance 0.
+        """
+        mask = self.edge_mask(relations)
+        distance = np.full(self.node_count, -1, dtype=np.int32)
+        frontier = np.unique(np.asarray(seeds, dtype=np.int32))
+        distance[frontier] = 0
+        for hop in range(1, k + 1):
+            if frontier.size == 0:
+                break
+            _sources, slots = self._expand(frontier, mask)
+            neighbours = np.unique(self.indices[slots])
+            frontier = neighbours[distance[neighbours] < 0]
+            distance[frontier] = hop
+        reached = np.flatnonzero(distance >= 0)
+        order = np.argsort(distance[reached], kind="stable")
+        return reached[order], distance[reached[order]]
+
+    def shortest_path(self, source, target, relations=None, max_hops=None):
+        """
+        Unweighted shortest path as a list of node ids, or None if unreachable.
+        On undirected adjacency the search grows from both ends, always expanding
+        the smaller frontier, which keeps the visited set small on large graphs.
+        """
+        if source == target:
+            return [source]
+        mask = self.edge_mask(relations)
+        # parents[0] grows from the source, parents[1] from the target
+        parents = [np.full(self.node_count, -1, dtype=np.int32) for _ in range(2)]
+        parents[0][source] = source
+        parents[1][target] = target
+        frontiers = [np.array([source], dtype=np.int32), np.array([target], dtype=np.int32)]
+        hops = 0
+        while frontiers[0].size and frontiers[1].size and (max_hops is None or hops < max_hops):
+            hops += 1
+            side = 1 if self.undirected and frontiers[1].size < frontiers[0].size else 0
+            parent, other = parents[side], parents[1 - side]
+            sources, slots = self._expand(frontiers[side], mask)
+            neighbours = self.indices[slots]
+            fresh = parent[neighbours] < 0
+            neighbours, sources = neighbours[fresh], sources[fresh]
+            # Keep the first edge that reaches each new node
+            neighbours, first = np.unique(neighbours, return_index=True)
+            parent[neighbours] = sources[first]
+            frontiers[side] = neighbours
+
+            met = neighbours[other[neighbours] >= 0]
+            if met.size:
+                return self._join_paths(parents, int(met[0]), source, target)
+        return None
+
+    @staticmethod
+    def _join_paths(parents, meeting, source, target):
+        forward = [meeting]
+        while forward[-1] != source:
+            forward.append(int(parents[0][forward[-1]]))
+        backward = []
+        node = meeting
+        while node != target:
+            node = int(parents[1][node])
+            backward.append(node)
+        return forward[::-1] + backward
+
+    def _pagerank_arrays(self, relations):
+        """(sources, targets, share of source score, source out-weight) for a relation filter, cached."""
+        key = None if relations is None else frozenset(relations)
+        arrays = self._pagerank_cache.get(key)
+        if arrays is None:
+            mask = self.edge_mask(relations)
+            sources, targets, weights = self.sources, self.indices, self.weights
+            if mask is not None:
+                sources, targets, weights = sources[mask], targets[mask], weights[mask]
+            out_weight = np.bincount(sources, weights=weights, minlength=self.node_count)
+            share = weights / np.where(out_weight == 0, 1.0, out_weight)[sources]
+            arrays = self._pagerank_cache[key] = (sources, targets, share, out_weight)
+        return arrays
+
+    def personalized_pagerank(self, seeds, alpha=0.85, max_iter=50, tol=1e-6, relations=None,
+                              max_hops=None):
+        """
+        Personalized PageRank restarting at the seeds.
+
+        With max_hops set, the iteration runs only on the subgraph within that many
+        hops of the seeds. Mass that would leave it is dropped, which changes scores
+        very little (a walk survives h hops with probability alpha**h) but keeps the
+        cost proportional to the neighbourhood instead of the whole graph.
+
+        Returns a float array over all nodes, normalised to sum to 1.
+        """
+        n = self.node_count
+        seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+        if n == 0 or seeds.size == 0:
+            return np.zeros(n)
+
+        sources, targets, share, out_weight = self._pagerank_arrays(relations)
+        dangling = out_weight == 0
+        size = n
+        nodes = None
+        if max_hops is not None:
+            nodes, _distances = self.k_hop(seeds, max_hops, relations)
+            local = np.full(n, -1, dtype=np.int64)
+            local[nodes] = np.arange(nodes.size)
+            edge_sources, slots = self._expand(nodes.astype(np.int32), self.edge_mask(relations))
+            edge_targets = local[self.indices[slots]]
+            inside = edge_targets >= 0
+            edge_sources, slots = edge_sources[inside], slots[inside]
+            sources = local[edge_sources]
+            targets = edge_targets[inside]
+            share = self.weights[slots] / out_weight[edge_sources]
+            dangling = dangling[nodes]
+            seeds = local[seeds]
+            size = nodes.size
+
+        restart = np.zeros(size)
+        restart[seeds] = 1.0 / seeds.size
+        scores = restart.copy()
+        for _ in range(max_iter):
+            spread = np.bincount(targets, weights=scores[sources] * share, minlength=size)
+            # Mass stuck on nodes without edges returns to the seeds
+            updated = alpha * (spread + scores[dangling].sum() * restart) + (1 - alpha) * restart
+            converged = np.abs(updated - scores).sum() < tol
+            scores = updated
+            if converged:
+                break
+        scores /= scores.sum()
+
+        if nodes is None:
+            return scores
+        full = np.zeros(n)
+        full[nodes] = scores
+        return full